@@ -0,0 +1,27 @@
+from fastapi import APIRouter, HTTPException
+from backend.config import settings
+from backend.game.map_lifecycle import map_lifecycle
+from backend.metrics import metrics
+from backend.websocket.manager import manager
+
+router = APIRouter(prefix="/api/admin", tags=["admin"])
+
+
+def check_admin(token: str):
+    """校验管理令牌（未配置ADMIN_TOKEN时管理接口关闭）"""
+    if not settings.ADMIN_TOKEN or token != settings.ADMIN_TOKEN:
+        raise HTTPException(403, "无权访问")
+
+
+@router.get("/metrics")
+async def get_metrics(token: str):
+    """获取运行时指标"""
+    check_admin(token)
+    return {**metrics.snapshot(), "connections": manager.stats()}
+
+
+@router.get("/maps")
+async def get_maps(token: str):
+    """获取地图实例的人数和估算内存"""
+    check_admin(token)
+    return map_lifecycle.report()
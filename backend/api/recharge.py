@@ -179,8 +179,7 @@ async def buy_mall_item(
     
     # 添加物品到背包
     from backend.game.engine import GameEngine
-    for item in mall_item["items"]:
-        await GameEngine._add_item(char_id, item["item_id"], "white", db, item["quantity"])
+    await GameEngine._add_items(char_id, mall_item["items"], db)
     
     await db.commit()
     
@@ -8,6 +8,15 @@ class Settings(BaseSettings):
     SECRET_KEY: str
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 7  # 7 days
+    ADMIN_TOKEN: str = ""  # 管理接口令牌，为空时禁用管理接口
+    STATE_FLUSH_INTERVAL: float = 5.0  # 角色状态写回间隔（秒）
+    WS_SEND_QUEUE_SIZE: int = 256  # 每个连接的待发消息上限
+    WS_SLOW_CONSUMER_POLICY: str = "drop_oldest"  # 发送队列满时: drop_oldest 丢弃最旧消息 / disconnect 断开连接
+    MAP_EVENT_FOG_FILTER: bool = True  # 地图事件只推送给迷雾已覆盖事件格子的玩家
+    MAP_POOL_SIZE: int = 2  # 每张非安全区地图预生成的备用实例数，0 表示不预生成
+    MAP_SHARD_CAPACITY: int = 20  # 非安全区共享分片的人数上限（地图可用 shard_capacity 覆盖），0 表示不限
+    MAP_INSTANCE_TTL: float = 300.0  # 私有副本和安全区实例无人后保留的秒数
+    MONSTER_RESPAWN_SECONDS: float = 60.0  # 怪物被击杀后的复活时间（地图可用 respawn_seconds 覆盖），0 表示不复活
     
     class Config:
         env_file = ".env"
@@ -23,11 +32,13 @@ class GameConfig:
                 self.EXP_MULTIPLIER = config.get("exp_multiplier", 1.0)
                 self.DROP_RATE_MULTIPLIER = config.get("drop_rate_multiplier", 1.0)
                 self.GOLD_MULTIPLIER = config.get("gold_multiplier", 1.0)
+                self.FAST_COMBAT_MARGIN = config.get("fast_combat_margin", 2.0)
         except Exception as e:
             print(f"加载游戏配置失败，使用默认值: {e}")
             self.EXP_MULTIPLIER = 1.0
             self.DROP_RATE_MULTIPLIER = 1.0
             self.GOLD_MULTIPLIER = 1.0
+            self.FAST_COMBAT_MARGIN = 2.0
 
 settings = Settings()
 game_config = GameConfig()
\ No newline at end of file
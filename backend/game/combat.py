@@ -1,15 +1,18 @@
 
 import random
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 from dataclasses import dataclass, field
-from fractions import Fraction
-from .effects import EffectCalculator, roll_quality, apply_quality_bonus, roll_item_attributes, EFFECT_CONFIG, EFFECT_NAMES
+from .effects import EffectCalculator, EffectProfile, EMPTY_PROFILE, roll_quality, apply_quality_bonus, EFFECT_CONFIG
+from .drops import DropTables, parse_rate
+from . import combat_log as ev
+from .combat_log import CombatLog, PLAYER, SUMMON
 from backend.config import game_config
+from backend.metrics import metrics
 
 @dataclass
 class CombatResult:
     victory: bool
-    logs: List[str]
+    log: CombatLog
     exp_gained: int
     gold_gained: int
     drops: List[dict]
@@ -17,6 +20,15 @@ class CombatResult:
     skills_used: List[str]
     passive_skills: List[str] = field(default_factory=list)
     summon_died: bool = False
+    rounds: int = 0
+    hp_used: int = 0
+    mp_used: int = 0
+    seed: Optional[int] = None  # 战斗随机种子，用于复现
+
+    @property
+    def logs(self) -> List[str]:
+        """旧版日志文字（按需生成）"""
+        return self.log.render()
 
 @dataclass
 class PoisonState:
@@ -28,15 +40,17 @@ class CombatEngine:
     """战斗引擎 - 支持装备特效系统"""
     
     QUALITY_DROP_BONUS = {"white": 1.0, "green": 1.5, "blue": 2.0, "purple": 3.0, "orange": 5.0}
+    # 每回合尝试使用技能的几率
+    SKILL_CHANCE = {"mage": 0.9, "taoist": 0.9, "warrior": 0.9}
+    # 快速结算的回合上限 = 怪物数 + 余量，超过时改为逐回合模拟
+    FAST_ROUND_SLACK = 4
+    # 碾压判定缓存：(攻击类型, 攻击范围, 防御穿透, 命中/双击, 阈值, 怪物HP, 怪物防御) -> 是否满足
+    fast_gate_cache: Dict[tuple, bool] = {}
+    FAST_GATE_CACHE_SIZE = 4096
     
     @staticmethod
-    def calculate_damage(attacker: dict, defender: dict, is_magic: bool = False, 
-                        attacker_effects: dict = None, defender_effects: dict = None) -> int:
-        """计算伤害（支持特效系统）"""
-        attacker_effects = attacker_effects or {}
-        defender_effects = defender_effects or {}
-        
-        # 获取攻击值
+    def damage_ranges(attacker: dict, defender: dict, is_magic: bool = False) -> Tuple[int, int, int, int]:
+        """攻击和防御的取值范围 (攻击下限, 攻击上限, 防御下限, 防御上限)"""
         if is_magic:
             atk_min = attacker.get("magic_min", attacker.get("magic", attacker.get("attack", 10)))
             atk_max = attacker.get("magic_max", attacker.get("magic", attacker.get("attack", 10)))
@@ -47,22 +61,88 @@ class CombatEngine:
             atk_max = attacker.get("attack_max", attacker.get("attack", 10))
             def_min = defender.get("defense_min", defender.get("defense", 0))
             def_max = defender.get("defense_max", defender.get("defense", 0))
-        
-        attack = random.randint(int(atk_min), max(int(atk_min), int(atk_max)))
-        defense = random.randint(int(def_min), max(int(def_min), int(def_max)))
-        
+        return int(atk_min), max(int(atk_min), int(atk_max)), int(def_min), max(int(def_min), int(def_max))
+    
+    @staticmethod
+    def mitigate(attack: float, defense: float, attacker_effects: dict, is_magic: bool = False) -> int:
+        """防御减免后的基础伤害（未计随机浮动）"""
         # 应用忽略防御
         defense = EffectCalculator.calculate_defense_penetration(attacker_effects, defense, is_magic)
         
         # 减伤公式
         reduction = min(0.8, defense / (defense + 100))
-        base_damage = int(attack * (1 - reduction))
-        base_damage = max(1, base_damage)
+        return max(1, int(attack * (1 - reduction)))
+    
+    @staticmethod
+    def calculate_damage(attacker: dict, defender: dict, is_magic: bool = False, 
+                        attacker_effects: EffectProfile = None, defender_effects: EffectProfile = None,
+                        rng=random) -> int:
+        """计算伤害（支持特效系统，特效可传 EffectProfile 或特效字典）"""
+        attacker_effects = attacker_effects or {}
+        defender_effects = defender_effects or {}
+        
+        atk_min, atk_max, def_min, def_max = CombatEngine.damage_ranges(attacker, defender, is_magic)
+        attack = rng.randint(atk_min, atk_max)
+        defense = rng.randint(def_min, def_max)
+        base_damage = CombatEngine.mitigate(attack, defense, attacker_effects, is_magic)
         
         # 随机浮动 ±10%
-        variance = random.uniform(0.9, 1.1)
+        variance = rng.uniform(0.9, 1.1)
         return max(1, int(base_damage * variance))
     
+    @staticmethod
+    def damage_bounds(attacker: dict, defender: dict, is_magic: bool = False,
+                      attacker_effects: dict = None) -> Tuple[int, int, float]:
+        """calculate_damage 的 (最小值, 最大值, 期望近似值)"""
+        attacker_effects = attacker_effects or {}
+        atk_min, atk_max, def_min, def_max = CombatEngine.damage_ranges(attacker, defender, is_magic)
+        lowest = max(1, int(CombatEngine.mitigate(atk_min, def_max, attacker_effects, is_magic) * 0.9))
+        highest = max(1, int(CombatEngine.mitigate(atk_max, def_min, attacker_effects, is_magic) * 1.1))
+        expected = CombatEngine.mitigate((atk_min + atk_max) / 2, (def_min + def_max) / 2, attacker_effects, is_magic)
+        return lowest, highest, expected
+    
+    @staticmethod
+    def damage_taken(base_damage: int, player_effects: EffectProfile, shield_reduction: float = 0.0,
+                     rng=random) -> Tuple[int, list]:
+        """玩家实际受到的伤害，返回 (伤害, 防御特效标签)
+        
+        格挡和减伤只取其一，不叠加；魔法盾在其后减伤；最低为基础伤害的50%。
+        """
+        defense_effects = []
+        blocked, blocked_damage = EffectCalculator.calculate_block(player_effects, base_damage, rng)
+        if blocked:
+            damage = blocked_damage
+            defense_effects.append(("guard",))
+        elif player_effects.damage_reduction > 0:
+            damage = EffectCalculator.apply_damage_reduction(player_effects, base_damage)
+            defense_effects.append(("reduction", int(player_effects.damage_reduction * 100)))
+        else:
+            damage = base_damage
+        
+        # 应用魔法盾减伤
+        if shield_reduction > 0:
+            damage = damage - int(damage * shield_reduction)
+            defense_effects.append(("shield", int(shield_reduction * 100)))
+        
+        # 确保最低伤害为基础伤害的50%
+        return max(int(base_damage * 0.5), damage), defense_effects
+    
+    @staticmethod
+    def invisible_rounds(effect: dict, skill_level: int, rng=random) -> int:
+        """隐身术持续回合 - 技能等级越高，持续时间越长的概率越大"""
+        duration_min = effect.get("duration_min", 1)
+        duration_max = effect.get("duration_max", 5)
+        weight = effect.get("duration_weight_per_level", 10) * skill_level
+        return rng.choices(
+            range(duration_min, duration_max + 1),
+            weights=[1 + weight * (i - duration_min) for i in range(duration_min, duration_max + 1)]
+        )[0]
+    
+    @staticmethod
+    def magic_shield(effect: dict, skill_level: int) -> Tuple[int, float]:
+        """魔法盾 (持续回合, 减伤比例) - 1级：2回合15%，2级：4回合30%，3级：6回合45%"""
+        return effect["duration_rounds"] * skill_level, effect["damage_reduction"] * skill_level
+    
     @staticmethod
     def calculate_skill_power(player: dict, skill: dict) -> int:
         """根据职业计算技能威力"""
@@ -173,46 +253,15 @@ class CombatEngine:
         }
     
     @staticmethod
-    def pve_combat(player: dict, monsters: list, skills: List[dict] = None, 
-                   drop_groups: List[str] = None, data_loader=None, 
-                   inventory: List[dict] = None, summon: dict = None, 
-                   disabled_skills: List[str] = None, equipment: List[dict] = None) -> CombatResult:
-        """PVE战斗 - 支持装备特效"""
-        if isinstance(monsters, dict):
-            monsters = [monsters]
-        
-        logs = []
-        player_hp = player.get("max_hp", 100)
-        player_mp = player.get("max_mp", 50)
-        player_max_hp = player.get("max_hp", 100)
-        player_max_mp = player.get("max_mp", 50)
-        player_name = player.get("name", "玩家")
-        char_class = player.get("char_class", "warrior")
-        disabled_skills = disabled_skills or []
-        equipment = equipment or []
-        
-        # 获取玩家装备特效
-        player_effects = EffectCalculator.get_equipment_effects(equipment)
-        
-        # 显示玩家装备特效（如果有）
-        active_effects = {k: v for k, v in player_effects.items() if v > 0}
-        if active_effects:
-            effect_strs = []
-            for k, v in active_effects.items():
-                name = EFFECT_NAMES.get(k, k)
-                if k in ["hp_on_hit", "mp_on_hit", "extra_phys", "extra_magic", "poison_damage", "poison_rounds"]:
-                    effect_strs.append(f"{name}+{int(v)}")
-                else:
-                    effect_strs.append(f"{name}:{int(v*100)}%")
-            logs.append(f"⚔️ 装备特效: {', '.join(effect_strs)}")
-        
-        # 初始化怪物状态
+    def init_monsters(monsters: list) -> List[dict]:
+        """初始化怪物战斗状态（按品质加成属性）"""
         monster_states = []
         for m in monsters:
             quality = m.get("quality", "white")
             quality_bonus = {"white": 1.0, "green": 1.2, "blue": 1.5, "purple": 2.0, "orange": 3.0}.get(quality, 1.0)
             damage_type = m.get("damage_type", "physical")
             monster_states.append({
+                "monster_id": m.get("monster_id"),  # 怪物类型ID，用于查找预编译掉落表
                 "name": m.get("name", "怪物"),
                 "level": m.get("level", 1),  # 添加等级用于符文掉落计算
                 "hp": int(m.get("hp", 50) * quality_bonus),
@@ -235,24 +284,13 @@ class CombatEngine:
         
         for idx, m in enumerate(monster_states):
             m['idx'] = idx
-        
-        monster_names = ", ".join([f"{m['name']}[{m['quality']}]" for m in monster_states])
-        logs.append(f"⚔️ 战斗开始: {player_name} vs {monster_names}")
-        monster_hp_list = "|".join([f"#{m['idx']}{m['name']}[{m['quality']}]:{m['hp']}/{m['max_hp']}" for m in monster_states])
-        logs.append(f"COMBAT_INIT|{player_hp}/{player_max_hp}|{player_mp}/{player_max_mp}|{monster_hp_list}")
-        
-        round_num = 0
-        max_rounds = 100
-        skills_used = []
-        passive_skills = []
-        player_poison = None  # 玩家毒伤状态
-        player_stunned = False
-        player_invisible = 0  # 隐身剩余回合数
-        magic_shield_rounds = 0  # 魔法盾剩余回合数
-        magic_shield_reduction = 0.0  # 魔法盾减伤比例
-        
-        # 分离技能
+        return monster_states
+    
+    @staticmethod
+    def split_skills(skills: List[dict], disabled_skills: List[str]) -> Tuple[List[dict], List[str]]:
+        """分离技能，返回 (按等级需求降序的主动技能, 被动技能ID)"""
         active_skills = []
+        passive_skills = []
         for skill in (skills or []):
             skill_id = skill.get("skill_id", skill.get("id", ""))
             if skill_id in disabled_skills:
@@ -262,18 +300,11 @@ class CombatEngine:
                     passive_skills.append(skill_id)
             else:
                 active_skills.append(skill)
-        
-        available_skills = sorted(active_skills, key=lambda s: s.get("level_req", 1), reverse=True)
-        skill_cooldowns = {}
-        
-        # 召唤物状态
-        summon_state = None
-        summon_died = False
-        if summon and summon.get("alive"):
-            summon_state = summon.copy()
-            logs.append(f"🐾 {summon_state['name']} 参战 (HP:{summon_state['hp']})")
-        
-        # 药水
+        return sorted(active_skills, key=lambda s: s.get("level_req", 1), reverse=True), passive_skills
+    
+    @staticmethod
+    def sort_potions(inventory: List[dict]) -> Tuple[List[dict], List[dict]]:
+        """背包中的HP/MP药水，按恢复量从小到大"""
         hp_potions = []
         mp_potions = []
         if inventory:
@@ -286,16 +317,128 @@ class CombatEngine:
                         mp_potions.append(item)
             hp_potions.sort(key=lambda x: x.get("info", {}).get("effect", {}).get("heal_hp", 0))
             mp_potions.sort(key=lambda x: x.get("info", {}).get("effect", {}).get("heal_mp", 0))
+        return hp_potions, mp_potions
+    
+    @staticmethod
+    def victory_rewards(monster_states: List[dict], log: CombatLog, data_loader=None,
+                        rng=random) -> Tuple[int, int, List[dict]]:
+        """胜利奖励，返回 (经验, 金币, 掉落)"""
+        exp_gained = 0
+        gold_gained = 0
+        drops = []
+        batches = {}  # (掉落表, 品质掉率加成, 哥布林倍数) -> 击杀数
+        for m in monster_states:
+            exp_gained += m["exp"]
+            gold_gained += m["gold"]
+            quality_drop_bonus = CombatEngine.QUALITY_DROP_BONUS.get(m["quality"], 1.0)
+            goblin_multiplier = m.get("goblin_drop_multiplier", 1)  # 哥布林掉率倍数
+            
+            # 直接掉落 + 掉落组（含按等级自动附加的符文组）使用预编译掉落表，同种同品质的怪物合并掷骰
+            key = (DropTables.for_monster(m), quality_drop_bonus, goblin_multiplier)
+            batches[key] = batches.get(key, 0) + 1
+        for (table, quality_drop_bonus, goblin_multiplier), count in batches.items():
+            drops.extend(table.roll(quality_drop_bonus, goblin_multiplier, rng, count))
+        
+        # 应用全局倍数
+        exp_gained = int(exp_gained * game_config.EXP_MULTIPLIER)
+        gold_gained = int(gold_gained * game_config.GOLD_MULTIPLIER)
+        log.add(ev.VICTORY, PLAYER, amount=exp_gained, extra=gold_gained)
+        for drop in drops:
+            item_name = drop['item_id']
+            if data_loader:
+                item_info = data_loader.get_item(drop['item_id'])
+                if item_info:
+                    item_name = item_info.get('name', drop['item_id'])
+            log.add(ev.ITEM, PLAYER, extra=item_name)
+        return exp_gained, gold_gained, drops
+    
+    @staticmethod
+    def pve_combat(player: dict, monsters: list, skills: List[dict] = None, 
+                   drop_groups: List[str] = None, data_loader=None, 
+                   inventory: List[dict] = None, summon: dict = None, 
+                   disabled_skills: List[str] = None, equipment: List[dict] = None,
+                   allow_fast_forward: bool = True, seed: Optional[int] = None,
+                   rng: random.Random = None) -> CombatResult:
+        """PVE战斗 - 支持装备特效
+        
+        战斗中的所有随机数来自 rng；未传入时按 seed（未指定则随机生成）新建，
+        种子记录在结果中，相同输入和种子可完整复现一场战斗（含掉落）。
+        """
+        if rng is None:
+            if seed is None:
+                seed = random.getrandbits(32)
+            rng = random.Random(seed)
+        if isinstance(monsters, dict):
+            monsters = [monsters]
+        
+        player_hp = player.get("max_hp", 100)
+        player_mp = player.get("max_mp", 50)
+        player_max_hp = player.get("max_hp", 100)
+        player_max_mp = player.get("max_mp", 50)
+        player_name = player.get("name", "玩家")
+        char_class = player.get("char_class", "warrior")
+        disabled_skills = disabled_skills or []
+        equipment = equipment or []
+        
+        # 玩家装备特效每场战斗只编译一次
+        player_effects = EffectProfile.from_equipment(equipment)
+        
+        monster_states = CombatEngine.init_monsters(monsters)
+        
+        # 战斗过程只记录事件，日志文字在发送时按客户端需要生成
+        log = CombatLog(player_name, player_max_hp, player_max_mp,
+                        [(m["name"], m["quality"], m["max_hp"]) for m in monster_states])
+        
+        # 显示玩家装备特效（如果有）
+        active_effects = tuple((k, v) for k, v in player_effects.items() if v > 0)
+        if active_effects:
+            log.add(ev.EQUIP_EFFECTS, PLAYER, extra=active_effects)
+        
+        log.add(ev.START)
+        log.add(ev.INIT, amount=player_hp, extra=(player_mp, tuple(m["hp"] for m in monster_states)))
+        
+        round_num = 0
+        max_rounds = 100
+        skills_used = []
+        player_poison = None  # 玩家毒伤状态
+        player_stunned = False
+        player_invisible = 0  # 隐身剩余回合数
+        magic_shield_rounds = 0  # 魔法盾剩余回合数
+        magic_shield_reduction = 0.0  # 魔法盾减伤比例
+        
+        available_skills, passive_skills = CombatEngine.split_skills(skills, disabled_skills)
+        skill_cooldowns = {}
+        
+        # 召唤物状态
+        summon_state = None
+        summon_died = False
+        if summon and summon.get("alive"):
+            summon_state = summon.copy()
+            log.add(ev.SUMMON_JOIN, SUMMON, amount=summon_state["hp"], extra=summon_state["name"])
+        
+        # 药水
+        hp_potions, mp_potions = CombatEngine.sort_potions(inventory)
+        
+        # 碾压战斗快速结算，不满足条件时返回None，继续逐回合模拟
+        if allow_fast_forward and summon_state is None and game_config.FAST_COMBAT_MARGIN > 0:
+            result = CombatEngine.fast_forward(player, player_effects, monster_states, available_skills,
+                                               passive_skills, skills or [], mp_potions, log, data_loader, rng)
+            if result is not None:
+                result.seed = seed
+                metrics.incr("combat.fast_forward")
+                return result
+        metrics.incr("combat.simulated")
         
         while player_hp > 0 and any(m["hp"] > 0 for m in monster_states) and round_num < max_rounds:
             round_num += 1
-            logs.append(f"--- 第{round_num}回合 ---")
+            log.round = round_num
+            log.add(ev.ROUND)
             
             # 处理玩家毒伤
             if player_poison and player_poison.rounds > 0:
                 player_hp -= player_poison.damage
                 player_poison.rounds -= 1
-                logs.append(f"🧪 中毒! 受到 {player_poison.damage} 点毒伤")
+                log.add(ev.POISON_TICK, target=PLAYER, amount=player_poison.damage)
                 if player_poison.rounds <= 0:
                     player_poison = None
             
@@ -304,9 +447,9 @@ class CombatEngine:
                 if m["hp"] > 0 and m.get("poison") and m["poison"].rounds > 0:
                     m["hp"] -= m["poison"].damage
                     m["poison"].rounds -= 1
-                    logs.append(f"🧪 {m['name']} 中毒! 受到 {m['poison'].damage} 点毒伤")
+                    log.add(ev.POISON_TICK, target=m["idx"], amount=m["poison"].damage)
                     if m["hp"] <= 0:
-                        logs.append(f"💀 {m['name']} 被毒死!")
+                        log.add(ev.POISON_KILL, target=m["idx"])
                     if m["poison"].rounds <= 0:
                         m["poison"] = None
             
@@ -315,9 +458,9 @@ class CombatEngine:
                 if m["hp"] > 0 and m.get("burn") and m["burn"].rounds > 0:
                     m["hp"] -= m["burn"].damage
                     m["burn"].rounds -= 1
-                    logs.append(f"🔥 {m['name']} 灼烧! 受到 {m['burn'].damage} 点火焰伤害")
+                    log.add(ev.BURN_TICK, target=m["idx"], amount=m["burn"].damage)
                     if m["hp"] <= 0:
-                        logs.append(f"💀 {m['name']} 被烧死!")
+                        log.add(ev.BURN_KILL, target=m["idx"])
                     if m["burn"].rounds <= 0:
                         m["burn"] = None
             
@@ -331,14 +474,14 @@ class CombatEngine:
                         skill_level = holy_word_skill.get("level", 1)
                         # 根据等级计算触发率：1级1%，2级2%，3级3%
                         trigger_rate = skill_level * 0.01
-                        if random.random() < trigger_rate:
-                            target = random.choice(alive_targets)
+                        if rng.random() < trigger_rate:
+                            target = rng.choice(alive_targets)
                             target["hp"] = 0
-                            logs.append(f"✨ 圣言术发动! {target['name']} 被神圣之力瞬间消灭!")
+                            log.add(ev.HOLY_WORD, PLAYER, target["idx"])
             
             # 检查玩家眩晕
             if player_stunned:
-                logs.append("😵 你被眩晕，无法行动!")
+                log.add(ev.STUNNED, PLAYER)
                 player_stunned = False
             else:
                 # 自动使用药水（HP一半以下使用，可重复使用）
@@ -347,7 +490,7 @@ class CombatEngine:
                     heal = potion.get("info", {}).get("effect", {}).get("heal_hp", 0)
                     player_hp = min(player_max_hp, player_hp + heal)
                     potion["used_count"] = potion.get("used_count", 0) + 1
-                    logs.append(f"🧪 自动使用 {potion.get('info', {}).get('name', '药水')} 恢复 {heal} HP")
+                    log.add(ev.POTION_HP, PLAYER, amount=heal, extra=potion.get("info", {}).get("name", "药水"))
                     # 检查是否用完
                     db_item = potion.get("db_item")
                     if db_item and potion["used_count"] >= db_item.quantity:
@@ -358,7 +501,7 @@ class CombatEngine:
                     heal = potion.get("info", {}).get("effect", {}).get("heal_mp", 0)
                     player_mp = min(player_max_mp, player_mp + heal)
                     potion["used_count"] = potion.get("used_count", 0) + 1
-                    logs.append(f"🧪 自动使用 {potion.get('info', {}).get('name', '药水')} 恢复 {heal} MP")
+                    log.add(ev.POTION_MP, PLAYER, amount=heal, extra=potion.get("info", {}).get("name", "药水"))
                     # 检查是否用完
                     db_item = potion.get("db_item")
                     if db_item and potion["used_count"] >= db_item.quantity:
@@ -380,8 +523,8 @@ class CombatEngine:
                 is_aoe = False
                 
                 # 技能使用 - 法师90%、道士80%、战士50%
-                skill_chance = {"mage": 0.9, "taoist": 0.9, "warrior": 0.9}.get(char_class, 0.5)
-                if available_skills and player_mp > 0 and random.random() < skill_chance:
+                skill_chance = CombatEngine.SKILL_CHANCE.get(char_class, 0.5)
+                if available_skills and player_mp > 0 and rng.random() < skill_chance:
                     for skill in available_skills:
                         s_name = skill.get("name", "技能")
                         if skill.get("mp_cost", 0) <= player_mp and s_name not in skill_cooldowns:
@@ -400,7 +543,7 @@ class CombatEngine:
                                 player_mp -= mp_cost
                                 summon_state = CombatEngine.create_summon(player, skill)
                                 skill_cooldowns[s_name] = skill.get("cooldown", 1)
-                                logs.append(f"召唤: {summon_state['name']} (HP:{summon_state['hp']} ATK:{summon_state['attack']})")
+                                log.add(ev.SUMMON_CAST, PLAYER, SUMMON, summon_state["hp"], (summon_state["name"], summon_state["attack"]))
                                 skill_id = skill.get("skill_id", skill.get("id", ""))
                                 if skill_id and skill_id not in skills_used:
                                     skills_used.append(skill_id)
@@ -419,7 +562,7 @@ class CombatEngine:
                             if skill_id and skill_id not in skills_used:
                                 skills_used.append(skill_id)
                             
-                            logs.append(f"使用技能: {skill_name} Lv.{skill_level} (消耗{mp_cost}MP)")
+                            log.add(ev.SKILL, PLAYER, amount=mp_cost, extra=(skill_name, skill_level))
                             
                             skill_power = CombatEngine.calculate_skill_power(player, skill)
                             
@@ -427,7 +570,7 @@ class CombatEngine:
                                 extra_damage = int(effect["magic_damage"] * (1 + skill_power * 0.02))
                             elif effect.get("damage_multiplier"):
                                 is_magic = char_class != "warrior"
-                                base = CombatEngine.calculate_damage(player, alive_targets[0], is_magic, player_effects)
+                                base = CombatEngine.calculate_damage(player, alive_targets[0], is_magic, player_effects, rng=rng)
                                 extra_damage = int(base * (effect["damage_multiplier"] - 1) * (1 + skill_level * 0.3))
                             
                             if effect.get("ignore_defense"):
@@ -441,7 +584,7 @@ class CombatEngine:
                                 poison_dmg, poison_rounds = CombatEngine.calculate_poison_damage(player, skill)
                                 target = alive_targets[0]
                                 target["poison"] = PoisonState(poison_dmg, poison_rounds)
-                                logs.append(f"🧪 对{target['name']}施加毒素! 每回合{poison_dmg}点毒伤，持续{poison_rounds}回合")
+                                log.add(ev.POISON_APPLY, PLAYER, target["idx"], poison_dmg, poison_rounds)
                             
                             # 流星火雨 - 对目标施加持续灼烧
                             if effect.get("burn_damage") and effect.get("burn_rounds"):
@@ -451,54 +594,44 @@ class CombatEngine:
                                     # AOE技能对所有目标施加灼烧
                                     for t in alive_targets[:3]:
                                         t["burn"] = PoisonState(burn_dmg, burn_rounds)
-                                    logs.append(f"🔥 对所有目标施加灼烧! 每回合{burn_dmg}点火焰伤害，持续{burn_rounds}回合")
+                                    log.add(ev.BURN_APPLY, PLAYER, None, burn_dmg, burn_rounds)
                                 else:
                                     target = alive_targets[0]
                                     target["burn"] = PoisonState(burn_dmg, burn_rounds)
-                                    logs.append(f"🔥 对{target['name']}施加灼烧! 每回合{burn_dmg}点火焰伤害，持续{burn_rounds}回合")
+                                    log.add(ev.BURN_APPLY, PLAYER, target["idx"], burn_dmg, burn_rounds)
                             
                             if effect.get("heal_hp"):
                                 heal = CombatEngine.calculate_heal_amount(player, skill)
                                 player_hp = min(player_max_hp, player_hp + heal)
-                                logs.append(f"恢复 {heal} 点生命值")
+                                log.add(ev.HEAL, PLAYER, amount=heal)
                             
                             # 隐身术
                             if effect.get("invisible"):
-                                duration_min = effect.get("duration_min", 1)
-                                duration_max = effect.get("duration_max", 5)
-                                weight = effect.get("duration_weight_per_level", 10) * skill_level
-                                # 技能等级越高，持续时间越长的概率越大
-                                duration = random.choices(
-                                    range(duration_min, duration_max + 1),
-                                    weights=[1 + weight * (i - duration_min) for i in range(duration_min, duration_max + 1)]
-                                )[0]
+                                duration = CombatEngine.invisible_rounds(effect, skill_level, rng)
                                 player_invisible = duration
-                                logs.append(f"👻 进入隐身状态，持续{duration}回合")
+                                log.add(ev.INVISIBLE, PLAYER, amount=duration)
                             
                             # 魔法盾
                             if effect.get("damage_reduction") and effect.get("duration_rounds"):
-                                # 根据技能等级计算持续回合和减伤比例
-                                # 1级：2回合15%，2级：4回合30%，3级：6回合45%
-                                magic_shield_rounds = effect["duration_rounds"] * skill_level
-                                magic_shield_reduction = effect["damage_reduction"] * skill_level
-                                logs.append(f"🛡️ 魔法盾激活! 持续{magic_shield_rounds}回合，减伤{int(magic_shield_reduction*100)}%")
+                                magic_shield_rounds, magic_shield_reduction = CombatEngine.magic_shield(effect, skill_level)
+                                log.add(ev.MAGIC_SHIELD, PLAYER, amount=magic_shield_rounds, extra=int(magic_shield_reduction * 100))
                             
                             break
                 
                 # 召唤物攻击
                 if summon_state and summon_state.get("alive") and alive_targets:
                     target = alive_targets[0]
-                    s_damage = CombatEngine.calculate_damage(summon_state, target)
+                    s_damage = CombatEngine.calculate_damage(summon_state, target, rng=rng)
                     target["hp"] -= s_damage
-                    logs.append(f"{summon_state['name']}对{target['name']}造成 {s_damage} 点伤害")
+                    log.add(ev.HIT, SUMMON, target["idx"], s_damage)
                     if target["hp"] <= 0:
-                        logs.append(f"💀 {target['name']} 被击败!")
+                        log.add(ev.DEFEATED, target=target["idx"])
                 
                 # 玩家攻击 - 战士使用物理攻击，法师和道士使用魔法攻击
                 is_magic = char_class in ["mage", "taoist"]
                 
                 # 检查双次攻击
-                attack_count = 1 + EffectCalculator.check_double_attack(player_effects)
+                attack_count = 1 + EffectCalculator.check_double_attack(player_effects, rng)
                 
                 for attack_num in range(attack_count):
                     alive_targets = [m for m in monster_states if m["hp"] > 0]
@@ -506,28 +639,26 @@ class CombatEngine:
                         break
                     
                     if attack_num > 0:
-                        logs.append("⚡ 触发双次攻击!")
+                        log.add(ev.DOUBLE_ATTACK, PLAYER)
                     
                     if is_aoe:
                         targets = alive_targets[:3]
                         for t in targets:
-                            base_damage = CombatEngine.calculate_damage(player, t, is_magic, player_effects) + extra_damage
-                            result = EffectCalculator.process_attack(player, t, base_damage, equipment, [], is_magic)
+                            base_damage = CombatEngine.calculate_damage(player, t, is_magic, player_effects, rng=rng) + extra_damage
+                            result = EffectCalculator.process_attack(
+                                player, t, base_damage, is_magic=is_magic,
+                                attacker_profile=player_effects, defender_profile=EMPTY_PROFILE, rng=rng)
                             
                             if result.is_missed:
-                                logs.append(f"对{t['name']}的攻击未命中!")
+                                log.add(ev.MISS_TARGET, PLAYER, t["idx"])
                                 continue
                             if result.is_dodged:
-                                logs.append(f"🌀 {t['name']}闪避了攻击!")
+                                log.add(ev.DODGE, PLAYER, t["idx"])
                                 continue
                             
                             t["hp"] -= result.damage
-                            # 收集所有特效标签
-                            effect_tags = [log for log in result.logs if not any(x in log for x in ["攻击未命中", "攻击被闪避"])]
-                            log_msg = f"你对{t['name']}造成 {result.damage} 点技能伤害"
-                            if effect_tags:
-                                log_msg += f" [{'/'.join(effect_tags)}]"
-                            logs.append(log_msg)
+                            # 特效标签随事件记录
+                            log.add(ev.SKILL_HIT, PLAYER, t["idx"], result.damage, tuple(result.tags) or None)
                             
                             if result.heal_hp > 0:
                                 player_hp = min(player_max_hp, player_hp + result.heal_hp)
@@ -539,36 +670,31 @@ class CombatEngine:
                                 t["poison"] = PoisonState(result.poison_damage, result.poison_rounds)
                             
                             if t["hp"] <= 0:
-                                logs.append(f"💀 {t['name']} 被击败!")
+                                log.add(ev.DEFEATED, target=t["idx"])
                         
                         # 溅射伤害
                         splash = EffectCalculator.calculate_splash(player_effects, base_damage)
                         if splash > 0:
                             for other in [m for m in monster_states if m["hp"] > 0 and m not in targets]:
                                 other["hp"] -= splash
-                                logs.append(f"💥 溅射对{other['name']}造成 {splash} 点伤害")
+                                log.add(ev.SPLASH, PLAYER, other["idx"], splash)
                     else:
                         target = alive_targets[0]
-                        base_damage = CombatEngine.calculate_damage(player, target, is_magic, player_effects) + extra_damage
-                        result = EffectCalculator.process_attack(player, target, base_damage, equipment, [], is_magic)
+                        base_damage = CombatEngine.calculate_damage(player, target, is_magic, player_effects, rng=rng) + extra_damage
+                        result = EffectCalculator.process_attack(
+                            player, target, base_damage, is_magic=is_magic,
+                            attacker_profile=player_effects, defender_profile=EMPTY_PROFILE, rng=rng)
                         
                         if result.is_missed:
-                            logs.append("攻击未命中!")
+                            log.add(ev.MISS, PLAYER, target["idx"])
                             continue
                         if result.is_dodged:
-                            logs.append(f"🌀 {target['name']}闪避了攻击!")
+                            log.add(ev.DODGE, PLAYER, target["idx"])
                             continue
                         
                         target["hp"] -= result.damage
-                        if used_skill:
-                            log_msg = f"你对{target['name']}造成 {result.damage} 点技能伤害"
-                        else:
-                            log_msg = f"你对{target['name']}造成 {result.damage} 点伤害"
-                        # 收集所有特效标签
-                        effect_tags = [log for log in result.logs if not any(x in log for x in ["攻击未命中", "攻击被闪避"])]
-                        if effect_tags:
-                            log_msg += f" [{'/'.join(effect_tags)}]"
-                        logs.append(log_msg)
+                        log.add(ev.SKILL_HIT if used_skill else ev.HIT, PLAYER, target["idx"], result.damage,
+                                tuple(result.tags) or None)
                         
                         if result.heal_hp > 0:
                             player_hp = min(player_max_hp, player_hp + result.heal_hp)
@@ -580,21 +706,21 @@ class CombatEngine:
                             target["poison"] = PoisonState(result.poison_damage, result.poison_rounds)
                         
                         if target["hp"] <= 0:
-                            logs.append(f"💀 {target['name']} 被击败!")
+                            log.add(ev.DEFEATED, target=target["idx"])
                         
                         # 溅射伤害
                         splash = EffectCalculator.calculate_splash(player_effects, result.damage)
                         if splash > 0:
                             for other in [m for m in monster_states if m["hp"] > 0 and m != target]:
                                 other["hp"] -= splash
-                                logs.append(f"💥 溅射对{other['name']}造成 {splash} 点伤害")
+                                log.add(ev.SPLASH, PLAYER, other["idx"], splash)
             
             # 怪物攻击
             for m in monster_states:
                 if m["hp"] > 0:
                     # 检查怪物眩晕
                     if m.get("stunned"):
-                        logs.append(f"😵 {m['name']} 被眩晕，无法行动!")
+                        log.add(ev.STUNNED, m["idx"])
                         m["stunned"] = False
                         continue
                     
@@ -603,65 +729,42 @@ class CombatEngine:
                         # 但可以攻击召唤物
                         if summon_state and summon_state.get("alive"):
                             is_magic_attack = m.get("damage_type") == "magic"
-                            damage = CombatEngine.calculate_damage(m, summon_state, is_magic_attack)
+                            damage = CombatEngine.calculate_damage(m, summon_state, is_magic_attack, rng=rng)
                             summon_state["hp"] -= damage
-                            logs.append(f"{m['name']}对{summon_state['name']}造成 {damage} 点伤害")
+                            log.add(ev.HIT, m["idx"], SUMMON, damage)
                             if summon_state["hp"] <= 0:
                                 summon_state["alive"] = False
                                 summon_died = True
-                                logs.append(f"💀 {summon_state['name']} 死亡!")
+                                log.add(ev.SUMMON_DIED, target=SUMMON)
                         else:
-                            logs.append(f"👻 {m['name']}无法发现隐身的你!")
+                            log.add(ev.UNSEEN, m["idx"], PLAYER)
                         continue
                     
                     is_magic_attack = m.get("damage_type") == "magic"
                     
                     # 50%几率攻击召唤物
-                    if summon_state and summon_state.get("alive") and random.random() < 0.5:
-                        damage = CombatEngine.calculate_damage(m, summon_state, is_magic_attack)
+                    if summon_state and summon_state.get("alive") and rng.random() < 0.5:
+                        damage = CombatEngine.calculate_damage(m, summon_state, is_magic_attack, rng=rng)
                         summon_state["hp"] -= damage
-                        logs.append(f"{m['name']}对{summon_state['name']}造成 {damage} 点伤害")
+                        log.add(ev.HIT, m["idx"], SUMMON, damage)
                         if summon_state["hp"] <= 0:
                             summon_state["alive"] = False
                             summon_died = True
-                            logs.append(f"💀 {summon_state['name']} 死亡!")
+                            log.add(ev.SUMMON_DIED, target=SUMMON)
                     else:
-                        base_damage = CombatEngine.calculate_damage(m, player, is_magic_attack)
-                        
-                        # 应用玩家防御特效（格挡和减伤只取其一，不叠加）
-                        defense_effects = []
-                        blocked, blocked_damage = EffectCalculator.calculate_block(player_effects, base_damage)
-                        reduced_damage = EffectCalculator.apply_damage_reduction(player_effects, base_damage)
-                        
-                        if blocked:
-                            damage = blocked_damage
-                            defense_effects.append("格挡")
-                        elif player_effects.get("damage_reduction", 0) > 0:
-                            damage = reduced_damage
-                            defense_effects.append(f"减伤{int(player_effects['damage_reduction']*100)}%")
-                        else:
-                            damage = base_damage
-                        
-                        # 应用魔法盾减伤
-                        if magic_shield_rounds > 0:
-                            shield_reduced = int(damage * magic_shield_reduction)
-                            damage = damage - shield_reduced
-                            defense_effects.append(f"魔法盾减伤{int(magic_shield_reduction*100)}%")
-                        
-                        # 确保最低伤害为基础伤害的50%
-                        damage = max(int(base_damage * 0.5), damage)
+                        base_damage = CombatEngine.calculate_damage(m, player, is_magic_attack, rng=rng)
+                        # 应用玩家防御特效和魔法盾
+                        damage, defense_effects = CombatEngine.damage_taken(
+                            base_damage, player_effects, magic_shield_reduction if magic_shield_rounds > 0 else 0.0, rng)
                         
                         # 反弹伤害
                         reflect_dmg = EffectCalculator.calculate_reflect(player_effects, damage)
                         if reflect_dmg > 0:
                             m["hp"] -= reflect_dmg
-                            defense_effects.append(f"反弹{reflect_dmg}")
+                            defense_effects.append(("reflect", reflect_dmg))
                         
                         player_hp -= damage
-                        log_msg = f"{m['name']}对你造成 {damage} 点伤害"
-                        if defense_effects:
-                            log_msg += f" [{'/'.join(defense_effects)}]"
-                        logs.append(log_msg)
+                        log.add(ev.HIT, m["idx"], PLAYER, damage, tuple(defense_effects) or None)
                         if player_hp <= 0:
                             break
             
@@ -669,19 +772,18 @@ class CombatEngine:
             if player_invisible > 0:
                 player_invisible -= 1
                 if player_invisible == 0:
-                    logs.append("👻 隐身状态结束")
+                    log.add(ev.INVISIBLE_END, PLAYER)
             
             # 魔法盾回合递减
             if magic_shield_rounds > 0:
                 magic_shield_rounds -= 1
                 if magic_shield_rounds == 0:
-                    logs.append("🛡️ 魔法盾效果结束")
+                    log.add(ev.SHIELD_END, PLAYER)
                     magic_shield_reduction = 0.0
             
             # 状态更新
-            monster_hp_info = "|".join([f"#{m['idx']}{m['name']}[{m['quality']}]:{max(0, m['hp'])}/{m['max_hp']}" for m in monster_states])
-            summon_info = f"|SUMMON:{summon_state['name']}:{summon_state['hp']}/{summon_state['max_hp']}" if summon_state and summon_state.get("alive") else ""
-            logs.append(f"COMBAT_STATUS|{player_hp}/{player_max_hp}|{player_mp}/{player_max_mp}|{monster_hp_info}{summon_info}")
+            summon_info = (summon_state["name"], summon_state["hp"], summon_state["max_hp"]) if summon_state and summon_state.get("alive") else None
+            log.add(ev.STATUS, amount=player_hp, extra=(player_mp, tuple(m["hp"] for m in monster_states), summon_info))
         
         victory = all(m["hp"] <= 0 for m in monster_states)
         player_died = player_hp <= 0
@@ -691,87 +793,243 @@ class CombatEngine:
         drops = []
         
         if victory:
-            for m in monster_states:
-                exp_gained += m["exp"]
-                gold_gained += m["gold"]
-                quality_drop_bonus = CombatEngine.QUALITY_DROP_BONUS.get(m["quality"], 1.0)
-                goblin_multiplier = m.get("goblin_drop_multiplier", 1)  # 哥布林掉率倍数
-
-                # 处理直接掉落
-                for drop in m["drops"]:
-                    base_rate = CombatEngine.parse_rate(drop.get("rate", 0.1))
-                    # 应用全局爆率倍数
-                    final_rate = min(1.0, base_rate * quality_drop_bonus * game_config.DROP_RATE_MULTIPLIER)
-                    if random.random() < final_rate:
-                        quality = roll_quality(base_rate)
-                        item_id = drop["item"]
-                        # 获取基础物品数据并生成随机属性
-                        random_attrs = None
-                        if data_loader:
-                            base_item = data_loader.get_item(item_id)
-                            # 只对装备类型生成随机属性
-                            if base_item and base_item.get("type") in ["weapon", "armor", "accessory"]:
-                                rolled_item = roll_item_attributes(base_item, quality)
-                                random_attrs = rolled_item.get("_random_attrs")
-                        drops.append({"item_id": item_id, "quality": quality, "random_attrs": random_attrs})
-
-                # 处理掉落组
-                drop_groups = m.get("drop_groups", [])
-                # 自动添加符文掉落组（基于怪物等级）
-                monster_level = m.get("level", 1)
-                rune_tier = min(16, max(1, (monster_level - 1) // 5 + 1))
-                rune_drop_group = f"runes_tier_{rune_tier}"
-                if rune_drop_group not in drop_groups:
-                    drop_groups = list(drop_groups) + [rune_drop_group]
-
-                if drop_groups and data_loader:
-                    for group_id in drop_groups:
-                        group = data_loader.get_drop_group(group_id)
-                        for drop in group.get("drops", []):
-                            base_rate = CombatEngine.parse_rate(drop.get("rate", 0.1))
-                            # 应用哥布林掉率倍数
-                            final_rate = min(1.0, base_rate * quality_drop_bonus * game_config.DROP_RATE_MULTIPLIER * goblin_multiplier)
-                            if random.random() < final_rate:
-                                quality = roll_quality(base_rate)
-                                item_id = drop["item"]
-                                # 获取基础物品数据并生成随机属性
-                                random_attrs = None
-                                base_item = data_loader.get_item(item_id)
-                                # 只对装备类型生成随机属性
-                                if base_item and base_item.get("type") in ["weapon", "armor", "accessory"]:
-                                    rolled_item = roll_item_attributes(base_item, quality)
-                                    random_attrs = rolled_item.get("_random_attrs")
-                                drops.append({"item_id": item_id, "quality": quality, "random_attrs": random_attrs})
-            
-            # 应用全局倍数
-            exp_gained = int(exp_gained * game_config.EXP_MULTIPLIER)
-            gold_gained = int(gold_gained * game_config.GOLD_MULTIPLIER)
-            logs.append(f"🎉 胜利! 获得 {exp_gained} 经验, {gold_gained} 金币")
-            for drop in drops:
-                item_name = drop['item_id']
-                if data_loader:
-                    item_info = data_loader.get_item(drop['item_id'])
-                    if item_info:
-                        item_name = item_info.get('name', drop['item_id'])
-                logs.append(f"💎 获得物品: {item_name}")
+            exp_gained, gold_gained, drops = CombatEngine.victory_rewards(monster_states, log, data_loader, rng)
         else:
-            logs.append(f"💀 战斗失败...")
+            log.add(ev.DEFEAT, PLAYER)
         
         return CombatResult(
             victory=victory,
-            logs=logs,
+            log=log,
             exp_gained=exp_gained,
             gold_gained=gold_gained,
             drops=drops,
             player_died=player_died,
             skills_used=skills_used,
             passive_skills=passive_skills,
-            summon_died=summon_died
+            summon_died=summon_died,
+            rounds=round_num,
+            hp_used=player_max_hp - max(0, player_hp),
+            mp_used=player_max_mp - player_mp,
+            seed=seed
+        )
+    
+    @staticmethod
+    def fast_forward(player: dict, player_effects: EffectProfile, monster_states: List[dict],
+                     available_skills: List[dict], passive_skills: List[str], skills: List[dict],
+                     mp_potions: List[dict], log: CombatLog, data_loader=None,
+                     rng=random) -> Optional[CombatResult]:
+        """碾压战斗快速结算，不适用时返回None（调用方继续逐回合模拟）
+        
+        玩家对每个怪物的每回合期望伤害都超过其HP的 FAST_COMBAT_MARGIN 倍时启用，并要求：
+        最低伤害也能一击击杀任一怪物、装备无溅射、反弹打不死怪物、没有召唤技能，
+        且最坏情况下 (怪物数+余量) 回合内受到的伤害不超过最大HP的70%（不会喝HP药或死亡）。
+        此时战斗结果只取决于命中/闪避、双击、技能轮换、圣言术和致死的持续伤害，
+        按与逐回合模拟相同的规则抽样，跳过玩家伤害计算、攻击特效处理和逐条日志；
+        受到的伤害与逐回合模拟一样逐次抽样（含格挡、减伤、隐身和魔法盾）。
+        """
+        char_class = player.get("char_class", "warrior")
+        is_magic = char_class in ["mage", "taoist"]
+        
+        # 每个怪物：最低伤害也能一击击杀，且每回合期望伤害（平均单次伤害 × 命中率 × (1 + 双击率)）
+        # 不低于其HP的 FAST_COMBAT_MARGIN 倍。判定只取决于玩家攻击范围和特效、怪物HP和防御，
+        # 按这些值缓存，不满足条件的战斗通常只需一次查表
+        atk_min, atk_max, _, _ = CombatEngine.damage_ranges(player, {}, is_magic)
+        def_key = "magic_defense" if is_magic else "defense"
+        hit_rate = player_effects.hit_rate
+        double_rate = player_effects.double_attack
+        margin = game_config.FAST_COMBAT_MARGIN
+        player_key = (is_magic, atk_min, atk_max, player_effects.ignore_magic_def if is_magic else player_effects.ignore_defense,
+                      hit_rate, double_rate, margin)
+        cache = CombatEngine.fast_gate_cache
+        for m in monster_states:
+            key = player_key + (m["hp"], m[def_key])
+            eligible = cache.get(key)
+            if eligible is None:
+                defense = m[def_key]
+                land_rate = (min(1.0, EFFECT_CONFIG["default_hit_rate"] + hit_rate)
+                             * (1 - EFFECT_CONFIG["default_dodge_rate"]) * (1 + double_rate))
+                lowest = max(1, int(CombatEngine.mitigate(atk_min, defense, player_effects, is_magic) * 0.9))
+                expected = CombatEngine.mitigate((atk_min + atk_max) / 2, defense, player_effects, is_magic)
+                eligible = lowest >= m["hp"] and expected * land_rate >= margin * m["hp"]
+                if len(cache) >= CombatEngine.FAST_GATE_CACHE_SIZE:
+                    cache.clear()
+                cache[key] = eligible
+            if not eligible:
+                return None
+        
+        if player_effects.splash_rate > 0:
+            return None
+        if any(skill.get("effect", {}).get("summon") for skill in available_skills):
+            return None
+        
+        max_hp = player.get("max_hp", 100)
+        max_mp = player.get("max_mp", 50)
+        round_cap = len(monster_states) + CombatEngine.FAST_ROUND_SLACK
+        
+        # 最坏情况下受到的伤害（格挡、减伤、魔法盾只会更低），以及反弹伤害累计能否打死怪物
+        worst_incoming = 0
+        bounds = {}
+        for m in monster_states:
+            key = (m["attack"], m["damage_type"], m["hp"])
+            if key not in bounds:
+                highest = CombatEngine.damage_bounds(m, player, m["damage_type"] == "magic")[1]
+                if EffectCalculator.calculate_reflect(player_effects, highest) * round_cap >= m["hp"]:
+                    return None
+                bounds[key] = highest
+            worst_incoming += bounds[key]
+        if worst_incoming * round_cap > max_hp * 0.7:
+            return None
+        
+        holy_word_rate = 0.0
+        if char_class == "mage" and "holy_word" in passive_skills:
+            holy_word_skill = next((s for s in skills if s.get("skill_id") == "holy_word"), None)
+            if holy_word_skill:
+                holy_word_rate = holy_word_skill.get("level", 1) * 0.01
+        skill_chance = CombatEngine.SKILL_CHANCE.get(char_class, 0.5)
+        
+        hp = max_hp
+        mp = max_mp
+        invisible = 0  # 隐身剩余回合数
+        shield_rounds = 0  # 魔法盾剩余回合数
+        shield_reduction = 0.0
+        alive = [m["idx"] for m in monster_states]  # 按序号排列，与逐回合模拟的目标顺序一致
+        doomed = set()  # 中了致死持续伤害的怪物，下回合开始时死亡
+        killed = []
+        skill_cooldowns = {}
+        skills_used = []
+        mp_queue = list(mp_potions)
+        potion_uses = {}  # id(药水) -> 本场使用次数，成功结算后才写回
+        potion_events = []  # (回合, 恢复量, 药水名)，成功结算后才写入日志（回退时日志保持不变）
+        
+        def kill(idx: int):
+            alive.remove(idx)
+            killed.append(idx)
+            doomed.discard(idx)
+        
+        def dot(idx: int, damage: int):
+            if damage >= monster_states[idx]["hp"]:
+                doomed.add(idx)
+        
+        round_num = 0
+        while alive:
+            round_num += 1
+            if round_num > round_cap:
+                return None
+            
+            # 持续伤害结算
+            for idx in [i for i in alive if i in doomed]:
+                kill(idx)
+            
+            # 圣言术
+            if holy_word_rate and alive and rng.random() < holy_word_rate:
+                kill(rng.choice(alive))
+            
+            # 自动使用MP药水
+            if mp < max_mp * 0.3 and mp_queue:
+                potion = mp_queue[0]
+                heal = potion.get("info", {}).get("effect", {}).get("heal_mp", 0)
+                mp = min(max_mp, mp + heal)
+                potion_uses[id(potion)] = potion_uses.get(id(potion), 0) + 1
+                potion_events.append((round_num, heal, potion.get("info", {}).get("name", "药水")))
+                db_item = potion.get("db_item")
+                if db_item and potion.get("used_count", 0) + potion_uses[id(potion)] >= db_item.quantity:
+                    mp_queue.pop(0)
+            
+            # 减少技能CD
+            for skill_name in list(skill_cooldowns.keys()):
+                skill_cooldowns[skill_name] -= 1
+                if skill_cooldowns[skill_name] <= 0:
+                    del skill_cooldowns[skill_name]
+            
+            if not alive:
+                break
+            
+            # 技能轮换（只结算MP、冷却、治疗和持续伤害）
+            is_aoe = False
+            if available_skills and mp > 0 and rng.random() < skill_chance:
+                for skill in available_skills:
+                    s_name = skill.get("name", "技能")
+                    mp_cost = skill.get("mp_cost", 0)
+                    if mp_cost > mp or s_name in skill_cooldowns:
+                        continue
+                    effect = skill.get("effect", {})
+                    if effect.get("heal_hp") and not effect.get("aoe") and hp >= max_hp * 0.7:
+                        continue
+                    mp -= mp_cost
+                    skill_cooldowns[s_name] = skill.get("cooldown", 1)
+                    is_aoe = effect.get("aoe", False)
+                    skill_id = skill.get("skill_id", skill.get("id", ""))
+                    if skill_id and skill_id not in skills_used:
+                        skills_used.append(skill_id)
+                    if effect.get("poison_damage") and effect.get("duration"):
+                        dot(alive[0], CombatEngine.calculate_poison_damage(player, skill)[0])
+                    if effect.get("burn_damage") and effect.get("burn_rounds"):
+                        skill_power = CombatEngine.calculate_skill_power(player, skill)
+                        burn_dmg = int(effect["burn_damage"] * (1 + skill_power * 0.02))
+                        for idx in (alive[:3] if is_aoe else alive[:1]):
+                            dot(idx, burn_dmg)
+                    if effect.get("heal_hp"):
+                        hp = min(max_hp, hp + CombatEngine.calculate_heal_amount(player, skill))
+                    if effect.get("invisible"):
+                        invisible = CombatEngine.invisible_rounds(effect, skill.get("level", 1), rng)
+                    if effect.get("damage_reduction") and effect.get("duration_rounds"):
+                        shield_rounds, shield_reduction = CombatEngine.magic_shield(effect, skill.get("level", 1))
+                    break
+            
+            # 玩家攻击：命中即击杀
+            attack_count = 1 + EffectCalculator.check_double_attack(player_effects, rng)
+            for _ in range(attack_count):
+                if not alive:
+                    break
+                for idx in (alive[:3] if is_aoe else alive[:1]):
+                    hit, dodged = EffectCalculator.calculate_hit(player_effects, {}, rng)
+                    if hit and not dodged:
+                        kill(idx)
+            
+            # 怪物攻击（隐身时无法攻击玩家）
+            if not invisible:
+                for idx in alive:
+                    m = monster_states[idx]
+                    base_damage = CombatEngine.calculate_damage(m, player, m["damage_type"] == "magic", rng=rng)
+                    hp -= CombatEngine.damage_taken(base_damage, player_effects,
+                                                    shield_reduction if shield_rounds else 0.0, rng)[0]
+            if invisible:
+                invisible -= 1
+            if shield_rounds:
+                shield_rounds -= 1
+        
+        for potion in mp_potions:
+            if id(potion) in potion_uses:
+                potion["used_count"] = potion.get("used_count", 0) + potion_uses[id(potion)]
+        
+        for potion_round, heal, name in potion_events:
+            log.round = potion_round
+            log.add(ev.POTION_MP, PLAYER, amount=heal, extra=name)
+        log.round = round_num
+        log.add(ev.FAST_FORWARD, PLAYER, amount=round_num, extra=(max_hp - hp, max_mp - mp))
+        for idx in killed:
+            monster_states[idx]["hp"] = 0
+            log.add(ev.DEFEATED, target=idx)
+        log.add(ev.STATUS, amount=hp, extra=(mp, tuple(0 for _ in monster_states), None))
+        exp_gained, gold_gained, drops = CombatEngine.victory_rewards(monster_states, log, data_loader, rng)
+        
+        return CombatResult(
+            victory=True,
+            log=log,
+            exp_gained=exp_gained,
+            gold_gained=gold_gained,
+            drops=drops,
+            player_died=False,
+            skills_used=skills_used,
+            passive_skills=passive_skills,
+            rounds=round_num,
+            hp_used=max_hp - hp,
+            mp_used=max_mp - mp
         )
     
     @staticmethod
     def pvp_combat(player1: dict, player2: dict, p1_equipment: List[dict] = None, 
-                   p2_equipment: List[dict] = None) -> dict:
+                   p2_equipment: List[dict] = None, rng=random) -> dict:
         """PVP战斗 - 支持装备特效"""
         logs = []
         p1_hp = player1.get("max_hp", 100)
@@ -800,8 +1058,11 @@ class CombatEngine:
                 stunned[atk_key] = False
             else:
                 is_magic = atk_data.get("char_class") in ["mage", "taoist"]
-                base_damage = CombatEngine.calculate_damage(atk_data, def_data, is_magic, atk_fx, def_fx)
-                result = EffectCalculator.process_attack(atk_data, def_data, base_damage, [], [], is_magic)
+                base_damage = CombatEngine.calculate_damage(atk_data, def_data, is_magic, atk_fx, def_fx, rng)
+                # 命中、暴击等攻击特效按无装备结算（保持现有PVP规则），格挡、减伤、反弹在下方单独结算
+                result = EffectCalculator.process_attack(
+                    atk_data, def_data, base_damage, is_magic=is_magic,
+                    attacker_profile=EMPTY_PROFILE, defender_profile=EMPTY_PROFILE, rng=rng)
                 
                 if result.is_missed:
                     logs.append(f"{atk_name}的攻击未命中!")
@@ -809,7 +1070,7 @@ class CombatEngine:
                     logs.append(f"{def_name}闪避了攻击!")
                 else:
                     # 应用防御特效
-                    blocked, damage = EffectCalculator.calculate_block(def_fx, result.damage)
+                    blocked, damage = EffectCalculator.calculate_block(def_fx, result.damage, rng)
                     damage = EffectCalculator.apply_damage_reduction(def_fx, damage)
                     
                     hp[def_key] -= damage
@@ -848,49 +1109,22 @@ class CombatEngine:
     @staticmethod
     def parse_rate(rate_str: str) -> float:
         """解析掉率字符串"""
-        if isinstance(rate_str, (int, float)):
-            return float(rate_str)
-        if '/' in str(rate_str):
-            frac = Fraction(rate_str)
-            return float(frac)
-        return float(rate_str)
+        return parse_rate(rate_str)
     
     @staticmethod
-    def calculate_drops_from_groups(drop_groups: List[str], monster_drops: List[dict], data_loader) -> List[dict]:
-        """从掉落组计算掉落物品"""
+    def calculate_drops_from_groups(drop_groups: List[str], monster_drops: List[dict], data_loader,
+                                    rng=random) -> List[dict]:
+        """从掉落组计算掉落物品（使用缓存的合并掉落表）"""
         drops = []
-        all_drops = {}
-
-        for drop in monster_drops:
-            item_id = drop.get("item")
-            rate = CombatEngine.parse_rate(drop.get("rate", 0))
-            if item_id in all_drops:
-                all_drops[item_id] = 1 - (1 - all_drops[item_id]) * (1 - rate)
-            else:
-                all_drops[item_id] = rate
-
-        for group_id in drop_groups:
-            group = data_loader.get_drop_group(group_id)
-            for drop in group.get("drops", []):
-                item_id = drop.get("item")
-                rate = CombatEngine.parse_rate(drop.get("rate", 0))
-                if item_id in all_drops:
-                    all_drops[item_id] = 1 - (1 - all_drops[item_id]) * (1 - rate)
-                else:
-                    all_drops[item_id] = rate
-
-        for item_id, rate in all_drops.items():
-            if random.random() < rate:
-                quality = roll_quality(rate)
-                # 获取基础物品数据并生成随机属性
-                random_attrs = None
-                base_item = data_loader.get_item(item_id)
+        for entry, qualities in DropTables.merged(drop_groups, monster_drops):
+            if rng.random() < entry.base_rate:
+                quality = qualities.sample(rng)
                 # 只对装备类型生成随机属性
-                if base_item and base_item.get("type") in ["weapon", "armor", "accessory"]:
-                    rolled_item = roll_item_attributes(base_item, quality)
-                    random_attrs = rolled_item.get("_random_attrs")
+                random_attrs = None
+                if entry.attrs is not None:
+                    random_attrs = entry.attrs.roll(quality, rng)[0]
                 drops.append({
-                    "item_id": item_id,
+                    "item_id": entry.item_id,
                     "quality": quality,
                     "random_attrs": random_attrs
                 })
@@ -0,0 +1,197 @@
+"""战斗上下文加载 - 一次查询取回战斗所需的角色与背包，并批量写入掉落"""
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.game.data_loader import DataLoader
+from backend.game.inventory import inventory_key, slot_index
+from backend.game.runeword import roll_sockets_for_white_equipment
+from backend.game.stats import StatSnapshot, stat_cache
+from backend.models import Character, CharacterSkill, InventoryItem, StorageType
+
+# 可堆叠的物品类型
+STACKABLE_TYPES = ("consumable", "material", "skillbook", "boss_summon", "rune")
+# 技能最高等级
+MAX_SKILL_LEVEL = 3
+
+
+def prepare_item(item_id: str, quality: str, random_attrs: dict = None, sockets: int = None) -> Tuple[dict, str, Optional[dict], Optional[int], bool]:
+    """规范化待入包物品：非装备品质统一为普通，白色武器/防具自动生成孔
+
+    返回 (物品信息, 品质, 随机属性, 孔数, 是否可堆叠)
+    """
+    item_info = DataLoader.get_item(item_id)
+    item_type = item_info.get("type") if item_info else None
+    is_stackable = item_type in STACKABLE_TYPES
+    # 非装备类型物品品质统一为普通
+    if item_type not in ["weapon", "armor", "accessory"]:
+        quality = "white"
+        random_attrs = None  # 非装备不存储随机属性
+        sockets = None  # 非装备不生成孔
+
+    # 白色装备自动生成孔
+    if item_type in ["weapon", "armor"] and quality == "white" and sockets is None:
+        item_slot = item_info.get("slot", "weapon")
+        # 映射到符文之语支持的槽位
+        slot_mapping = {"body": "armor", "head": "helmet"}
+        runeword_slot = slot_mapping.get(item_slot, item_slot)
+        sockets = roll_sockets_for_white_equipment(runeword_slot)
+
+    return item_info, quality, random_attrs, sockets, is_stackable
+
+
+class CombatContext:
+    """一场战斗所需的数据：角色、背包（已加行锁）和派生属性快照"""
+
+    __slots__ = ("char", "inventory", "snapshot", "removed")
+
+    def __init__(self, char: Character, inventory: List[InventoryItem], snapshot: StatSnapshot):
+        self.char = char
+        self.inventory = inventory
+        self.snapshot = snapshot
+        # 战斗中被删除的背包行（用完的药水等），入包时其格子可复用
+        self.removed = set()
+
+    def consumables(self, expand: bool = False) -> List[dict]:
+        """背包中的恢复物品，expand为True时按数量展开为多条"""
+        result = []
+        for item in self.inventory:
+            info = DataLoader.get_item(item.item_id)
+            if info and info.get("type") == "consumable":
+                for _ in range(item.quantity if expand else 1):
+                    result.append({"slot": item.slot, "info": info, "db_item": item})
+        return result
+
+    async def consume(self, used_counts: Dict[InventoryItem, int], db: AsyncSession):
+        """扣除战斗中使用的物品"""
+        for db_item, count in used_counts.items():
+            if db_item.quantity > count:
+                db_item.quantity -= count
+            else:
+                await db.delete(db_item)
+                self.removed.add(db_item)
+                slot_index.release(inventory_key(self.char.id), db_item.slot, db)
+
+    def add_items(self, drops: Iterable[dict], db: AsyncSession) -> List[bool]:
+        """批量入包：用已加载的背包行完成堆叠，空位取自格子位图，不额外查询
+
+        与逐个 _add_item 的结果一致：可堆叠物品叠到第一个同类格，其余按顺序占用最小空位。
+        """
+        stacks: Dict[Tuple[str, str], InventoryItem] = {}
+        for item in self.inventory:
+            if item not in self.removed:
+                stacks.setdefault((item.item_id, item.quality), item)
+
+        key = inventory_key(self.char.id)
+        results = []
+        for drop in drops:
+            item_id = drop["item_id"]
+            _, quality, random_attrs, sockets, is_stackable = prepare_item(
+                item_id, drop["quality"], drop.get("random_attrs"), drop.get("sockets"))
+            quantity = drop.get("quantity", 1)
+
+            if is_stackable:
+                existing = stacks.get((item_id, quality))
+                if existing is not None:
+                    existing.quantity += quantity
+                    results.append(True)
+                    continue
+
+            slot = slot_index.acquire(key, db)
+            if slot is None:
+                results.append(False)
+                continue
+
+            item = InventoryItem(
+                character_id=self.char.id,
+                user_id=self.char.user_id,
+                storage_type=StorageType.INVENTORY,
+                item_id=item_id,
+                quality=quality,
+                slot=slot,
+                quantity=quantity,
+                random_attrs=random_attrs,
+                sockets=sockets or 0,
+                socketed_runes=drop.get("socketed_runes"),
+                runeword_id=drop.get("runeword_id")
+            )
+            db.add(item)
+            self.inventory.append(item)
+            if is_stackable:
+                stacks[(item_id, quality)] = item
+            results.append(True)
+        return results
+
+
+async def load_combat_context(char_id: int, db: AsyncSession) -> Optional[CombatContext]:
+    """加载战斗上下文
+
+    角色与背包通过一次外连接查询取回并加行锁；装备和技能来自派生属性快照，
+    快照命中时整场战斗的读取只有这一次往返。
+    """
+    result = await db.execute(
+        select(Character, InventoryItem)
+        .outerjoin(InventoryItem, and_(
+            InventoryItem.character_id == Character.id,
+            InventoryItem.storage_type == StorageType.INVENTORY
+        ))
+        .where(Character.id == char_id)
+        .order_by(InventoryItem.id)
+        .with_for_update()
+    )
+    char = None
+    inventory = []
+    for row_char, item in result.all():
+        char = row_char
+        if item is not None:
+            inventory.append(item)
+    if char is None:
+        return None
+
+    # 背包行已加锁取回，顺便刷新格子位图
+    slot_index.seed(inventory_key(char_id), (item.slot for item in inventory), db)
+    snapshot = await stat_cache.get(char, db)
+    return CombatContext(char, inventory, snapshot)
+
+
+async def increase_skills_proficiency(char_id: int, gains: List[Tuple[str, int]], db: AsyncSession):
+    """批量增加技能熟练度（一次查询取回涉及的技能，不提交事务）
+
+    gains 为按顺序的 (技能ID, 增加量)，与逐个调用 _increase_skill_proficiency 等价。
+    """
+    if not gains:
+        return
+    skill_ids = {skill_id for skill_id, _ in gains}
+    result = await db.execute(
+        select(CharacterSkill).where(
+            CharacterSkill.character_id == char_id,
+            CharacterSkill.skill_id.in_(skill_ids)
+        ).order_by(CharacterSkill.id)
+    )
+    skills: Dict[str, CharacterSkill] = {}
+    for skill in result.scalars():
+        skills.setdefault(skill.skill_id, skill)
+
+    for skill_id, amount in gains:
+        skill = skills.get(skill_id)
+        if skill is not None:
+            apply_proficiency(skill, amount)
+
+
+def apply_proficiency(skill: CharacterSkill, amount: int):
+    """增加熟练度并处理升级（技能升级时派生属性快照失效）"""
+    # 顶级技能不再增加熟练度
+    if skill.level >= MAX_SKILL_LEVEL:
+        skill.proficiency = 0
+        return
+
+    skill.proficiency += amount
+
+    while skill.proficiency >= 1000 and skill.level < MAX_SKILL_LEVEL:
+        skill.proficiency -= 1000
+        skill.level += 1
+        # 技能等级影响被动加成和技能伤害，快照失效
+        stat_cache.invalidate(skill.character_id)
+        if skill.level >= MAX_SKILL_LEVEL:
+            skill.proficiency = 0
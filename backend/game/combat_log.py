@@ -0,0 +1,177 @@
+"""战斗事件记录 - 战斗中只记录紧凑的事件元组，日志文字在需要时才生成
+
+事件: (回合, 行动方, 目标, 事件码, 数值, 附加数据)
+行动方/目标: 怪物序号(0..n-1)、PLAYER(-1)、SUMMON(-2)，无则为None
+附加数据: 随事件码而定，如特效标签元组、药水名、状态快照
+
+JSON客户端收到 render() 生成的旧版日志文字（与原先逐行拼接的字符串完全一致），
+compact/msgpack 客户端收到 to_wire() 的事件列表，由客户端自行渲染。
+"""
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .effects import EFFECT_NAMES, render_effect_tag
+
+PLAYER = -1
+SUMMON = -2
+
+# 事件码
+EQUIP_EFFECTS = 1      # 装备特效: 附加数据 ((特效, 数值), ...)
+START = 2              # 战斗开始
+INIT = 3               # 初始状态: 数值=玩家HP 附加数据=(玩家MP, (怪物HP, ...))
+SUMMON_JOIN = 4        # 召唤物参战: 数值=HP 附加数据=名称
+ROUND = 5              # 回合开始
+POISON_TICK = 6        # 毒伤结算: 目标受到数值点伤害
+POISON_KILL = 7        # 被毒死
+BURN_TICK = 8          # 灼烧结算
+BURN_KILL = 9          # 被烧死
+HOLY_WORD = 10         # 圣言术秒杀
+STUNNED = 11           # 行动方被眩晕
+POTION_HP = 12         # 使用HP药水: 数值=恢复量 附加数据=药水名
+POTION_MP = 13         # 使用MP药水
+SUMMON_CAST = 14       # 召唤: 数值=HP 附加数据=(名称, 攻击)
+SKILL = 15             # 使用技能: 数值=消耗MP 附加数据=(技能名, 等级)
+POISON_APPLY = 16      # 施毒: 数值=每回合伤害 附加数据=回合数
+BURN_APPLY = 17        # 灼烧: 目标为None时表示所有目标
+HEAL = 18              # 治愈术恢复
+INVISIBLE = 19         # 隐身: 数值=回合数
+MAGIC_SHIELD = 20      # 魔法盾: 数值=回合数 附加数据=减伤百分比
+HIT = 21               # 造成伤害: 附加数据=特效标签元组或None
+SKILL_HIT = 22         # 玩家造成技能伤害
+DEFEATED = 23          # 被击败
+DOUBLE_ATTACK = 24     # 触发双次攻击
+MISS = 25              # 攻击未命中（单体）
+MISS_TARGET = 26       # 对目标的攻击未命中（群攻）
+DODGE = 27             # 目标闪避
+SPLASH = 28            # 溅射伤害
+SUMMON_DIED = 29       # 召唤物死亡
+UNSEEN = 30            # 怪物无法发现隐身的玩家
+INVISIBLE_END = 31     # 隐身结束
+SHIELD_END = 32        # 魔法盾结束
+STATUS = 33            # 回合状态: 数值=玩家HP 附加数据=(玩家MP, (怪物HP, ...), 召唤物(名称, HP, 最大HP)或None)
+VICTORY = 34           # 胜利: 数值=经验 附加数据=金币
+ITEM = 35              # 获得物品: 附加数据=物品名
+DEFEAT = 36            # 战斗失败
+FAST_FORWARD = 37      # 快速结算: 数值=回合数 附加数据=(消耗HP, 消耗MP)
+
+Event = Tuple[int, Optional[int], Optional[int], int, int, object]
+
+# 数值类特效显示为+N，其余显示为百分比
+_FLAT_EFFECTS = ("hp_on_hit", "mp_on_hit", "extra_phys", "extra_magic", "poison_damage", "poison_rounds")
+
+
+class CombatLog:
+    """单场战斗的事件记录"""
+
+    __slots__ = ("player_name", "player_max_hp", "player_max_mp", "monsters", "round", "events")
+
+    def __init__(self, player_name: str, player_max_hp: int, player_max_mp: int,
+                 monsters: Sequence[Tuple[str, str, int]]):
+        self.player_name = player_name
+        self.player_max_hp = player_max_hp
+        self.player_max_mp = player_max_mp
+        # 怪物 (名称, 品质, 最大HP)，序号即事件中的行动方/目标
+        self.monsters = list(monsters)
+        self.round = 0
+        self.events: List[Event] = []
+
+    def add(self, code: int, actor: Optional[int] = None, target: Optional[int] = None,
+            amount: int = 0, extra=None):
+        self.events.append((self.round, actor, target, code, amount, extra))
+
+    def to_wire(self) -> dict:
+        """客户端渲染用的紧凑格式"""
+        return {
+            "player": [self.player_name, self.player_max_hp, self.player_max_mp],
+            "monsters": self.monsters,
+            "events": self.events,
+        }
+
+    def render(self) -> List[str]:
+        """生成旧版日志文字"""
+        names = {PLAYER: "你"}
+        for idx, (name, _, _) in enumerate(self.monsters):
+            names[idx] = name
+        lines = []
+        for event in self.events:
+            code = event[3]
+            # 召唤物名称随召唤事件变化
+            if code == SUMMON_JOIN:
+                names[SUMMON] = event[5]
+            elif code == SUMMON_CAST:
+                names[SUMMON] = event[5][0]
+            lines.append(_RENDERERS[code](self, event, names))
+        return lines
+
+    def _hp_list(self, hps: Sequence[int]) -> str:
+        return "|".join(f"#{idx}{name}[{quality}]:{max(0, hp)}/{max_hp}"
+                        for idx, ((name, quality, max_hp), hp) in enumerate(zip(self.monsters, hps)))
+
+
+def _tags(tags) -> str:
+    return f" [{'/'.join(render_effect_tag(tag) for tag in tags)}]" if tags else ""
+
+
+def _equip_effects(log, event, names):
+    parts = []
+    for key, value in event[5]:
+        name = EFFECT_NAMES.get(key, key)
+        parts.append(f"{name}+{int(value)}" if key in _FLAT_EFFECTS else f"{name}:{int(value * 100)}%")
+    return f"⚔️ 装备特效: {', '.join(parts)}"
+
+
+def _status(log, event, names):
+    mp, hps, summon = event[5]
+    summon_info = f"|SUMMON:{summon[0]}:{summon[1]}/{summon[2]}" if summon else ""
+    return (f"COMBAT_STATUS|{event[4]}/{log.player_max_hp}|{mp}/{log.player_max_mp}|"
+            f"{log._hp_list(hps)}{summon_info}")
+
+
+def _init(log, event, names):
+    mp, hps = event[5]
+    return f"COMBAT_INIT|{event[4]}/{log.player_max_hp}|{mp}/{log.player_max_mp}|{log._hp_list(hps)}"
+
+
+def _burn_apply(log, event, names):
+    who = "所有目标" if event[2] is None else names[event[2]]
+    return f"🔥 对{who}施加灼烧! 每回合{event[4]}点火焰伤害，持续{event[5]}回合"
+
+
+_RENDERERS: Dict[int, object] = {
+    EQUIP_EFFECTS: _equip_effects,
+    START: lambda log, e, n: f"⚔️ 战斗开始: {log.player_name} vs " + ", ".join(f"{name}[{quality}]" for name, quality, _ in log.monsters),
+    INIT: _init,
+    SUMMON_JOIN: lambda log, e, n: f"🐾 {e[5]} 参战 (HP:{e[4]})",
+    ROUND: lambda log, e, n: f"--- 第{e[0]}回合 ---",
+    POISON_TICK: lambda log, e, n: f"🧪 中毒! 受到 {e[4]} 点毒伤" if e[2] == PLAYER else f"🧪 {n[e[2]]} 中毒! 受到 {e[4]} 点毒伤",
+    POISON_KILL: lambda log, e, n: f"💀 {n[e[2]]} 被毒死!",
+    BURN_TICK: lambda log, e, n: f"🔥 {n[e[2]]} 灼烧! 受到 {e[4]} 点火焰伤害",
+    BURN_KILL: lambda log, e, n: f"💀 {n[e[2]]} 被烧死!",
+    HOLY_WORD: lambda log, e, n: f"✨ 圣言术发动! {n[e[2]]} 被神圣之力瞬间消灭!",
+    STUNNED: lambda log, e, n: "😵 你被眩晕，无法行动!" if e[1] == PLAYER else f"😵 {n[e[1]]} 被眩晕，无法行动!",
+    POTION_HP: lambda log, e, n: f"🧪 自动使用 {e[5]} 恢复 {e[4]} HP",
+    POTION_MP: lambda log, e, n: f"🧪 自动使用 {e[5]} 恢复 {e[4]} MP",
+    SUMMON_CAST: lambda log, e, n: f"召唤: {e[5][0]} (HP:{e[4]} ATK:{e[5][1]})",
+    SKILL: lambda log, e, n: f"使用技能: {e[5][0]} Lv.{e[5][1]} (消耗{e[4]}MP)",
+    POISON_APPLY: lambda log, e, n: f"🧪 对{n[e[2]]}施加毒素! 每回合{e[4]}点毒伤，持续{e[5]}回合",
+    BURN_APPLY: _burn_apply,
+    HEAL: lambda log, e, n: f"恢复 {e[4]} 点生命值",
+    INVISIBLE: lambda log, e, n: f"👻 进入隐身状态，持续{e[4]}回合",
+    MAGIC_SHIELD: lambda log, e, n: f"🛡️ 魔法盾激活! 持续{e[4]}回合，减伤{e[5]}%",
+    HIT: lambda log, e, n: f"{n[e[1]]}对{n[e[2]]}造成 {e[4]} 点伤害{_tags(e[5])}",
+    SKILL_HIT: lambda log, e, n: f"你对{n[e[2]]}造成 {e[4]} 点技能伤害{_tags(e[5])}",
+    DEFEATED: lambda log, e, n: f"💀 {n[e[2]]} 被击败!",
+    DOUBLE_ATTACK: lambda log, e, n: "⚡ 触发双次攻击!",
+    MISS: lambda log, e, n: "攻击未命中!",
+    MISS_TARGET: lambda log, e, n: f"对{n[e[2]]}的攻击未命中!",
+    DODGE: lambda log, e, n: f"🌀 {n[e[2]]}闪避了攻击!",
+    SPLASH: lambda log, e, n: f"💥 溅射对{n[e[2]]}造成 {e[4]} 点伤害",
+    SUMMON_DIED: lambda log, e, n: f"💀 {n[SUMMON]} 死亡!",
+    UNSEEN: lambda log, e, n: f"👻 {n[e[1]]}无法发现隐身的你!",
+    INVISIBLE_END: lambda log, e, n: "👻 隐身状态结束",
+    SHIELD_END: lambda log, e, n: "🛡️ 魔法盾效果结束",
+    STATUS: _status,
+    VICTORY: lambda log, e, n: f"🎉 胜利! 获得 {e[4]} 经验, {e[5]} 金币",
+    ITEM: lambda log, e, n: f"💎 获得物品: {e[5]}",
+    DEFEAT: lambda log, e, n: "💀 战斗失败...",
+    FAST_FORWARD: lambda log, e, n: f"⚡ 碾压战斗: {e[4]}回合结束 (消耗 {e[5][0]} HP / {e[5][1]} MP)",
+}
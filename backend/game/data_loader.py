@@ -1,15 +1,114 @@
 import json
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, Optional, Tuple
 
 # 获取项目根目录（backend/game/data_loader.py -> 项目根目录）
 PROJECT_ROOT = Path(__file__).parent.parent.parent
 DATA_DIR = PROJECT_ROOT / "data"
 
+# 物品数据文件（按查找优先级排列，重复ID时靠前的文件生效）
+ITEM_FILES = [
+    "items/weapons_new.json",
+    "items/armors_new.json",
+    "items/consumables.json",
+    "items/accessories.json",
+    "items/set_items.json",
+    "items/runes.json",
+]
+
+
+@dataclass(frozen=True)
+class ItemRecord:
+    """物品目录记录（不可变）"""
+    item_id: str
+    source: str
+    type: Optional[str]
+    slot: Optional[str]
+    tier: Optional[int]
+    set_id: Optional[str]
+    classes: Tuple[str, ...]
+    data: dict
+
+
+class ItemCatalog:
+    """统一物品目录 - 启动时构建一次，item_id -> ItemRecord 的O(1)索引"""
+
+    def __init__(self, sources: Dict[str, dict]):
+        self.records: Dict[str, ItemRecord] = {}
+        self.by_type: Dict[str, Tuple[str, ...]] = {}
+        self.by_slot: Dict[str, Tuple[str, ...]] = {}
+        self.by_tier: Dict[int, Tuple[str, ...]] = {}
+        self.by_set: Dict[str, Tuple[str, ...]] = {}
+        self.by_class: Dict[str, Tuple[str, ...]] = {}
+        # 跨文件重复的物品ID {item_id: (file1, file2, ...)}
+        self.duplicates: Dict[str, Tuple[str, ...]] = {}
+        # 重复且内容不一致的物品ID
+        self.conflicts: Dict[str, Tuple[str, ...]] = {}
+
+        indexes = {"type": {}, "slot": {}, "tier": {}, "set_id": {}, "class": {}}
+        for source, items in sources.items():
+            for item_id, data in items.items():
+                existing = self.records.get(item_id)
+                if existing:
+                    self.duplicates[item_id] = self.duplicates.get(item_id, (existing.source,)) + (source,)
+                    if existing.data != data:
+                        self.conflicts[item_id] = self.duplicates[item_id]
+                    continue
+
+                record = self._make_record(item_id, source, data)
+                self.records[item_id] = record
+
+                for key, value in (("type", record.type), ("slot", record.slot),
+                                   ("tier", record.tier), ("set_id", record.set_id)):
+                    if value is not None:
+                        indexes[key].setdefault(value, []).append(item_id)
+                for char_class in record.classes:
+                    indexes["class"].setdefault(char_class, []).append(item_id)
+
+        self.by_type = {k: tuple(v) for k, v in indexes["type"].items()}
+        self.by_slot = {k: tuple(v) for k, v in indexes["slot"].items()}
+        self.by_tier = {k: tuple(v) for k, v in indexes["tier"].items()}
+        self.by_set = {k: tuple(v) for k, v in indexes["set_id"].items()}
+        self.by_class = {k: tuple(v) for k, v in indexes["class"].items()}
+
+    @staticmethod
+    def _make_record(item_id: str, source: str, data: dict) -> ItemRecord:
+        """从原始JSON数据构建物品记录"""
+        classes = data.get("class")
+        if isinstance(classes, str):
+            classes = (classes,)
+        elif classes:
+            classes = tuple(classes)
+        else:
+            classes = ()
+        return ItemRecord(
+            item_id=item_id,
+            source=source,
+            type=data.get("type"),
+            slot=data.get("slot"),
+            tier=data.get("tier"),
+            set_id=data.get("set_id"),
+            classes=classes,
+            data=data,
+        )
+
+    def get(self, item_id: str) -> Optional[ItemRecord]:
+        """按ID获取物品记录"""
+        return self.records.get(item_id)
+
+    def __contains__(self, item_id: str) -> bool:
+        return item_id in self.records
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+
 class DataLoader:
     """游戏数据加载器"""
 
     _cache: Dict[str, Any] = {}
+    _item_catalog: Optional[ItemCatalog] = None
 
     @classmethod
     def load(cls, path: str) -> dict:
@@ -32,15 +131,34 @@ class DataLoader:
         monsters = cls.load("monsters/monsters.json")
         return monsters.get(monster_id, {})
     
+    @classmethod
+    def build_item_catalog(cls) -> ItemCatalog:
+        """构建统一物品目录（启动时调用一次）"""
+        catalog = ItemCatalog({file: cls.load(file) for file in ITEM_FILES})
+        if catalog.conflicts:
+            print(f"[WARNING] DataLoader: {len(catalog.conflicts)} item ids defined differently across files, "
+                  f"first file wins: {', '.join(sorted(catalog.conflicts)[:10])}")
+        cls._item_catalog = catalog
+        return catalog
+
+    @classmethod
+    def get_item_catalog(cls) -> ItemCatalog:
+        """获取统一物品目录（未构建时自动构建）"""
+        if cls._item_catalog is None:
+            return cls.build_item_catalog()
+        return cls._item_catalog
+
     @classmethod
     def get_item(cls, item_id: str) -> dict:
         """获取物品数据"""
-        # 搜索所有物品文件
-        for file in ["items/weapons_new.json", "items/armors_new.json", "items/consumables.json", "items/accessories.json", "items/set_items.json", "items/runes.json"]:
-            items = cls.load(file)
-            if item_id in items:
-                return items[item_id]
-        return {}
+        catalog = cls._item_catalog or cls.get_item_catalog()
+        record = catalog.records.get(item_id)
+        return record.data if record else {}
+
+    @classmethod
+    def get_item_record(cls, item_id: str) -> Optional[ItemRecord]:
+        """获取物品目录记录"""
+        return cls.get_item_catalog().get(item_id)
     
     @classmethod
     def get_skill(cls, skill_id: str, char_class: str = None) -> dict:
@@ -117,6 +235,7 @@ class DataLoader:
     def clear_cache(cls):
         """清除缓存"""
         cls._cache.clear()
+        cls._item_catalog = None
 
     # ========== 符文之语系统 ==========
 
@@ -0,0 +1,304 @@
+"""掉落表预编译模块 - 每种怪物的掉落在加载时编译一次，击杀时只做采样"""
+import math
+import random
+from fractions import Fraction
+from typing import Dict, List, Optional, Tuple
+
+from backend.config import game_config
+from backend.game.data_loader import DataLoader
+from backend.game.effects import AttrRoller, quality_weights
+
+# 需要生成随机属性的物品类型
+EQUIPMENT_TYPES = ("weapon", "armor", "accessory")
+
+
+def parse_rate(rate_str) -> float:
+    """解析掉率字符串（如 "1/30"）"""
+    if isinstance(rate_str, (int, float)):
+        return float(rate_str)
+    if '/' in str(rate_str):
+        return float(Fraction(rate_str))
+    return float(rate_str)
+
+
+def rune_drop_group(monster_level: int) -> str:
+    """根据怪物等级获取自动附加的符文掉落组"""
+    rune_tier = min(16, max(1, (monster_level - 1) // 5 + 1))
+    return f"runes_tier_{rune_tier}"
+
+
+class AliasTable:
+    """Walker别名表 - O(1)离散分布采样"""
+
+    __slots__ = ("outcomes", "prob", "alias")
+
+    def __init__(self, outcomes: List[str], weights: List[float]):
+        n = len(outcomes)
+        total = sum(weights)
+        scaled = [w * n / total for w in weights]
+        prob = [1.0] * n
+        alias = list(range(n))
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+            prob[s] = scaled[s]
+            alias[s] = l
+            scaled[l] = scaled[l] + scaled[s] - 1.0
+            if scaled[l] < 1.0:
+                small.append(l)
+            else:
+                large.append(l)
+
+        self.outcomes = tuple(outcomes)
+        self.prob = tuple(prob)
+        self.alias = tuple(alias)
+
+    def sample(self, rng=random) -> str:
+        """采样一个结果"""
+        i = int(rng.random() * len(self.outcomes))
+        if rng.random() < self.prob[i]:
+            return self.outcomes[i]
+        return self.outcomes[self.alias[i]]
+
+
+# 品质别名表缓存 {base_rate: AliasTable}
+_quality_tables: Dict[float, AliasTable] = {}
+
+
+def _cumulative_distribution(qualities: List[str], weights: List[float]) -> Tuple[List[str], List[float]]:
+    """计算 roll_quality 累加扫描实际产生的概率分布
+
+    掉率大于1时（如哥布林放大后）高品质权重可能为负，累加扫描的结果不等于按权重归一化，
+    这里按区间精确还原，保证别名表与原算法同分布。
+    """
+    total = sum(weights)
+    if total == 0:
+        # roll恒为0，返回第一个累加值大于0的品质
+        cumulative = 0
+        for q, w in zip(qualities, weights):
+            cumulative += w
+            if 0 < cumulative:
+                return [q], [1.0]
+        return ["white"], [1.0]
+
+    lo, hi = min(0.0, total), max(0.0, total)
+    covered = float("-inf")
+    cumulative = 0
+    result = {}
+    for q, w in zip(qualities, weights):
+        cumulative += w
+        length = min(cumulative, hi) - max(covered, lo)
+        if length > 0:
+            result[q] = result.get(q, 0) + length
+        covered = max(covered, cumulative)
+    # 所有累加值都未超过roll时回退为白色
+    length = hi - max(covered, lo)
+    if length > 0:
+        result["white"] = result.get("white", 0) + length
+    return list(result), list(result.values())
+
+
+def quality_table(base_rate: float) -> AliasTable:
+    """获取指定基础掉率的品质采样表（与 roll_quality 使用同一权重公式）"""
+    table = _quality_tables.get(base_rate)
+    if table is None:
+        qualities, weights = _cumulative_distribution(*quality_weights(base_rate))
+        table = AliasTable(qualities, weights)
+        _quality_tables[base_rate] = table
+    return table
+
+
+class DropEntry:
+    """单个掉落候选项（编译后）"""
+
+    __slots__ = ("item_id", "base_rate", "goblin_scalable", "base_item", "attrs")
+
+    def __init__(self, item_id: str, base_rate: float, goblin_scalable: bool, base_item: Optional[dict]):
+        self.item_id = item_id
+        self.base_rate = base_rate
+        # 直接掉落只有分数形式的掉率会被哥布林倍数放大
+        self.goblin_scalable = goblin_scalable
+        # 装备类物品的模板数据和随机属性掷骰器，非装备为None
+        self.base_item = base_item
+        self.attrs = AttrRoller(base_item) if base_item is not None else None
+
+
+def _compile_entry(drop: dict, default_rate: float = 0.1) -> DropEntry:
+    """编译单条掉落配置"""
+    item_id = drop.get("item")
+    rate = drop.get("rate", default_rate)
+    base_item = DataLoader.get_item(item_id)
+    if not base_item or base_item.get("type") not in EQUIPMENT_TYPES:
+        base_item = None
+    return DropEntry(item_id, parse_rate(rate), "/" in str(rate), base_item)
+
+
+class CompiledDropTable:
+    """编译后的怪物掉落表
+
+    直接掉落和掉落组中的每个候选项独立判定，与原逐项 random() 的概率一致；
+    相同最终掉率的候选项分为一桶，桶内用几何分布跳跃采样，只需 (命中数+1) 次随机数。
+    """
+
+    def __init__(self, monster_id: Optional[str], direct: List[DropEntry], grouped: List[DropEntry]):
+        self.monster_id = monster_id
+        self.direct = tuple(direct)
+        self.grouped = tuple(grouped)
+        # 变体缓存 {(品质掉率加成, 哥布林倍数): ((最终掉率, log(1-p), 候选项, 品质表), ...)}
+        self._variants: Dict[Tuple[float, float], tuple] = {}
+
+    def _build_variant(self, quality_bonus: float, goblin_multiplier: float) -> tuple:
+        """预计算某个品质/哥布林组合下的最终掉率分桶"""
+        global_mult = game_config.DROP_RATE_MULTIPLIER
+        buckets: Dict[Tuple[float, float], List[DropEntry]] = {}
+
+        for entry in self.direct:
+            # 哥布林直接掉落的基础掉率本身被放大，品质判定也使用放大后的掉率
+            base = entry.base_rate * goblin_multiplier if entry.goblin_scalable else entry.base_rate
+            final = min(1.0, base * quality_bonus * global_mult)
+            buckets.setdefault((final, base), []).append(entry)
+
+        for entry in self.grouped:
+            final = min(1.0, entry.base_rate * quality_bonus * global_mult * goblin_multiplier)
+            buckets.setdefault((final, entry.base_rate), []).append(entry)
+
+        variant = []
+        for (final, quality_rate), entries in buckets.items():
+            if final <= 0:
+                continue
+            log_q = math.log1p(-final) if final < 1.0 else 0.0
+            variant.append((final, log_q, tuple(entries), quality_table(quality_rate)))
+        return tuple(variant)
+
+    def roll(self, quality_bonus: float = 1.0, goblin_multiplier: float = 1, rng=random,
+             count: int = 1) -> List[dict]:
+        """掷骰 count 次击杀（同种同品质的怪物）的掉落
+
+        多次击杀的同一桶候选项首尾相接成 count*n 个独立判定，一次几何跳跃走完，
+        与逐次掷骰同分布，随机数只需 (总命中数+1) 个。
+        """
+        key = (quality_bonus, goblin_multiplier)
+        variant = self._variants.get(key)
+        if variant is None:
+            variant = self._build_variant(quality_bonus, goblin_multiplier)
+            self._variants[key] = variant
+
+        drops = []
+        for final, log_q, entries, qualities in variant:
+            if final >= 1.0:
+                for _ in range(count):
+                    for entry in entries:
+                        drops.append(_make_drop(entry, qualities, rng))
+                continue
+            # 几何跳跃：直接跳到下一个命中的候选项
+            n = len(entries)
+            total = n * count
+            i = -1
+            while True:
+                i += 1 + int(math.log(1.0 - rng.random()) / log_q)
+                if i >= total:
+                    break
+                drops.append(_make_drop(entries[i % n], qualities, rng))
+        return drops
+
+
+def _make_drop(entry: DropEntry, qualities: AliasTable, rng=random) -> dict:
+    """生成掉落物品（装备生成随机属性）"""
+    quality = qualities.sample(rng)
+    random_attrs = None
+    if entry.attrs is not None:
+        random_attrs = entry.attrs.roll(quality, rng)[0]
+    return {"item_id": entry.item_id, "quality": quality, "random_attrs": random_attrs}
+
+
+class DropTables:
+    """掉落表注册中心 - 按怪物类型缓存编译结果"""
+
+    _tables: Dict[str, CompiledDropTable] = {}
+    # calculate_drops_from_groups 使用的合并掉落表缓存
+    _merged: Dict[tuple, List[Tuple[DropEntry, AliasTable]]] = {}
+
+    @classmethod
+    def compile(cls, monster: dict, monster_id: Optional[str] = None) -> CompiledDropTable:
+        """编译单个怪物的掉落表"""
+        direct = [_compile_entry(drop) for drop in monster.get("drops", [])]
+
+        drop_groups = monster.get("drop_groups", [])
+        rune_group = rune_drop_group(monster.get("level", 1))
+        if rune_group not in drop_groups:
+            drop_groups = list(drop_groups) + [rune_group]
+
+        grouped = []
+        for group_id in drop_groups:
+            group = DataLoader.get_drop_group(group_id)
+            for drop in group.get("drops", []):
+                grouped.append(_compile_entry(drop))
+
+        return CompiledDropTable(monster_id, direct, grouped)
+
+    @classmethod
+    def warm(cls):
+        """加载时预编译所有怪物的掉落表"""
+        monsters = DataLoader.load("monsters/monsters.json")
+        for monster_id, monster in monsters.items():
+            cls._tables[monster_id] = cls.compile(monster, monster_id)
+
+    @classmethod
+    def get(cls, monster_id: str) -> Optional[CompiledDropTable]:
+        """按怪物类型获取掉落表"""
+        table = cls._tables.get(monster_id)
+        if table is None:
+            monster = DataLoader.get_monster(monster_id)
+            if not monster:
+                return None
+            table = cls.compile(monster, monster_id)
+            cls._tables[monster_id] = table
+        return table
+
+    @classmethod
+    def for_monster(cls, monster: dict) -> CompiledDropTable:
+        """获取战斗中怪物的掉落表（无 monster_id 的临时怪物即时编译）"""
+        monster_id = monster.get("monster_id")
+        if monster_id:
+            table = cls.get(monster_id)
+            if table is not None:
+                return table
+        return cls.compile(monster)
+
+    @classmethod
+    def merged(cls, drop_groups: List[str], monster_drops: List[dict]) -> List[Tuple[DropEntry, AliasTable]]:
+        """合并怪物掉落与掉落组，同一物品的掉率按 1-(1-p1)(1-p2) 合并"""
+        key = (tuple(drop_groups), tuple((d.get("item"), str(d.get("rate", 0))) for d in monster_drops))
+        table = cls._merged.get(key)
+        if table is not None:
+            return table
+
+        rates: Dict[str, float] = {}
+        entries: Dict[str, DropEntry] = {}
+        sources = list(monster_drops)
+        for group_id in drop_groups:
+            sources.extend(DataLoader.get_drop_group(group_id).get("drops", []))
+        for drop in sources:
+            entry = _compile_entry(drop, default_rate=0)
+            if entry.item_id in rates:
+                rates[entry.item_id] = 1 - (1 - rates[entry.item_id]) * (1 - entry.base_rate)
+            else:
+                rates[entry.item_id] = entry.base_rate
+                entries[entry.item_id] = entry
+
+        table = []
+        for item_id, rate in rates.items():
+            entry = entries[item_id]
+            table.append((DropEntry(item_id, rate, False, entry.base_item), quality_table(rate)))
+        cls._merged[key] = table
+        return table
+
+    @classmethod
+    def clear(cls):
+        """清除所有编译结果"""
+        cls._tables.clear()
+        cls._merged.clear()
+        _quality_tables.clear()
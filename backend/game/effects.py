@@ -67,6 +67,34 @@ EFFECT_NAMES = {
     "crit_damage": "暴伤",
 }
 
+# 特效标签 (标签, *数值) 的显示格式，战斗日志只在需要时才格式化
+EFFECT_TAG_FORMATS = {
+    "miss": "攻击未命中!",
+    "dodge": "攻击被闪避!",
+    "crit": "暴击x{0:.1f}",
+    "crush": "压碎x{0:.1f}",
+    "extra_phys": "附伤+{0}",
+    "extra_magic": "魔伤+{0}",
+    "block": "攻击被格挡!",
+    "lifesteal": "吸血+{0}HP",
+    "hp_on_hit": "击回+{0}HP",
+    "mp_on_hit": "击回+{0}MP",
+    "reflect": "反弹{0}",
+    "stun": "眩晕",
+    "poison": "毒伤{0}x{1}回合",
+    "double": "双击",
+    # 受击方的防御特效
+    "guard": "格挡",
+    "reduction": "减伤{0}%",
+    "shield": "魔法盾减伤{0}%",
+}
+
+
+def render_effect_tag(tag: tuple) -> str:
+    """特效标签格式化为文字"""
+    return EFFECT_TAG_FORMATS[tag[0]].format(*tag[1:])
+
+
 @dataclass
 class EffectResult:
     """特效计算结果"""
@@ -84,7 +112,61 @@ class EffectResult:
     poison_damage: int = 0
     poison_rounds: int = 0
     extra_attacks: int = 0
-    logs: List[str] = field(default_factory=list)
+    # 触发的特效标签，如 ("crit", 1.5)
+    tags: List[tuple] = field(default_factory=list)
+
+    @property
+    def logs(self) -> List[str]:
+        return [render_effect_tag(tag) for tag in self.tags]
+
+# 装备特效汇总的键（顺序即日志中的显示顺序）
+EFFECT_KEYS = (
+    "double_attack", "hit_rate", "dodge_rate", "crush_rate", "lifesteal", "reflect",
+    "hp_on_hit", "mp_on_hit", "block_rate", "block_amount", "extra_phys", "extra_magic",
+    "damage_reduction", "stun_rate", "splash_rate", "poison_damage", "poison_rounds",
+    "ignore_defense", "ignore_magic_def", "crit_rate", "crit_damage",
+)
+
+
+class EffectProfile:
+    """编译后的特效汇总 - 每场战斗每个参战者只构建一次
+
+    除各特效的汇总值外，还预先算好命中、暴击、格挡等概率和上限，
+    process_attack 直接读取属性，不再每次攻击都重新汇总装备。
+    兼容字典用法（get/items），可传给所有接收特效字典的函数。
+    """
+
+    __slots__ = EFFECT_KEYS + (
+        "hit_chance", "dodge_chance", "crit_chance", "crit_mult",
+        "block_chance", "block_ratio", "reduction", "lifesteal_ratio",
+    )
+
+    def __init__(self, effects: Optional[dict] = None):
+        effects = effects or {}
+        for key in EFFECT_KEYS:
+            setattr(self, key, effects.get(key, 0))
+        self.hit_chance = EFFECT_CONFIG["default_hit_rate"] + self.hit_rate
+        self.dodge_chance = EFFECT_CONFIG["default_dodge_rate"] + self.dodge_rate
+        self.crit_chance = EFFECT_CONFIG["default_crit_rate"] + self.crit_rate
+        self.crit_mult = EFFECT_CONFIG["crit_multiplier"] + self.crit_damage
+        self.block_chance = min(self.block_rate, EFFECT_CONFIG["max_block_rate"])
+        self.block_ratio = min(self.block_amount, EFFECT_CONFIG["max_block_amount"])
+        self.reduction = min(self.damage_reduction, EFFECT_CONFIG["max_damage_reduction"])
+        self.lifesteal_ratio = min(self.lifesteal, EFFECT_CONFIG["max_lifesteal"])
+
+    @classmethod
+    def from_equipment(cls, equipment: List[dict]) -> "EffectProfile":
+        return cls(EffectCalculator.get_equipment_effects(equipment))
+
+    def get(self, key: str, default=None):
+        return getattr(self, key, default)
+
+    def items(self):
+        return ((key, getattr(self, key)) for key in EFFECT_KEYS)
+
+    def to_dict(self) -> dict:
+        return dict(self.items())
+
 
 class EffectCalculator:
     """特效计算器 - 处理所有装备特效"""
@@ -92,29 +174,7 @@ class EffectCalculator:
     @staticmethod
     def get_equipment_effects(equipment: List[dict]) -> dict:
         """从装备列表中汇总所有特效"""
-        effects = {
-            "double_attack": 0,      # 双次攻击几率
-            "hit_rate": 0,           # 命中率加成
-            "dodge_rate": 0,         # 闪避率加成
-            "crush_rate": 0,         # 压碎几率
-            "lifesteal": 0,          # 吸血比例
-            "reflect": 0,            # 反弹比例
-            "hp_on_hit": 0,          # 击中回复HP
-            "mp_on_hit": 0,          # 击中回复MP
-            "block_rate": 0,         # 格挡几率
-            "block_amount": 0,       # 格挡伤害比例
-            "extra_phys": 0,         # 附加物理伤害
-            "extra_magic": 0,        # 附加魔法伤害
-            "damage_reduction": 0,   # 减伤比例
-            "stun_rate": 0,          # 眩晕几率
-            "splash_rate": 0,        # 溅射比例
-            "poison_damage": 0,      # 毒伤每回合
-            "poison_rounds": 0,      # 毒伤持续回合
-            "ignore_defense": 0,     # 忽略防御比例
-            "ignore_magic_def": 0,   # 忽略魔御比例
-            "crit_rate": 0,          # 暴击率加成
-            "crit_damage": 0,        # 暴击伤害加成
-        }
+        effects = dict.fromkeys(EFFECT_KEYS, 0)
         
         for equip in equipment:
             if not equip:
@@ -128,46 +188,46 @@ class EffectCalculator:
         return effects
     
     @staticmethod
-    def calculate_hit(attacker_effects: dict, defender_effects: dict) -> Tuple[bool, bool]:
+    def calculate_hit(attacker_effects: dict, defender_effects: dict, rng=random) -> Tuple[bool, bool]:
         """计算命中和闪避，返回 (是否命中, 是否闪避)"""
         hit_rate = EFFECT_CONFIG["default_hit_rate"] + attacker_effects.get("hit_rate", 0)
         dodge_rate = EFFECT_CONFIG["default_dodge_rate"] + defender_effects.get("dodge_rate", 0)
         
         # 命中判定
-        if random.random() > hit_rate:
+        if rng.random() > hit_rate:
             return False, False  # 未命中
         
         # 闪避判定
-        if random.random() < dodge_rate:
+        if rng.random() < dodge_rate:
             return True, True  # 命中但被闪避
         
         return True, False  # 命中且未闪避
     
     @staticmethod
-    def calculate_crit(attacker_effects: dict) -> Tuple[bool, float]:
+    def calculate_crit(attacker_effects: dict, rng=random) -> Tuple[bool, float]:
         """计算暴击，返回 (是否暴击, 暴击倍率)"""
         crit_rate = EFFECT_CONFIG["default_crit_rate"] + attacker_effects.get("crit_rate", 0)
         crit_mult = EFFECT_CONFIG["crit_multiplier"] + attacker_effects.get("crit_damage", 0)
         
-        if random.random() < crit_rate:
+        if rng.random() < crit_rate:
             return True, crit_mult
         return False, 1.0
     
     @staticmethod
-    def calculate_crush(attacker_effects: dict) -> Tuple[bool, float]:
+    def calculate_crush(attacker_effects: dict, rng=random) -> Tuple[bool, float]:
         """计算压碎，返回 (是否压碎, 压碎倍率)"""
         crush_rate = attacker_effects.get("crush_rate", 0)
-        if crush_rate > 0 and random.random() < crush_rate:
+        if crush_rate > 0 and rng.random() < crush_rate:
             return True, EFFECT_CONFIG["crush_multiplier"]
         return False, 1.0
     
     @staticmethod
-    def calculate_block(defender_effects: dict, damage: int) -> Tuple[bool, int]:
+    def calculate_block(defender_effects: dict, damage: int, rng=random) -> Tuple[bool, int]:
         """计算格挡，返回 (是否格挡, 格挡后伤害)"""
         block_rate = min(defender_effects.get("block_rate", 0), EFFECT_CONFIG["max_block_rate"])
         block_amount = min(defender_effects.get("block_amount", 0.2), EFFECT_CONFIG["max_block_amount"])
         
-        if block_rate > 0 and random.random() < block_rate:
+        if block_rate > 0 and rng.random() < block_rate:
             blocked_damage = int(damage * (1 - block_amount))
             return True, max(int(damage * 0.7), blocked_damage)  # 格挡最多减少30%伤害
         return False, damage
@@ -196,10 +256,10 @@ class EffectCalculator:
         return attacker_effects.get("hp_on_hit", 0), attacker_effects.get("mp_on_hit", 0)
     
     @staticmethod
-    def calculate_stun(attacker_effects: dict) -> bool:
+    def calculate_stun(attacker_effects: dict, rng=random) -> bool:
         """计算是否眩晕"""
         stun_rate = attacker_effects.get("stun_rate", 0)
-        return stun_rate > 0 and random.random() < stun_rate
+        return stun_rate > 0 and rng.random() < stun_rate
     
     @staticmethod
     def calculate_splash(attacker_effects: dict, damage: int) -> int:
@@ -227,31 +287,36 @@ class EffectCalculator:
         return attacker_effects.get("extra_phys", 0), attacker_effects.get("extra_magic", 0)
     
     @staticmethod
-    def check_double_attack(attacker_effects: dict) -> int:
+    def check_double_attack(attacker_effects: dict, rng=random) -> int:
         """检查双次攻击，返回额外攻击次数"""
         double_rate = attacker_effects.get("double_attack", 0)
-        if double_rate > 0 and random.random() < double_rate:
+        if double_rate > 0 and rng.random() < double_rate:
             return 1
         return 0
     
     @classmethod
     def process_attack(cls, attacker: dict, defender: dict, base_damage: int, 
                        attacker_equip: List[dict] = None, defender_equip: List[dict] = None,
-                       is_magic: bool = False) -> EffectResult:
-        """处理一次完整的攻击，应用所有特效"""
+                       is_magic: bool = False, attacker_profile: EffectProfile = None,
+                       defender_profile: EffectProfile = None, rng=random) -> EffectResult:
+        """处理一次完整的攻击，应用所有特效
+        
+        战斗中应传入预先编译的 attacker_profile/defender_profile，
+        未传入时才从装备列表汇总。
+        """
         result = EffectResult()
-        atk_fx = cls.get_equipment_effects(attacker_equip or [])
-        def_fx = cls.get_equipment_effects(defender_equip or [])
+        atk_fx = attacker_profile or EffectProfile.from_equipment(attacker_equip or [])
+        def_fx = defender_profile or EffectProfile.from_equipment(defender_equip or [])
+        tags = result.tags
         
         # 1. 命中/闪避判定
-        hit, dodged = cls.calculate_hit(atk_fx, def_fx)
-        if not hit:
+        if rng.random() > atk_fx.hit_chance:
             result.is_missed = True
-            result.logs.append("攻击未命中!")
+            tags.append(("miss",))
             return result
-        if dodged:
+        if rng.random() < def_fx.dodge_chance:
             result.is_dodged = True
-            result.logs.append("攻击被闪避!")
+            tags.append(("dodge",))
             return result
         
         damage = base_damage
@@ -259,83 +324,81 @@ class EffectCalculator:
         # 2. 忽略防御计算（已在base_damage计算时考虑）
         
         # 3. 暴击判定
-        is_crit, crit_mult = cls.calculate_crit(atk_fx)
-        if is_crit:
-            damage = int(damage * crit_mult)
+        if rng.random() < atk_fx.crit_chance:
+            damage = int(damage * atk_fx.crit_mult)
             result.is_crit = True
-            result.logs.append(f"暴击x{crit_mult:.1f}")
+            tags.append(("crit", atk_fx.crit_mult))
         
         # 4. 压碎判定
-        is_crush, crush_mult = cls.calculate_crush(atk_fx)
-        if is_crush:
+        if atk_fx.crush_rate > 0 and rng.random() < atk_fx.crush_rate:
+            crush_mult = EFFECT_CONFIG["crush_multiplier"]
             damage = int(damage * crush_mult)
             result.is_crush = True
-            result.logs.append(f"压碎x{crush_mult:.1f}")
+            tags.append(("crush", crush_mult))
         
         # 5. 附加伤害
-        extra_phys, extra_magic = cls.get_extra_damage(atk_fx)
-        if extra_phys > 0:
-            damage += int(extra_phys)
-            result.logs.append(f"附伤+{int(extra_phys)}")
-        if extra_magic > 0:
-            damage += int(extra_magic)
-            result.logs.append(f"魔伤+{int(extra_magic)}")
+        if atk_fx.extra_phys > 0:
+            damage += int(atk_fx.extra_phys)
+            tags.append(("extra_phys", int(atk_fx.extra_phys)))
+        if atk_fx.extra_magic > 0:
+            damage += int(atk_fx.extra_magic)
+            tags.append(("extra_magic", int(atk_fx.extra_magic)))
         
-        # 6. 格挡判定
-        blocked, damage = cls.calculate_block(def_fx, damage)
-        if blocked:
+        # 6. 格挡判定（格挡最多减少30%伤害）
+        if def_fx.block_chance > 0 and rng.random() < def_fx.block_chance:
+            damage = max(int(damage * 0.7), int(damage * (1 - def_fx.block_ratio)))
             result.is_blocked = True
-            result.logs.append("攻击被格挡!")
+            tags.append(("block",))
         
-        # 7. 减伤
-        damage = cls.apply_damage_reduction(def_fx, damage)
+        # 7. 减伤（最多减少30%伤害）
+        damage = max(int(damage * 0.7), int(damage * (1 - def_fx.reduction)))
         
         result.damage = damage
         
-        # 8. 吸血
-        lifesteal_hp = cls.calculate_lifesteal(atk_fx, damage)
+        # 8. 吸血（效果减半）
+        lifesteal_hp = int(damage * atk_fx.lifesteal_ratio * 0.5)
         if lifesteal_hp > 0:
             result.heal_hp += lifesteal_hp
-            result.logs.append(f"吸血+{lifesteal_hp}HP")
+            tags.append(("lifesteal", lifesteal_hp))
         
         # 9. 击中回复
-        hp_on_hit, mp_on_hit = cls.calculate_on_hit(atk_fx)
-        hp_on_hit = int(hp_on_hit)
-        mp_on_hit = int(mp_on_hit)
+        hp_on_hit = int(atk_fx.hp_on_hit)
+        mp_on_hit = int(atk_fx.mp_on_hit)
         if hp_on_hit > 0:
             result.heal_hp += hp_on_hit
-            result.logs.append(f"击回+{hp_on_hit}HP")
+            tags.append(("hp_on_hit", hp_on_hit))
         if mp_on_hit > 0:
             result.heal_mp += mp_on_hit
-            result.logs.append(f"击回+{mp_on_hit}MP")
+            tags.append(("mp_on_hit", mp_on_hit))
         
         # 10. 反弹伤害
-        result.reflect_damage = cls.calculate_reflect(def_fx, damage)
+        result.reflect_damage = int(damage * def_fx.reflect)
         if result.reflect_damage > 0:
-            result.logs.append(f"反弹{result.reflect_damage}")
+            tags.append(("reflect", result.reflect_damage))
         
         # 11. 眩晕判定
-        result.is_stunned = cls.calculate_stun(atk_fx)
+        result.is_stunned = atk_fx.stun_rate > 0 and rng.random() < atk_fx.stun_rate
         if result.is_stunned:
-            result.logs.append("眩晕")
+            tags.append(("stun",))
         
         # 12. 溅射伤害
-        result.splash_damage = cls.calculate_splash(atk_fx, damage)
+        result.splash_damage = int(damage * atk_fx.splash_rate)
         
         # 13. 毒伤 (1/10概率触发)
-        poison_dmg, poison_rounds = cls.get_poison(atk_fx)
-        if poison_dmg > 0 and poison_rounds > 0 and random.randint(1, 10) == 1:
-            result.poison_damage = int(poison_dmg)
-            result.poison_rounds = int(poison_rounds)
-            result.logs.append(f"毒伤{int(poison_dmg)}x{int(poison_rounds)}回合")
+        if atk_fx.poison_damage > 0 and atk_fx.poison_rounds > 0 and rng.randint(1, 10) == 1:
+            result.poison_damage = int(atk_fx.poison_damage)
+            result.poison_rounds = int(atk_fx.poison_rounds)
+            tags.append(("poison", result.poison_damage, result.poison_rounds))
         
         # 14. 双次攻击
-        result.extra_attacks = cls.check_double_attack(atk_fx)
-        if result.extra_attacks > 0:
-            result.logs.append("双击")
+        if atk_fx.double_attack > 0 and rng.random() < atk_fx.double_attack:
+            result.extra_attacks = 1
+            tags.append(("double",))
         
         return result
 
+# 无装备特效的参战者（怪物等）共用，只读
+EMPTY_PROFILE = EffectProfile()
 
 def apply_quality_bonus(item: dict, quality: str) -> dict:
     """
@@ -374,8 +437,8 @@ def apply_quality_bonus(item: dict, quality: str) -> dict:
 
     return result
 
-def roll_quality(base_rate: float = 1.0) -> str:
-    """根据掉率随机品质 - 掉率越低品质越高概率"""
+def quality_weights(base_rate: float = 1.0) -> Tuple[List[str], List[float]]:
+    """根据掉率计算各品质的权重 - 掉率越低高品质权重越高"""
     weights = []
     qualities = []
 
@@ -392,9 +455,15 @@ def roll_quality(base_rate: float = 1.0) -> str:
         elif q == "blue":
             weight *= (1 + rarity_boost * 2)
         weights.append(weight)
-    
+
+    return qualities, weights
+
+
+def roll_quality(base_rate: float = 1.0, rng=random) -> str:
+    """根据掉率随机品质 - 掉率越低品质越高概率"""
+    qualities, weights = quality_weights(base_rate)
     total = sum(weights)
-    roll = random.random() * total
+    roll = rng.random() * total
     cumulative = 0
     
     for q, w in zip(qualities, weights):
@@ -470,13 +539,81 @@ def calculate_set_bonuses(equipment: list, sets_config: dict, include_full_confi
 
 # ==================== 装备随机属性系统 ====================
 
-def roll_item_attributes(item: dict, quality: str) -> dict:
+# 可随机化的数值属性
+NUMERIC_ATTRS = (
+    "attack_min", "attack_max", "magic_min", "magic_max",
+    "defense_min", "defense_max", "magic_defense_min", "magic_defense_max",
+    "hp_bonus", "mp_bonus"
+)
+
+# 整数类型特效
+INT_EFFECTS = frozenset({"poison_damage", "poison_rounds", "extra_phys", "extra_magic", "hp_on_hit", "mp_on_hit"})
+
+
+# 品质的 (属性区间, 特效区间) 缓存
+_quality_ranges: Dict[str, tuple] = {}
+
+
+def quality_ranges(quality: str) -> tuple:
+    """品质的随机属性区间和特效区间"""
+    ranges = _quality_ranges.get(quality)
+    if ranges is None:
+        config = get_quality_config(quality)
+        ranges = (config.get("attr_range", [0.95, 1.05]), config.get("effect_range", [0.95, 1.05]))
+        _quality_ranges[quality] = ranges
+    return ranges
+
+
+class AttrRoller:
+    """装备随机属性掷骰器 - 预先挑出模板中可随机化的属性和特效，掷骰时不再扫描和复制模板
+
+    掉落表编译时为每件装备建立一次；结果与随机数消耗顺序和 roll_item_attributes 相同。
+    """
+
+    __slots__ = ("numeric", "effects")
+
+    def __init__(self, item: dict):
+        self.numeric = tuple((attr, item[attr]) for attr in NUMERIC_ATTRS
+                             if item.get(attr) is not None and item[attr] > 0)
+        # (特效, 基础值, 是否整数)；模板没有 effects 字段时为None（不消耗特效倍率的随机数）
+        self.effects = None
+        if "effects" in item:
+            self.effects = tuple((key, value, key in INT_EFFECTS) for key, value in item["effects"].items()
+                                 if isinstance(value, (int, float)) and value > 0)
+
+    def roll(self, quality: str, rng=random) -> Tuple[dict, float]:
+        """返回 (存入数据库的随机属性, 属性倍率)"""
+        attr_range, effect_range = quality_ranges(quality)
+
+        # 生成随机倍率并应用到所有属性
+        attr_multiplier = rng.uniform(attr_range[0], attr_range[1])
+        random_attrs = {attr: int(value * attr_multiplier) for attr, value in self.numeric}
+
+        # 处理特效随机化：整数特效至少为1，百分比特效保留3位小数
+        if self.effects is not None:
+            effect_multiplier = rng.uniform(effect_range[0], effect_range[1])
+            random_attrs["effects"] = {
+                key: max(1, int(value * effect_multiplier)) if is_int else round(value * effect_multiplier, 3)
+                for key, value, is_int in self.effects
+            }
+            random_attrs["_effect_multiplier"] = round(effect_multiplier, 3)
+
+        return random_attrs, attr_multiplier
+
+
+def roll_random_attrs(item: dict, quality: str, rng=random) -> Tuple[dict, float]:
+    """在品质区间内掷骰装备的随机属性，返回 (存入数据库的随机属性, 属性倍率)，不复制装备模板"""
+    return AttrRoller(item).roll(quality, rng)
+
+
+def roll_item_attributes(item: dict, quality: str, rng=random) -> dict:
     """
     生成装备时，在品质区间内随机生成属性值
 
     Args:
         item: 基础装备数据（从JSON文件读取的模板）
         quality: 品质等级 (white/green/blue/purple/red/orange)
+        rng: 随机数生成器（random.Random实例，默认全局random）
 
     Returns:
         包含随机属性的装备信息，格式:
@@ -489,56 +626,14 @@ def roll_item_attributes(item: dict, quality: str) -> dict:
             ...
         }
     """
-    config = get_quality_config(quality)
-
-    # 获取区间配置
-    attr_range = config.get("attr_range", [0.95, 1.05])
-    effect_range = config.get("effect_range", [0.95, 1.05])
+    random_attrs, attr_multiplier = roll_random_attrs(item, quality, rng)
 
     result = item.copy()
-    random_attrs = {}
-
-    # 可随机化的数值属性
-    numeric_attrs = [
-        "attack_min", "attack_max", "magic_min", "magic_max",
-        "defense_min", "defense_max", "magic_defense_min", "magic_defense_max",
-        "hp_bonus", "mp_bonus"
-    ]
-
-    # 生成随机倍率并应用到所有属性
-    attr_multiplier = random.uniform(attr_range[0], attr_range[1])
-
-    for attr in numeric_attrs:
-        if attr in result and result[attr] > 0:
-            base_value = result[attr]
-            random_value = int(base_value * attr_multiplier)
-            result[attr] = random_value
-            random_attrs[attr] = random_value
-
-    # 处理特效随机化
-    if "effects" in result:
-        effects = result["effects"].copy()
-        effect_multiplier = random.uniform(effect_range[0], effect_range[1])
-
-        # 整数类型特效
-        int_effects = {"poison_damage", "poison_rounds", "extra_phys", "extra_magic", "hp_on_hit", "mp_on_hit"}
-        random_effects = {}
-
-        for key, value in effects.items():
-            if isinstance(value, (int, float)) and value > 0:
-                new_val = value * effect_multiplier
-                # 确保至少为1
-                if key in int_effects:
-                    effects[key] = max(1, int(new_val))
-                    random_effects[key] = effects[key]
-                else:
-                    # 百分比特效保留3位小数
-                    effects[key] = round(new_val, 3)
-                    random_effects[key] = effects[key]
-
-        result["effects"] = effects
-        random_attrs["effects"] = random_effects
-        random_attrs["_effect_multiplier"] = round(effect_multiplier, 3)
+    for attr, value in random_attrs.items():
+        if attr == "effects":
+            result["effects"] = {**item["effects"], **value}
+        elif not attr.startswith("_"):
+            result[attr] = value
 
     # 存储随机属性用于数据库保存
     result["_random_attrs"] = random_attrs
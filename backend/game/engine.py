@@ -1,9 +1,16 @@
 import random
-from typing import Dict, Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from backend.models import Character, InventoryItem, Equipment, CharacterSkill, StorageType
 from backend.game.map_manager import map_manager
+from backend.game.spawner import spawner
+from backend.game.state_cache import character_states
+from backend.game.stats import exp_to_next_level, level_up_gains, stat_cache
+from backend.game.combat_context import (
+    load_combat_context, increase_skills_proficiency, apply_proficiency, prepare_item
+)
+from backend.game.inventory import slot_index, inventory_key, warehouse_key
 from backend.game.combat import CombatEngine
 from backend.game.data_loader import DataLoader
 from backend.game.effects import EffectCalculator, calculate_set_bonuses, roll_item_attributes, get_item_with_attributes
@@ -29,13 +36,13 @@ class GameEngine:
         if not char:
             return {"error": "角色不存在"}
         
-        # 进入地图
-        result = map_manager.enter_map(char_id, char.map_id or "main_city")
+        # 进入地图（以缓存中的地图为准，断线重连时数据库可能尚未写回）
+        state = character_states.load(char)
+        result = map_manager.enter_map(char_id, state["map_id"] or "main_city")
         
         # 更新角色位置
-        char.pos_x = result["position"][0]
-        char.pos_y = result["position"][1]
-        await db.commit()
+        character_states.set_position(char_id, result["position"])
+        await character_states.flush([char_id])
         
         return {
             "character": cls._char_to_dict(char),
@@ -51,11 +58,8 @@ class GameEngine:
         result = map_manager.move(char_id, (x, y))
         
         if result.get("success"):
-            char = await db.get(Character, char_id)
-            if char:
-                char.pos_x = x
-                char.pos_y = y
-                await db.commit()
+            # 位置只写缓存，由写回任务批量持久化
+            character_states.set_position(char_id, (x, y))
         
         return result
     
@@ -107,23 +111,69 @@ class GameEngine:
         "sunwell_plateau": "kiljaeden",
     }
     
+    @classmethod
+    def roll_goblin(cls, map_id: str, rng=random) -> Optional[dict]:
+        """检查是否遇到哥布林 (1/5概率)，遇到时返回哥布林怪物数据"""
+        if rng.randint(1, 5) == 1 and map_id in cls.MAP_BOSS_MAPPING:
+            boss_type = cls.MAP_BOSS_MAPPING[map_id]
+            boss_info = DataLoader.get_monster(boss_type)
+            if boss_info:
+                goblin_monster = boss_info.copy()
+                goblin_monster["name"] = "哥布林"
+                goblin_monster["is_goblin"] = True
+                # 使用Boss的预编译掉落表（含drop_groups，确保掉落装备）
+                goblin_monster["monster_id"] = boss_type
+                # 标记哥布林掉率倍数：直接掉落和掉落组的掉率均提升10倍
+                goblin_monster["goblin_drop_multiplier"] = 10
+                return goblin_monster
+        return None
+    
+    @classmethod
+    def encounter_monsters(cls, map_id: str, monster_data: dict, monster_info: dict, level: int,
+                           goblin_monster: Optional[dict] = None, rng=random) -> List[dict]:
+        """生成一次遭遇的怪物（1-6个，根据角色等级），遇到哥布林时替换第一个怪物"""
+        if goblin_monster:
+            monsters = [goblin_monster]
+            monsters[0]["quality"] = "white"  # 哥布林使用普通品质
+        else:
+            monsters = [monster_info.copy()]
+            monsters[0]["monster_id"] = monster_data["type"]
+            monsters[0]["quality"] = monster_data.get("quality", "white")
+        
+        # 随机添加额外怪物（最多5个额外）- Boss战斗时额外怪物为同地图普通怪
+        extra_count = rng.randint(0, min(5, level // 10))
+        if extra_count > 0:
+            map_config = map_manager.map_configs.get(map_id, {})
+            normal_monster_types = map_config.get("monsters", [])
+            for _ in range(extra_count):
+                if monster_data.get("is_boss") and normal_monster_types:
+                    extra_type = rng.choice(normal_monster_types)
+                    extra_info = DataLoader.get_monster(extra_type)
+                    if extra_info:
+                        extra_monster = extra_info.copy()
+                        extra_monster["monster_id"] = extra_type
+                    else:
+                        continue
+                else:
+                    extra_monster = monster_info.copy()
+                    extra_monster["monster_id"] = monster_data["type"]
+                extra_monster["quality"] = rng.choices(
+                    ["white", "green", "blue", "purple", "orange"],
+                    weights=[50, 30, 15, 4, 1]
+                )[0]
+                monsters.append(extra_monster)
+        return monsters
+    
     @classmethod
     async def attack_monster(cls, char_id: int, monster_pos: Tuple[int, int], db: AsyncSession) -> dict:
         """攻击怪物 - 支持多怪物战斗和哥布林遭遇"""
         if cls.combat_locks.get(char_id):
             return {"success": False, "error": "已在战斗中"}
         
-        char = await db.get(Character, char_id)
-        if not char:
-            return {"success": False, "error": "角色不存在"}
-        
-        map_id = map_manager.player_map.get(char_id)
-        if not map_id:
-            return {"success": False, "error": "不在地图中"}
-        
-        instance = map_manager.instances.get(map_id)
+        instance = map_manager.get_instance(char_id)
         if not instance:
-            return {"success": False, "error": "地图不存在"}
+            return {"success": False, "error": "不在地图中"}
+        map_id = instance.map_id
         
         monster_data = instance.monsters.get(monster_pos)
         if not monster_data:
@@ -133,112 +183,39 @@ class GameEngine:
         if not monster_info:
             return {"success": False, "error": "怪物数据不存在"}
         
-        # 检查是否遇到哥布林 (1/5概率)
-        goblin_encounter = False
-        goblin_monster = None
-        if random.randint(1, 5) == 1 and map_id in cls.MAP_BOSS_MAPPING:
-            boss_type = cls.MAP_BOSS_MAPPING[map_id]
-            boss_info = DataLoader.get_monster(boss_type)
-            if boss_info:
-                goblin_encounter = True
-                goblin_monster = boss_info.copy()
-                goblin_monster["name"] = "哥布林"
-                goblin_monster["is_goblin"] = True
-                # 掉落率提升10倍
-                enhanced_drops = []
-                for drop in goblin_monster.get("drops", []):
-                    new_drop = drop.copy()
-                    rate_str = str(drop.get("rate", "1/100"))
-                    if "/" in rate_str:
-                        parts = rate_str.split("/")
-                        new_rate = f"{int(parts[0]) * 10}/{parts[1]}"
-                        new_drop["rate"] = new_rate
-                    enhanced_drops.append(new_drop)
-                goblin_monster["drops"] = enhanced_drops
-                # 继承Boss的drop_groups，确保掉落装备
-                goblin_monster["drop_groups"] = boss_info.get("drop_groups", [])
-                # 标记哥布林掉率倍数（用于drop_groups掉率计算）
-                goblin_monster["goblin_drop_multiplier"] = 10
+        # 一场战斗（遭遇、战斗、掉落）使用同一个种子，记录在结果中用于复现
+        seed = random.getrandbits(32)
+        rng = random.Random(seed)
+        goblin_monster = cls.roll_goblin(map_id, rng)
         
         cls.combat_locks[char_id] = True
         
         try:
-            # 获取角色所有技能（包括被动）
-            skills_result = await db.execute(
-                select(CharacterSkill).where(CharacterSkill.character_id == char_id)
-            )
-            learned_skills = skills_result.scalars().all()
-            all_skills = []
-            for skill in learned_skills:
-                skill_info = DataLoader.get_skill(skill.skill_id, char.char_class.value)
-                if skill_info:
-                    skill_data = {**skill_info, "level": skill.level, "skill_id": skill.skill_id}
-                    all_skills.append(skill_data)
-            
-            # 获取背包中的恢复物品（使用行锁避免并发冲突）
-            inv_result = await db.execute(
-                select(InventoryItem).where(
-                    InventoryItem.character_id == char_id,
-                    InventoryItem.storage_type == StorageType.INVENTORY
-                ).with_for_update()
-            )
-            inventory = []
-            for item in inv_result.scalars():
-                item_info = DataLoader.get_item(item.item_id)
-                if item_info and item_info.get("type") == "consumable":
-                    inventory.append({"slot": item.slot, "info": item_info, "db_item": item})
+            # 一次查询取回角色和背包（行锁避免并发冲突），技能/装备/战斗属性取自派生属性快照
+            context = await load_combat_context(char_id, db)
+            if context is None:
+                return {"success": False, "error": "角色不存在"}
+            char = context.char
+            snapshot = context.snapshot
+            all_skills = snapshot.combat_skills()
             
-            # 生成多怪物（1-6个，根据地图难度）
-            # 如果遇到哥布林，替换第一个怪物
-            if goblin_encounter and goblin_monster:
-                monsters = [goblin_monster]
-                monsters[0]["quality"] = "white"  # 哥布林使用普通品质
-            else:
-                monsters = [monster_info.copy()]
-                monsters[0]["quality"] = monster_data.get("quality", "white")
+            # 背包中的恢复物品
+            inventory = context.consumables()
             
-            # 随机添加额外怪物（最多5个额外）- Boss战斗时额外怪物为同地图普通怪
-            extra_count = random.randint(0, min(5, char.level // 10))
-            if extra_count > 0:
-                map_config = map_manager.map_configs.get(map_id, {})
-                normal_monster_types = map_config.get("monsters", [])
-                for _ in range(extra_count):
-                    # Boss战斗时，额外怪物从地图普通怪物中选择
-                    if monster_data.get("is_boss") and normal_monster_types:
-                        extra_type = random.choice(normal_monster_types)
-                        extra_info = DataLoader.get_monster(extra_type)
-                        if extra_info:
-                            extra_monster = extra_info.copy()
-                        else:
-                            continue
-                    else:
-                        extra_monster = monster_info.copy()
-                    extra_monster["quality"] = random.choices(
-                        ["white", "green", "blue", "purple", "orange"],
-                        weights=[50, 30, 15, 4, 1]
-                    )[0]
-                    monsters.append(extra_monster)
+            monsters = cls.encounter_monsters(map_id, monster_data, monster_info, char.level, goblin_monster, rng)
             
-            player_stats = await cls._get_combat_stats(char, db)
+            player_stats = snapshot.player_stats()
             player_stats["char_class"] = char.char_class.value
             
-            # 获取装备列表用于特效计算
-            equip_result = await db.execute(select(Equipment).where(Equipment.character_id == char_id))
-            equipment_list = []
-            for equip in equip_result.scalars():
-                item_info = get_item_with_attributes(
-                    DataLoader.get_item(equip.item_id),
-                    equip.quality,
-                    equip.random_attrs
-                )
-                if item_info:
-                    equipment_list.append({"info": item_info})
+            # 装备列表用于特效计算
+            equipment_list = snapshot.combat_equipment()
             
             # 获取召唤物和禁用技能
             summon = cls.summons.get(char_id)
             disabled = cls.disabled_skills.get(char_id, [])
             
-            result = CombatEngine.pve_combat(player_stats, monsters, all_skills, [], DataLoader, inventory, summon, disabled, equipment_list)
+            result = CombatEngine.pve_combat(player_stats, monsters, all_skills, [], DataLoader, inventory, summon, disabled,
+                                             equipment_list, seed=seed, rng=rng)
             
             # 更新召唤物状态
             if result.summon_died:
@@ -251,56 +228,50 @@ class GameEngine:
                     db_item = item.get("db_item")
                     if db_item:
                         used_counts[db_item] = used_counts.get(db_item, 0) + item["used_count"]
-            for db_item, count in used_counts.items():
-                if db_item.quantity > count:
-                    db_item.quantity -= count
-                else:
-                    await db.delete(db_item)
+            await context.consume(used_counts, db)
             
             # 先提交药水消耗，避免锁等待
             await db.flush()
             
             if result.victory:
-                instance.remove_monster(monster_pos)
+                instance.remove_monster(monster_pos, char_id)
+                spawner.schedule(instance)
                 map_manager.move(char_id, monster_pos)
-                char.pos_x = monster_pos[0]
-                char.pos_y = monster_pos[1]
+                character_states.set_position(char_id, monster_pos)
                 
                 char.exp += result.exp_gained
                 char.gold += result.gold_gained
                 
                 level_up = cls._check_level_up(char)
                 
-                for drop in result.drops:
-                    await cls._add_item(char_id, drop["item_id"], drop["quality"], db,
-                                       random_attrs=drop.get("random_attrs"))
-                
-                # 增加主动技能熟练度
-                for skill_id in result.skills_used:
-                    await cls._increase_skill_proficiency(char_id, skill_id, db)
+                # 掉落批量入包（复用已加载的背包行分配格子）
+                context.add_items(result.drops, db)
                 
-                # 增加被动技能熟练度（每次战斗+5）
-                for skill_id in result.passive_skills:
-                    await cls._increase_skill_proficiency(char_id, skill_id, db, amount=5)
+                # 增加技能熟练度：主动技能+10，被动技能每次战斗+5
+                gains = [(skill_id, 10) for skill_id in result.skills_used]
+                gains += [(skill_id, 5) for skill_id in result.passive_skills]
+                await increase_skills_proficiency(char_id, gains, db)
                 
                 await db.commit()
                 
                 return {
                     "success": True,
                     "victory": True,
-                    "logs": result.logs,
+                    "logs": result.log,
                     "exp_gained": result.exp_gained,
                     "gold_gained": result.gold_gained,
                     "drops": result.drops,
                     "level_up": level_up,
-                    "character": cls._char_to_dict(char)
+                    "character": cls._char_to_dict(char),
+                    "seed": result.seed
                 }
             else:
                 return {
                     "success": True,
                     "victory": False,
-                    "logs": result.logs,
-                    "player_died": result.player_died
+                    "logs": result.log,
+                    "player_died": result.player_died,
+                    "seed": result.seed
                 }
         finally:
             cls.combat_locks.pop(char_id, None)
@@ -311,12 +282,9 @@ class GameEngine:
         result = map_manager.use_entrance(char_id, entrance_id)
         
         if result.get("map_id"):
-            char = await db.get(Character, char_id)
-            if char:
-                char.map_id = result["map_id"]
-                char.pos_x = result["position"][0]
-                char.pos_y = result["position"][1]
-                await db.commit()
+            # 切换地图时立即写回
+            character_states.set_position(char_id, result["position"], result["map_id"])
+            await character_states.flush([char_id])
         
         return result
     
@@ -326,12 +294,9 @@ class GameEngine:
         result = map_manager.use_exit(char_id, exit_type)
         
         if result.get("map_id"):
-            char = await db.get(Character, char_id)
-            if char:
-                char.map_id = result["map_id"]
-                char.pos_x = result["position"][0]
-                char.pos_y = result["position"][1]
-                await db.commit()
+            # 切换地图时立即写回
+            character_states.set_position(char_id, result["position"], result["map_id"])
+            await character_states.flush([char_id])
         
         return result
     
@@ -340,12 +305,8 @@ class GameEngine:
         """回城"""
         result = map_manager.return_to_city(char_id)
         
-        char = await db.get(Character, char_id)
-        if char:
-            char.map_id = "main_city"
-            char.pos_x = result["position"][0]
-            char.pos_y = result["position"][1]
-            await db.commit()
+        character_states.set_position(char_id, result["position"], "main_city")
+        await character_states.flush([char_id])
         
         return result
     
@@ -447,6 +408,8 @@ class GameEngine:
             )
         items = list(result.scalars().all())
         
+        key = warehouse_key(char.user_id) if st == StorageType.WAREHOUSE else inventory_key(char_id)
+        
         # 按(item_id, quality)分组
         groups = {}
         for item in items:
@@ -454,20 +417,21 @@ class GameEngine:
             item_type = item_info.get("type") if item_info else None
             is_stackable = item_type in ["consumable", "material", "skillbook", "boss_summon"]
             if is_stackable:
-                key = (item.item_id, item.quality)
-                if key not in groups:
-                    groups[key] = []
-                groups[key].append(item)
+                group_key = (item.item_id, item.quality)
+                if group_key not in groups:
+                    groups[group_key] = []
+                groups[group_key].append(item)
         
         # 合并同类物品
         merged = 0
-        for key, group in groups.items():
+        for group in groups.values():
             if len(group) > 1:
                 # 保留第一个，合并其他
                 first = group[0]
                 for other in group[1:]:
                     first.quantity += other.quantity
                     await db.delete(other)
+                    slot_index.release(key, other.slot, db)
                     merged += 1
         
         await db.commit()
@@ -487,7 +451,6 @@ class GameEngine:
         # 装备槽位
         slots = ["weapon", "helmet", "armor", "belt", "boots", "necklace", "ring_left", "ring_right", "bracelet_left", "bracelet_right"]
         equipment = {}
-        equip_list_for_effects = []
         
         for slot in slots:
             equip = next((e for e in equipment_list if e.slot == slot), None)
@@ -516,19 +479,14 @@ class GameEngine:
                     "socket_display": get_socket_display(equip_data) if equip_data["sockets"] > 0 else "",
                     "info": item_info
                 }
-                equip_list_for_effects.append({"info": item_info})
             else:
                 equipment[slot] = None
         
-        # 计算综合属性
-        total_stats = await cls._get_combat_stats(char, db)
-        
-        # 计算综合特效
-        total_effects = EffectCalculator.get_equipment_effects(equip_list_for_effects)
-        
-        # 计算套装加成，并返回完整套装配置
-        sets_config = DataLoader.get_sets()
-        set_result = calculate_set_bonuses(equip_list_for_effects, sets_config, include_full_config=True)
+        # 综合属性、特效和套装加成取自派生属性快照
+        snapshot = await stat_cache.get(char, db)
+        total_stats = snapshot.player_stats()
+        total_effects = dict(snapshot.effects)
+        set_result = snapshot.set_result
         
         # 合并套装特效
         for k, v in set_result["total_effects"].items():
@@ -691,7 +649,9 @@ class GameEngine:
         
         # 移除背包物品
         await db.delete(inv_item)
+        slot_index.release(inventory_key(char_id), inv_item.slot, db)
         await db.commit()
+        stat_cache.invalidate(char_id)
         
         return {"success": True}
     
@@ -723,6 +683,7 @@ class GameEngine:
             char.yuanbao += yuanbao * inv_item.quantity
         
         await db.delete(inv_item)
+        slot_index.release(inventory_key(char_id), inv_item.slot, db)
         await db.commit()
         
         return {"success": True, "gold": gold, "yuanbao": yuanbao}
@@ -787,6 +748,7 @@ class GameEngine:
                 total_yuanbao += yuanbao * inv_item.quantity
 
             await db.delete(inv_item)
+            slot_index.release(inventory_key(char_id), inv_item.slot, db)
             recycled_count += 1
 
         char.gold += total_gold
@@ -798,7 +760,6 @@ class GameEngine:
     @classmethod
     async def move_to_warehouse(cls, char_id: int, inventory_slot: int, db: AsyncSession) -> dict:
         """将背包物品移到仓库（仓库按user_id共享）"""
-        from sqlalchemy import or_
         char = await db.get(Character, char_id)
 
         # 获取背包物品
@@ -814,27 +775,12 @@ class GameEngine:
             return {"success": False, "error": "物品不存在"}
         
         # 找仓库空位（按user_id共享）
-        result = await db.execute(
-            select(InventoryItem.slot).where(
-                InventoryItem.storage_type == StorageType.WAREHOUSE,
-                or_(
-                    InventoryItem.user_id == char.user_id,
-                    InventoryItem.character_id == char_id
-                )
-            )
-        )
-        used_slots = {row[0] for row in result.fetchall()}
-        
-        warehouse_slot = None
-        for slot in range(1000):
-            if slot not in used_slots:
-                warehouse_slot = slot
-                break
-        
+        warehouse_slot = await slot_index.allocate(warehouse_key(char.user_id), db)
         if warehouse_slot is None:
             return {"success": False, "error": "仓库已满"}
         
         # 移动物品到共享仓库
+        slot_index.release(inventory_key(char_id), inv_item.slot, db)
         inv_item.storage_type = StorageType.WAREHOUSE
         inv_item.slot = warehouse_slot
         inv_item.user_id = char.user_id
@@ -864,24 +810,12 @@ class GameEngine:
             return {"success": False, "error": "物品不存在"}
         
         # 找背包空位
-        result = await db.execute(
-            select(InventoryItem.slot).where(
-                InventoryItem.character_id == char_id,
-                InventoryItem.storage_type == StorageType.INVENTORY
-            )
-        )
-        used_slots = {row[0] for row in result.fetchall()}
-        
-        inv_slot = None
-        for slot in range(200):
-            if slot not in used_slots:
-                inv_slot = slot
-                break
-        
+        inv_slot = await slot_index.allocate(inventory_key(char_id), db)
         if inv_slot is None:
             return {"success": False, "error": "背包已满"}
         
         # 移动物品到角色背包
+        slot_index.release(warehouse_key(char.user_id), wh_item.slot, db)
         wh_item.storage_type = StorageType.INVENTORY
         wh_item.slot = inv_slot
         wh_item.character_id = char_id
@@ -1031,8 +965,10 @@ class GameEngine:
             rune_item.quantity -= 1
         else:
             await db.delete(rune_item)
+            slot_index.release(inventory_key(char_id), rune_item.slot, db)
 
         await db.commit()
+        stat_cache.invalidate(char_id)
 
         return {
             "success": True,
@@ -1118,8 +1054,10 @@ class GameEngine:
             rune_item.quantity -= 1
         else:
             await db.delete(rune_item)
+            slot_index.release(inventory_key(char_id), rune_item.slot, db)
 
         await db.commit()
+        stat_cache.invalidate(char_id)
 
         return {
             "success": True,
@@ -1166,6 +1104,7 @@ class GameEngine:
         new_skill = CharacterSkill(character_id=char_id, skill_id=skill_id, level=1, proficiency=0)
         db.add(new_skill)
         await db.commit()
+        stat_cache.invalidate(char_id)
         return {"success": True}
     
     @classmethod
@@ -1201,6 +1140,7 @@ class GameEngine:
         
         # 消耗技能书
         await db.delete(inv_item)
+        slot_index.release(inventory_key(char_id), inv_item.slot, db)
         await db.commit()
         
         return {"success": True, "skill_id": skill_id, "message": f"成功学习技能: {item_info.get('name')}"}
@@ -1227,10 +1167,14 @@ class GameEngine:
         if not item_info or item_info.get("type") != "boss_summon":
             return {"success": False, "error": "这不是Boss召唤物品"}
         
+        # 一场Boss战（Boss选择、战斗、掉落）使用同一个种子，记录在结果中用于复现
+        seed = random.getrandbits(32)
+        rng = random.Random(seed)
+        
         # 获取Boss类型
         summon_boss = item_info.get("summon_boss")
         if isinstance(summon_boss, list):
-            boss_type = random.choice(summon_boss)
+            boss_type = rng.choice(summon_boss)
         else:
             boss_type = summon_boss
         
@@ -1242,53 +1186,30 @@ class GameEngine:
         cls.combat_locks[char_id] = True
         
         try:
-            # 获取角色技能
-            skills_result = await db.execute(
-                select(CharacterSkill).where(CharacterSkill.character_id == char_id)
-            )
-            all_skills = []
-            for skill in skills_result.scalars():
-                skill_info = DataLoader.get_skill(skill.skill_id, char.char_class.value)
-                if skill_info:
-                    all_skills.append({**skill_info, "level": skill.level, "skill_id": skill.skill_id})
+            # 一次查询取回角色和背包，技能/装备/战斗属性取自派生属性快照
+            context = await load_combat_context(char_id, db)
+            snapshot = context.snapshot
+            all_skills = snapshot.combat_skills()
             
-            # 获取背包药水
-            inv_result = await db.execute(
-                select(InventoryItem).where(
-                    InventoryItem.character_id == char_id,
-                    InventoryItem.storage_type == StorageType.INVENTORY
-                ).with_for_update()
-            )
-            inventory = []
-            for item in inv_result.scalars():
-                info = DataLoader.get_item(item.item_id)
-                if info and info.get("type") == "consumable":
-                    for _ in range(item.quantity):
-                        inventory.append({"slot": item.slot, "info": info, "db_item": item})
+            # 获取背包药水（按数量展开）
+            inventory = context.consumables(expand=True)
             
             # Boss战斗
             boss = monster_info.copy()
+            boss["monster_id"] = boss_type
             boss["quality"] = "orange"  # Boss固定橙色品质
             
-            player_stats = await cls._get_combat_stats(char, db)
+            player_stats = snapshot.player_stats()
             player_stats["char_class"] = char.char_class.value
             
-            # 获取装备列表用于特效计算
-            equip_result = await db.execute(select(Equipment).where(Equipment.character_id == char_id))
-            equipment_list = []
-            for equip in equip_result.scalars():
-                item_info = get_item_with_attributes(
-                    DataLoader.get_item(equip.item_id),
-                    equip.quality,
-                    equip.random_attrs
-                )
-                if item_info:
-                    equipment_list.append({"info": item_info})
+            # 装备列表用于特效计算
+            equipment_list = snapshot.combat_equipment()
             
             summon = cls.summons.get(char_id)
             disabled = cls.disabled_skills.get(char_id, [])
             
-            combat_result = CombatEngine.pve_combat(player_stats, [boss], all_skills, [], DataLoader, inventory, summon, disabled, equipment_list)
+            combat_result = CombatEngine.pve_combat(player_stats, [boss], all_skills, [], DataLoader, inventory, summon, disabled,
+                                                    equipment_list, seed=seed, rng=rng)
             
             # 更新召唤物状态
             if combat_result.summon_died:
@@ -1301,17 +1222,10 @@ class GameEngine:
                     db_item = item.get("db_item")
                     if db_item:
                         used_counts[db_item] = used_counts.get(db_item, 0) + item["used_count"]
-            for db_item, count in used_counts.items():
-                if db_item.quantity > count:
-                    db_item.quantity -= count
-                else:
-                    await db.delete(db_item)
+            await context.consume(used_counts, db)
             
             # 消耗召唤物品
-            if inv_item.quantity > 1:
-                inv_item.quantity -= 1
-            else:
-                await db.delete(inv_item)
+            await context.consume({inv_item: 1}, db)
             
             await db.flush()
             
@@ -1321,32 +1235,32 @@ class GameEngine:
                 
                 level_up = cls._check_level_up(char)
                 
-                for drop in combat_result.drops:
-                    await cls._add_item(char_id, drop["item_id"], drop["quality"], db,
-                                       random_attrs=drop.get("random_attrs"))
+                context.add_items(combat_result.drops, db)
                 
-                for skill_id in combat_result.skills_used:
-                    await cls._increase_skill_proficiency(char_id, skill_id, db)
+                await increase_skills_proficiency(
+                    char_id, [(skill_id, 10) for skill_id in combat_result.skills_used], db)
                 
                 await db.commit()
                 
                 return {
                     "success": True,
                     "victory": True,
-                    "logs": combat_result.logs,
+                    "logs": combat_result.log,
                     "exp_gained": combat_result.exp_gained,
                     "gold_gained": combat_result.gold_gained,
                     "drops": combat_result.drops,
                     "level_up": level_up,
-                    "character": cls._char_to_dict(char)
+                    "character": cls._char_to_dict(char),
+                    "seed": combat_result.seed
                 }
             else:
                 await db.commit()
                 return {
                     "success": True,
                     "victory": False,
-                    "logs": combat_result.logs,
-                    "player_died": combat_result.player_died
+                    "logs": combat_result.log,
+                    "player_died": combat_result.player_died,
+                    "seed": combat_result.seed
                 }
         finally:
             cls.combat_locks.pop(char_id, None)
@@ -1407,11 +1321,14 @@ class GameEngine:
         
         # 检查升级 (每1000熟练度升1级)
         max_level = 3
+        old_level = skill.level
         while skill.proficiency >= 1000 and skill.level < max_level:
             skill.proficiency -= 1000
             skill.level += 1
         
         await db.commit()
+        if skill.level != old_level:
+            stat_cache.invalidate(char_id)
         return {"success": True, "level": skill.level, "proficiency": skill.proficiency}
     
     @classmethod
@@ -1428,19 +1345,7 @@ class GameEngine:
         if not skill:
             return
         
-        max_level = 3
-        # 顶级技能不再增加熟练度
-        if skill.level >= max_level:
-            skill.proficiency = 0
-            return
-        
-        skill.proficiency += amount
-        
-        while skill.proficiency >= 1000 and skill.level < max_level:
-            skill.proficiency -= 1000
-            skill.level += 1
-            if skill.level >= max_level:
-                skill.proficiency = 0
+        apply_proficiency(skill, amount)
     
     @classmethod
     def _apply_quality_bonus(cls, item_info: dict, quality: str) -> dict:
@@ -1479,197 +1384,112 @@ class GameEngine:
     @classmethod
     async def _add_item(cls, char_id: int, item_id: str, quality: str, db: AsyncSession, quantity: int = 1, random_attrs: dict = None, sockets: int = None, socketed_runes: list = None, runeword_id: str = None):
         """添加物品到背包（消耗品可堆叠）"""
+        results = await cls._add_items(char_id, [{
+            "item_id": item_id,
+            "quality": quality,
+            "quantity": quantity,
+            "random_attrs": random_attrs,
+            "sockets": sockets,
+            "socketed_runes": socketed_runes,
+            "runeword_id": runeword_id
+        }], db)
+        return results[0]
+    
+    @classmethod
+    async def _add_items(cls, char_id: int, items: List[dict], db: AsyncSession) -> List[bool]:
+        """批量添加物品到背包，返回每个物品是否放入成功
+        
+        items 中每项为 {"item_id", "quality", "quantity", "random_attrs", "sockets", "socketed_runes", "runeword_id"}，
+        除 item_id 外均可省略。可堆叠物品一次查询取回已有的同类格，空位取自格子位图。
+        """
         # 获取角色的user_id用于仓库共享
         char = await db.get(Character, char_id)
         user_id = char.user_id if char else None
 
-        item_info = DataLoader.get_item(item_id)
-        item_type = item_info.get("type") if item_info else None
-        is_stackable = item_type in ["consumable", "material", "skillbook", "boss_summon", "rune"]
-        # 非装备类型物品品质统一为普通
-        if item_type not in ["weapon", "armor", "accessory"]:
-            quality = "white"
-            random_attrs = None  # 非装备不存储随机属性
-            sockets = None  # 非装备不生成孔
-
-        # 白色装备自动生成孔
-        if item_type in ["weapon", "armor"] and quality == "white" and sockets is None:
-            item_slot = item_info.get("slot", "weapon")
-            # 映射到符文之语支持的槽位
-            slot_mapping = {"body": "armor", "head": "helmet"}
-            runeword_slot = slot_mapping.get(item_slot, item_slot)
-            sockets = roll_sockets_for_white_equipment(runeword_slot)
+        prepared = []
+        for entry in items:
+            _, quality, random_attrs, sockets, is_stackable = prepare_item(
+                entry["item_id"], entry.get("quality", "white"), entry.get("random_attrs"), entry.get("sockets"))
+            prepared.append((entry, quality, random_attrs, sockets, is_stackable))
 
-        # 如果是可堆叠物品，先查找已有的同类物品
-        if is_stackable:
+        # 如果有可堆叠物品，先查找已有的同类物品
+        stacks: Dict[Tuple[str, str], InventoryItem] = {}
+        stackable_ids = {entry["item_id"] for entry, _, _, _, is_stackable in prepared if is_stackable}
+        if stackable_ids:
             result = await db.execute(
                 select(InventoryItem).where(
                     InventoryItem.character_id == char_id,
                     InventoryItem.storage_type == StorageType.INVENTORY,
-                    InventoryItem.item_id == item_id,
-                    InventoryItem.quality == quality
-                ).limit(1)
+                    InventoryItem.item_id.in_(stackable_ids)
+                ).order_by(InventoryItem.id)
             )
-            existing = result.scalar()
-            if existing:
-                existing.quantity += quantity
-                return True
+            for existing in result.scalars():
+                stacks.setdefault((existing.item_id, existing.quality), existing)
 
-        # 找空位
-        result = await db.execute(
-            select(InventoryItem.slot).where(
-                InventoryItem.character_id == char_id,
-                InventoryItem.storage_type == StorageType.INVENTORY
-            )
-        )
-        used_slots = {row[0] for row in result.fetchall()}
+        key = inventory_key(char_id)
+        results = []
+        for entry, quality, random_attrs, sockets, is_stackable in prepared:
+            item_id = entry["item_id"]
+            quantity = entry.get("quantity", 1)
+            if is_stackable:
+                existing = stacks.get((item_id, quality))
+                if existing is not None:
+                    existing.quantity += quantity
+                    results.append(True)
+                    continue
 
-        for slot in range(200):
-            if slot not in used_slots:
-                item = InventoryItem(
-                    character_id=char_id,
-                    user_id=user_id,
-                    storage_type=StorageType.INVENTORY,
-                    item_id=item_id,
-                    quality=quality,
-                    slot=slot,
-                    quantity=quantity,
-                    random_attrs=random_attrs,  # 存储随机属性
-                    sockets=sockets or 0,  # 存储孔数
-                    socketed_runes=socketed_runes,  # 存储已镶嵌符文
-                    runeword_id=runeword_id  # 存储符文之语ID
-                )
-                db.add(item)
-                return True
-        return False
+            # 找空位
+            slot = await slot_index.allocate(key, db)
+            if slot is None:
+                results.append(False)
+                continue
+
+            item = InventoryItem(
+                character_id=char_id,
+                user_id=user_id,
+                storage_type=StorageType.INVENTORY,
+                item_id=item_id,
+                quality=quality,
+                slot=slot,
+                quantity=quantity,
+                random_attrs=random_attrs,  # 存储随机属性
+                sockets=sockets or 0,  # 存储孔数
+                socketed_runes=entry.get("socketed_runes"),  # 存储已镶嵌符文
+                runeword_id=entry.get("runeword_id")  # 存储符文之语ID
+            )
+            db.add(item)
+            if is_stackable:
+                stacks[(item_id, quality)] = item
+            results.append(True)
+        return results
     
     @classmethod
     async def _get_combat_stats(cls, char: Character, db: AsyncSession) -> dict:
-        """获取战斗属性（支持攻击/魔法/防御/魔御的min-max范围）"""
-        stats = {
-            "id": char.id,
-            "name": char.name,
-            "level": char.level,
-            "max_hp": char.max_hp,
-            "max_mp": char.max_mp,
-            "attack_min": char.attack,
-            "attack_max": char.attack,
-            "magic_min": 0,
-            "magic_max": 0,
-            "defense_min": char.defense,
-            "defense_max": char.defense,
-            "magic_defense_min": 0,
-            "magic_defense_max": 0,
-            "luck": char.luck
-        }
-        # 兼容旧代码
-        stats["attack"] = char.attack
-        stats["defense"] = char.defense
-        
-        # 加上装备属性
-        result = await db.execute(select(Equipment).where(Equipment.character_id == char.id))
-        for equip in result.scalars():
-            # 获取带随机属性的装备信息
-            item_with_attrs = get_item_with_attributes(
-                DataLoader.get_item(equip.item_id),
-                equip.quality,
-                equip.random_attrs
-            )
-
-            # 应用符文/符文之语效果
-            equip_data = {
-                "sockets": getattr(equip, 'sockets', 0) or 0,
-                "socketed_runes": getattr(equip, 'socketed_runes', None) or [],
-                "runeword_id": getattr(equip, 'runeword_id', None),
-                "slot": equip.slot
-            }
-            if equip_data["sockets"] > 0:
-                item_with_attrs = apply_runeword_to_equipment_info(item_with_attrs, equip_data)
-
-            # 使用随机后的属性值
-            stats["attack_min"] += item_with_attrs.get("attack_min", 0)
-            stats["attack_max"] += item_with_attrs.get("attack_max", 0)
-            stats["magic_min"] += item_with_attrs.get("magic_min", 0)
-            stats["magic_max"] += item_with_attrs.get("magic_max", 0)
-            stats["defense_min"] += item_with_attrs.get("defense_min", 0)
-            stats["defense_max"] += item_with_attrs.get("defense_max", 0)
-            stats["magic_defense_min"] += item_with_attrs.get("magic_defense_min", 0)
-            stats["magic_defense_max"] += item_with_attrs.get("magic_defense_max", 0)
-            stats["max_hp"] += item_with_attrs.get("hp_bonus", 0)
-            stats["max_mp"] += item_with_attrs.get("mp_bonus", 0)
-        
-        # 加上被动技能属性（按基础属性百分比增加）
-        skills_result = await db.execute(select(CharacterSkill).where(CharacterSkill.character_id == char.id))
-        for skill in skills_result.scalars():
-            skill_info = DataLoader.get_skill(skill.skill_id, char.char_class.value)
-            if skill_info and skill_info.get("type") == "passive":
-                effect = skill_info.get("effect", {})
-                level_bonus = skill.level
-                # 阶梯增长：1级5%，2级12%，3级20%
-                percent_bonus = [0.05, 0.12, 0.20][min(level_bonus, 3) - 1] if level_bonus > 0 else 0
-                
-                # 攻击加成（按百分比）
-                if effect.get("attack_bonus"):
-                    bonus = int(char.attack * percent_bonus)
-                    stats["attack_min"] += bonus
-                    stats["attack_max"] += bonus
-                # 防御加成（按百分比）
-                if effect.get("defense_bonus"):
-                    bonus = int(char.defense * percent_bonus)
-                    stats["defense_min"] += bonus
-                    stats["defense_max"] += bonus
-                # 魔御加成（按百分比）
-                if effect.get("magic_defense_bonus"):
-                    bonus = int(char.magic_defense * percent_bonus)
-                    stats["magic_defense_min"] += bonus
-                    stats["magic_defense_max"] += bonus
-                # HP加成（按百分比）
-                if effect.get("hp_bonus"):
-                    stats["max_hp"] += int(char.max_hp * percent_bonus)
-                # MP加成（按百分比）
-                if effect.get("mp_bonus"):
-                    stats["max_mp"] += int(char.max_mp * percent_bonus)
-        
-        # 兼容旧代码：取平均值
-        stats["attack"] = (stats["attack_min"] + stats["attack_max"]) // 2
-        stats["defense"] = (stats["defense_min"] + stats["defense_max"]) // 2
-        
-        return stats
+        """获取战斗属性（支持攻击/魔法/防御/魔御的min-max范围），来自派生属性快照"""
+        snapshot = await stat_cache.get(char, db)
+        return snapshot.player_stats()
     
     @classmethod
     def _check_level_up(cls, char: Character) -> dict:
         """检查升级，返回升级信息"""
         level_up_data = {"leveled_up": False, "new_level": char.level, "stats_gained": {}}
         
-        # 计算升级所需经验（更陡峭的指数增长）
-        exp_needed = int(char.level * 150 * (1.15 ** (char.level - 1)))
+        exp_needed = exp_to_next_level(char.level)
         
         if char.exp >= exp_needed:
             char.exp -= exp_needed
             char.level += 1
+            # 基础属性变化，派生属性快照失效
+            stat_cache.invalidate(char.id)
             
             # 根据职业获得不同的属性加成
-            if char.char_class.value == "warrior":
-                hp_gain = 25
-                mp_gain = 5
-                attack_gain = 4
-                magic_gain = 0
-                defense_gain = 3
-                magic_defense_gain = 1
-            elif char.char_class.value == "mage":
-                hp_gain = 10
-                mp_gain = 20
-                attack_gain = 1
-                magic_gain = 5
-                defense_gain = 1
-                magic_defense_gain = 2
-            else:  # taoist
-                hp_gain = 15
-                mp_gain = 15
-                attack_gain = 2
-                magic_gain = 3
-                defense_gain = 2
-                magic_defense_gain = 1
+            gains = level_up_gains(char.char_class.value)
+            hp_gain = gains["hp"]
+            mp_gain = gains["mp"]
+            attack_gain = gains["attack"]
+            magic_gain = gains["magic"]
+            defense_gain = gains["defense"]
+            magic_defense_gain = gains["magic_defense"]
             
             char.max_hp += hp_gain
             char.max_mp += mp_gain
@@ -1723,7 +1543,7 @@ class GameEngine:
             "defense": char.defense,
             "magic_defense": getattr(char, 'magic_defense', 0),
             "luck": char.luck,
-            "map_id": char.map_id,
-            "pos_x": char.pos_x,
-            "pos_y": char.pos_y
+            "map_id": character_states.value(char, "map_id"),
+            "pos_x": character_states.value(char, "pos_x"),
+            "pos_y": character_states.value(char, "pos_y")
         }
\ No newline at end of file
@@ -0,0 +1,60 @@
+"""地图事件总线 - 移动、击杀、刷怪、PK等事件只推送给同地图（可选：迷雾已覆盖该格）的玩家"""
+from typing import Callable, Collection, Iterable, List, Tuple
+
+from backend.config import settings
+
+# 事件类型
+PLAYER_ENTER = "player_enter"
+PLAYER_MOVE = "player_move"
+PLAYER_LEAVE = "player_leave"
+MONSTER_KILLED = "monster_killed"
+MONSTER_SPAWN = "monster_spawn"
+PVP = "pvp"
+
+# 推送回调: sink(接收者ID列表, 消息)
+Sink = Callable[[List[int], dict], None]
+
+
+class MapEventBus:
+    """地图事件总线
+
+    每个 MapInstance 维护订阅者集合（当前在该地图的玩家），事件只发给订阅者；
+    fog_filter 开启时带位置的事件只发给迷雾已揭示该格的玩家。
+    推送由注册的 sink 完成（main.py 注册为 WebSocket 发送），未注册时事件直接丢弃。
+    """
+
+    def __init__(self, fog_filter: bool = True):
+        self.fog_filter = fog_filter
+        self.sinks: List[Sink] = []
+
+    def subscribe(self, sink: Sink):
+        """注册推送回调"""
+        self.sinks.append(sink)
+
+    def emit(self, char_ids: Iterable[int], message: dict):
+        """把同一条消息推给一组玩家"""
+        recipients = list(char_ids)
+        if not recipients:
+            return
+        for sink in self.sinks:
+            sink(recipients, message)
+
+    def publish(self, instance, event: str, data: dict, *cells: Tuple[int, int], exclude: Collection[int] = ()):
+        """发布地图事件
+
+        instance: 事件所在地图（需有 map_id / subscribers / can_see）
+        cells: 事件涉及的格子，迷雾过滤时只发给能看到其中任一格的玩家；不传时发给全部订阅者
+        exclude: 不需要推送的玩家（通常是事件发起者，他会收到自己的结果消息）
+        """
+        if not self.sinks:
+            return
+        if cells and self.fog_filter:
+            recipients = [cid for cid in instance.subscribers
+                          if cid not in exclude and any(instance.can_see(cid, pos) for pos in cells)]
+        else:
+            recipients = [cid for cid in instance.subscribers if cid not in exclude]
+        self.emit(recipients, {"type": "map_event", "data": {"event": event, "map_id": instance.map_id, **data}})
+
+
+# 全局实例
+map_events = MapEventBus(settings.MAP_EVENT_FOG_FILTER)
@@ -0,0 +1,126 @@
+"""背包/仓库格子索引 - 内存中的占用位图，找空位无需查询全部格子"""
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import event, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from backend.metrics import metrics
+from backend.models import Character, InventoryItem, StorageType
+
+# 背包格子数（按角色）
+INVENTORY_SIZE = 200
+# 仓库格子数（按user_id共享）
+WAREHOUSE_SIZE = 1000
+
+# 会话中修改过的索引键，提交后清除，未提交结束时作废对应索引
+_SESSION_KEYS = "slot_index_keys"
+
+SlotKey = Tuple[StorageType, int]
+
+
+def inventory_key(char_id: int) -> SlotKey:
+    return (StorageType.INVENTORY, char_id)
+
+
+def warehouse_key(user_id: int) -> SlotKey:
+    return (StorageType.WAREHOUSE, user_id)
+
+
+def first_free(mask: int, capacity: int) -> Optional[int]:
+    """位图中最小的空位，已满返回None"""
+    # mask+1 把最低的0位进位为1，与 ~mask 相与只保留该位
+    slot = (~mask & (mask + 1)).bit_length() - 1
+    return slot if slot < capacity else None
+
+
+class SlotIndex:
+    """格子占用位图 {(存储类型, 角色ID/账号ID): int}
+
+    首次使用时用一次 SELECT slot 加载，之后入包、删除、移动、整理都直接更新位图。
+    位图的修改随数据库事务生效：会话提交前若回滚或关闭，涉及的位图作废，下次重新加载。
+    """
+
+    def __init__(self):
+        self.masks: Dict[SlotKey, int] = {}
+
+    @staticmethod
+    def capacity(key: SlotKey) -> int:
+        return WAREHOUSE_SIZE if key[0] == StorageType.WAREHOUSE else INVENTORY_SIZE
+
+    @staticmethod
+    def _touch(key: SlotKey, db: AsyncSession):
+        db.info.setdefault(_SESSION_KEYS, set()).add(key)
+
+    async def load(self, key: SlotKey, db: AsyncSession) -> int:
+        """获取位图，未加载时查询占用的格子"""
+        mask = self.masks.get(key)
+        if mask is not None:
+            metrics.incr("slot_index.hit")
+            return mask
+
+        metrics.incr("slot_index.miss")
+        storage_type, owner_id = key
+        if storage_type == StorageType.WAREHOUSE:
+            # 仓库按user_id共享，兼容只记录了character_id的旧数据
+            owner = or_(
+                InventoryItem.user_id == owner_id,
+                InventoryItem.character_id.in_(select(Character.id).where(Character.user_id == owner_id))
+            )
+        else:
+            owner = InventoryItem.character_id == owner_id
+        result = await db.execute(
+            select(InventoryItem.slot).where(InventoryItem.storage_type == storage_type, owner)
+        )
+        self.seed(key, (row[0] for row in result.fetchall()), db)
+        return self.masks[key]
+
+    def seed(self, key: SlotKey, slots: Iterable[int], db: AsyncSession):
+        """用已查询到的格子直接建立位图"""
+        mask = 0
+        for slot in slots:
+            mask |= 1 << slot
+        self.masks[key] = mask
+        self._touch(key, db)
+
+    def acquire(self, key: SlotKey, db: AsyncSession) -> Optional[int]:
+        """占用最小空位（位图须已加载），已满返回None"""
+        mask = self.masks[key]
+        slot = first_free(mask, self.capacity(key))
+        if slot is not None:
+            self.masks[key] = mask | (1 << slot)
+            self._touch(key, db)
+        return slot
+
+    async def allocate(self, key: SlotKey, db: AsyncSession) -> Optional[int]:
+        """按需加载位图并占用最小空位"""
+        await self.load(key, db)
+        return self.acquire(key, db)
+
+    def release(self, key: SlotKey, slot: int, db: AsyncSession):
+        """释放格子（位图未加载时无需处理，加载时会读到最新数据）"""
+        mask = self.masks.get(key)
+        if mask is not None:
+            self.masks[key] = mask & ~(1 << slot)
+            self._touch(key, db)
+
+    def evict(self, key: SlotKey):
+        self.masks.pop(key, None)
+
+
+# 全局实例
+slot_index = SlotIndex()
+
+
+@event.listens_for(Session, "after_commit")
+def _slot_index_committed(session: Session):
+    session.info.pop(_SESSION_KEYS, None)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _slot_index_discarded(session: Session, transaction):
+    # 未提交就结束的顶层事务（回滚/关闭），其间修改过的位图不再可信
+    if transaction.parent is not None:
+        return
+    for key in session.info.pop(_SESSION_KEYS, ()):
+        slot_index.evict(key)
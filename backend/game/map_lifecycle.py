@@ -0,0 +1,126 @@
+"""地图实例生命周期 - 下线摘除玩家、定时回收空闲实例、统计实例内存和人数"""
+import asyncio
+import sys
+import time
+from typing import List, Optional
+
+from backend.config import settings
+from backend.game.map_manager import MapInstance, MapManager, map_manager
+from backend.metrics import metrics
+
+# 估算实例内存时跳过的属性（地图配置由所有实例共享）
+SHARED_ATTRS = {"config"}
+
+
+def deep_sizeof(obj, seen: Optional[set] = None) -> int:
+    """递归估算对象占用的字节数（容器、__dict__ 和 __slots__），同一对象只计一次"""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    elif not isinstance(obj, (str, bytes, bytearray, int, float, bool, type(None))):
+        if hasattr(obj, "__dict__"):
+            size += deep_sizeof(obj.__dict__, seen)
+        for cls in type(obj).__mro__:
+            for name in getattr(cls, "__slots__", ()):
+                if hasattr(obj, name):
+                    size += deep_sizeof(getattr(obj, name), seen)
+    return size
+
+
+def instance_memory(instance: MapInstance) -> int:
+    """实例独占数据（迷宫、寻路网格、怪物、玩家、迷雾、视角等）的估算字节数"""
+    seen = {id(getattr(instance, name)) for name in SHARED_ATTRS}
+    return deep_sizeof(instance, seen)
+
+
+class MapLifecycle:
+    """地图实例生命周期管理
+
+    - 玩家断线时从所在实例摘除（同地图玩家收到离开事件，player_map 不再残留）
+    - 定时回收无人超过 MAP_INSTANCE_TTL 的实例，并启动预生成池的后台补充
+    - 为管理接口汇总每个实例的人数和估算内存
+    """
+
+    def __init__(self, maps: MapManager, interval: float = 30.0):
+        self.maps = maps
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def detach(self, char_id: int):
+        """玩家下线：离开所在实例"""
+        if char_id in self.maps.player_map:
+            self.maps.detach(char_id)
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """回收空闲实例并更新实例数/在图人数指标，返回回收数量"""
+        evicted = self.maps.evict_idle(now=now)
+        if evicted:
+            metrics.incr("map.instances_evicted", evicted)
+        metrics.gauge("map.instances", len(self.maps.instances))
+        metrics.gauge("map.players", len(self.maps.player_map))
+        return evicted
+
+    def report(self) -> dict:
+        """每个实例的人数、怪物数、空闲时长和估算内存，以及预生成池的情况"""
+        now = time.monotonic()
+        instances: List[dict] = []
+        for instance in self.maps.instances.values():
+            instances.append({
+                "instance_id": instance.instance_id,
+                "map_id": instance.map_id,
+                "owner": instance.owner,
+                "players": len(instance.players),
+                "monsters": len(instance.monsters),
+                "idle_seconds": round(now - instance.idle_since, 1) if instance.idle_since is not None else None,
+                "memory_bytes": instance_memory(instance),
+            })
+        instances.sort(key=lambda row: -row["memory_bytes"])
+        pool = self.maps.pool
+        pooled = [instance for ready in pool.ready.values() for instance in ready]
+        return {
+            "instance_count": len(instances),
+            "player_count": len(self.maps.player_map),
+            "memory_bytes": sum(row["memory_bytes"] for row in instances),
+            "ttl": settings.MAP_INSTANCE_TTL,
+            "instances": instances,
+            "pool": {
+                "size": pool.size,
+                "ready": len(pooled),
+                "memory_bytes": sum(instance_memory(instance) for instance in pooled),
+                "hits": pool.hits,
+                "misses": pool.misses,
+            },
+        }
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            self.sweep()
+
+    def start(self):
+        """启动预生成池和定时回收任务"""
+        self.maps.pool.start()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """停止后台任务"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.maps.pool.stop()
+
+
+# 全局实例
+map_lifecycle = MapLifecycle(map_manager, max(min(settings.MAP_INSTANCE_TTL / 4, 30.0), 1.0))
@@ -1,28 +1,142 @@
-from typing import Dict, List, Tuple, Set, Optional
-from backend.game.maze import MazeGenerator, Pathfinder
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Tuple, Set, Optional
+from backend.config import settings
+from backend.game.maze import MazeGenerator, NavGrid, Pathfinder
 from backend.game.data_loader import DataLoader
+from backend.game.events import (
+    map_events, PLAYER_ENTER, PLAYER_MOVE, PLAYER_LEAVE, MONSTER_KILLED, MONSTER_SPAWN
+)
+import asyncio
+import base64
 import random
 import json
+import time
+
+# 地图入口/出口格子
+ENTRANCE_POS = (2, 2)
+EXIT_POS = (21, 21)
+
+# 迷雾位图：第 y*24+x 位表示格子(x, y)是否已揭示
+MAP_SIZE = 24
+FOG_BYTES = (MAP_SIZE * MAP_SIZE + 7) // 8
+FULL_FOG_MASK = (1 << (MAP_SIZE * MAP_SIZE)) - 1
+
+# 揭示范围掩码缓存 {(x, y, radius): mask}
+_reveal_masks: Dict[Tuple[int, int, int], int] = {}
+
+
+def reveal_mask(x: int, y: int, radius: int) -> int:
+    """获取以(x, y)为中心、边长2*radius+1的方形揭示掩码（越界部分裁剪）"""
+    key = (x, y, radius)
+    mask = _reveal_masks.get(key)
+    if mask is None:
+        x0, x1 = max(0, x - radius), min(MAP_SIZE - 1, x + radius)
+        y0, y1 = max(0, y - radius), min(MAP_SIZE - 1, y + radius)
+        mask = 0
+        if x0 <= x1:
+            row = ((1 << (x1 - x0 + 1)) - 1) << x0
+            for ny in range(y0, y1 + 1):
+                mask |= row << (ny * MAP_SIZE)
+        _reveal_masks[key] = mask
+    return mask
+
+
+def fog_bit(pos: Tuple[int, int]) -> int:
+    """格子对应的位"""
+    return 1 << (pos[1] * MAP_SIZE + pos[0])
+
+
+def encode_fog(mask: int) -> str:
+    """迷雾位图编码为base64（小端字节序，第i位在第i//8字节的第i%8位）"""
+    return base64.b64encode(mask.to_bytes(FOG_BYTES, "little")).decode("ascii")
+
+class SpawnCells:
+    """刷新点索引 - 合适刷新点在迷宫生成时计算一次，空闲刷新点用数组+下标表维护
+
+    占用/释放/随机选取都是 O(1)（删除时与末尾交换），补充刷怪不再扫描全图。
+    """
+
+    __slots__ = ("cells", "valid", "free", "index")
+
+    def __init__(self, cells: List[Tuple[int, int]]):
+        self.cells = cells
+        self.valid = frozenset(cells)
+        self.free = list(cells)
+        self.index = {pos: i for i, pos in enumerate(self.free)}
+
+    def __len__(self) -> int:
+        return len(self.free)
+
+    def take(self, pos: Tuple[int, int]):
+        """标记刷新点已占用"""
+        i = self.index.pop(pos, None)
+        if i is None:
+            return
+        last = self.free.pop()
+        if last != pos:
+            self.free[i] = last
+            self.index[last] = i
+
+    def release(self, pos: Tuple[int, int]):
+        """怪物死亡后刷新点恢复空闲"""
+        if pos in self.valid and pos not in self.index:
+            self.index[pos] = len(self.free)
+            self.free.append(pos)
+
+    def pick(self, rng=random, exclude: Iterable[Tuple[int, int]] = ()) -> Optional[Tuple[int, int]]:
+        """随机取一个空闲刷新点（跳过 exclude 中的格子，如玩家所在格），没有时返回None"""
+        blocked = set(exclude)
+        for _ in range(4):
+            if not self.free:
+                return None
+            pos = self.free[rng.randrange(len(self.free))]
+            if pos not in blocked:
+                return pos
+        candidates = [pos for pos in self.free if pos not in blocked]
+        return rng.choice(candidates) if candidates else None
+
 
 class MapInstance:
     """单个地图实例"""
     
-    def __init__(self, map_id: str, config: dict):
+    def __init__(self, map_id: str, config: dict, seed: Optional[int] = None):
         self.map_id = map_id
         self.config = config
+        # 实例ID和归属（共享分片为None，私有/队伍副本为归属键）由 MapManager 分配
+        self.instance_id = map_id
+        self.owner: Optional[str] = None
+        # 最后一个玩家离开的时间（monotonic），有玩家时为None
+        self.idle_since: Optional[float] = None
+        # 实例种子决定迷宫、初始刷怪和之后的补充刷怪，相同种子可复现同一张地图
+        self.seed = random.getrandbits(32) if seed is None else seed
+        self.rng = random.Random(self.seed)
         
         # 主城使用特殊的开放地图，其他地图生成迷宫
         if config.get("is_safe") or map_id == "main_city":
             self.maze = self._generate_safe_city()
         else:
-            self.maze = MazeGenerator().generate()
+            self.maze = MazeGenerator(rng=self.rng).generate()
         
         self.monsters: Dict[Tuple[int, int], dict] = {}
         self.players: Dict[int, Tuple[int, int]] = {}
-        self.revealed: Dict[int, Set[Tuple[int, int]]] = {}
+        # 地图事件订阅者（在该地图的玩家）
+        self.subscribers: Set[int] = set()
+        # 每个玩家的迷雾位图
+        self.revealed: Dict[int, int] = {}
+        # 每个玩家最后一次发送的视角（增量同步基准）
+        self.views: Dict[int, dict] = {}
         self.entrances: Dict[str, Tuple[int, int]] = {}
         
         self._init_entrances()
+        # 迷宫生成后不再变化，寻路网格、连通分量和出入口距离场只构建一次
+        self.nav = NavGrid.from_maze(self.maze)
+        if not self.config.get("is_safe"):
+            self.nav.distance_field(ENTRANCE_POS)
+            self.nav.distance_field(EXIT_POS)
+        # 刷新点索引：之后刷怪只从空闲刷新点中随机选择，不再扫描全图
+        self.spawn_cells = SpawnCells(self._spawn_candidates())
+        self.next_monster_id = 0
+        self.regular_count = 0  # 普通怪物数量（不含地图Boss）
         self._spawn_monsters()
     
     def _generate_safe_city(self) -> list:
@@ -59,7 +173,7 @@ class MapInstance:
         # 添加一些随机装饰性墙壁（密度15%，比普通地图少）
         for y in range(2, 22):
             for x in range(2, 22):
-                if (x, y) not in protected_positions and random.random() < 0.15:
+                if (x, y) not in protected_positions and self.rng.random() < 0.15:
                     maze[y][x] = 1
         
         return maze
@@ -86,13 +200,10 @@ class MapInstance:
                                 self.maze[ny][nx] = 0
                     self.entrances[entrance["id"]] = pos
     
-    def _spawn_monsters(self):
-        """生成怪物 - 简化版，不使用A*验证"""
-        monster_count = self.config.get("monster_count", 60)
-        monster_types = self.config.get("monsters", [])
-        
-        if not monster_types:
-            return
+    def _spawn_candidates(self) -> List[Tuple[int, int]]:
+        """合适的刷新点：可通行、离入口/出口2格以外、至少2个相邻通路（迷宫生成后计算一次）"""
+        if not self.config.get("monsters"):
+            return []
         
         # 排除入口和出口附近的位置
         exclude_pos = set()
@@ -101,46 +212,61 @@ class MapInstance:
                 for dx in range(-2, 3):
                     exclude_pos.add((pos[0] + dx, pos[1] + dy))
         
-        # 收集所有可通行的格子
+        # 收集所有可通行的格子（避开边界，相邻格一定在地图内）
+        maze = self.maze
         empty_cells = []
-        for y in range(1, 23):  # 避开边界
+        for y in range(1, 23):
+            up, row, down = maze[y - 1], maze[y], maze[y + 1]
             for x in range(1, 23):
-                if self.maze[y][x] == 0 and (x, y) not in exclude_pos:
-                    # 检查周围是否有足够的通路
-                    neighbor_count = 0
-                    for dy, dx in [(0, 1), (0, -1), (1, 0), (-1, 0)]:
-                        ny, nx = y + dy, x + dx
-                        if 0 <= ny < 24 and 0 <= nx < 24 and self.maze[ny][nx] == 0:
-                            neighbor_count += 1
+                if row[x] == 0 and (x, y) not in exclude_pos:
                     # 至少有2个相邻通路才算合适的刷新点
-                    if neighbor_count >= 2:
+                    if (row[x - 1] == 0) + (row[x + 1] == 0) + (up[x] == 0) + (down[x] == 0) >= 2:
                         empty_cells.append((x, y))
+        return empty_cells
+    
+    def _spawn_monsters(self):
+        """生成怪物：Boss放在离入口最远的刷新点，普通怪物从空闲刷新点中逐个随机选取（不洗牌整个列表）"""
+        monster_count = self.config.get("monster_count", 60)
+        monster_types = self.config.get("monsters", [])
+        cells = self.spawn_cells
         
-        if not empty_cells:
+        if not monster_types or not cells.cells:
             return
         
-        random.shuffle(empty_cells)
-        
-        # 生成普通怪物
-        spawn_count = min(monster_count, len(empty_cells) - 1)
-        for i in range(spawn_count):
-            if i >= len(empty_cells):
-                break
-            pos = empty_cells[i]
-            monster_type = random.choice(monster_types)
-            monster_info = DataLoader.get_monster(monster_type)
-            monster_data = {"type": monster_type, "id": i}
-            if monster_info and monster_info.get("is_boss"):
-                monster_data["is_boss"] = True
-            self.monsters[pos] = monster_data
-        
         # 生成Boss
         if boss := self.config.get("boss"):
-            if len(empty_cells) > spawn_count:
+            if len(cells) > 1:
                 entrance = (2, 1)
-                farthest_pos = max(empty_cells[spawn_count:],
-                                  key=lambda p: abs(p[0] - entrance[0]) + abs(p[1] - entrance[1]))
+                farthest_pos = max(cells.cells, key=lambda p: abs(p[0] - entrance[0]) + abs(p[1] - entrance[1]))
                 self.monsters[farthest_pos] = {"type": boss, "id": -1, "is_boss": True}
+                cells.take(farthest_pos)
+        
+        # 生成普通怪物（至少留一个空闲刷新点）
+        spawn_count = min(monster_count, len(cells.cells) - 1)
+        for _ in range(spawn_count):
+            self._place_monster(cells.pick(self.rng), self.rng.choice(monster_types))
+    
+    def _place_monster(self, pos: Tuple[int, int], monster_type: str) -> dict:
+        """在刷新点放置一只普通怪物（编号递增）"""
+        monster_info = DataLoader.get_monster(monster_type)
+        monster_data = {"type": monster_type, "id": self.next_monster_id}
+        if monster_info and monster_info.get("is_boss"):
+            monster_data["is_boss"] = True
+        self.next_monster_id += 1
+        self.regular_count += 1
+        self.monsters[pos] = monster_data
+        self.spawn_cells.take(pos)
+        return monster_data
+    
+    def spawn_monster(self) -> Optional[Tuple[Tuple[int, int], dict]]:
+        """在随机空闲刷新点补充一只怪物（避开玩家所在格），数量已满或没有空位时返回None"""
+        monster_types = self.config.get("monsters", [])
+        if not monster_types or self.regular_count >= self.config.get("monster_count", 60):
+            return None
+        pos = self.spawn_cells.pick(self.rng, exclude=self.players.values())
+        if pos is None:
+            return None
+        return pos, self._place_monster(pos, self.rng.choice(monster_types))
     
     def enter(self, char_id: int, from_entrance: bool = True) -> Tuple[int, int]:
         """玩家进入地图"""
@@ -149,30 +275,38 @@ class MapInstance:
             pos = (12, 12)  # 主城中心位置
             self.players[char_id] = pos
             # 主城直接揭示全部区域，无迷雾
-            self.revealed[char_id] = {(x, y) for x in range(24) for y in range(24)}
+            self.revealed[char_id] = FULL_FOG_MASK
         else:
             pos = (2, 2) if from_entrance else (21, 21)  # 避开边界墙壁
             self.players[char_id] = pos
-            self.revealed[char_id] = set()
+            self.revealed[char_id] = 0
             # 进入地图时使用更大的视野半径(5格)
             self.reveal_around(char_id, pos, radius=5)
+        map_events.publish(self, PLAYER_ENTER, {"char_id": char_id, "position": pos}, pos, exclude=(char_id,))
+        self.subscribers.add(char_id)
         return pos
     
     def leave(self, char_id: int):
         """玩家离开地图"""
-        self.players.pop(char_id, None)
+        self.subscribers.discard(char_id)
+        pos = self.players.pop(char_id, None)
         self.revealed.pop(char_id, None)
+        self.views.pop(char_id, None)
+        if pos is not None:
+            map_events.publish(self, PLAYER_LEAVE, {"char_id": char_id}, pos)
     
     def reveal_around(self, char_id: int, pos: Tuple[int, int], radius: int = 3):
         """揭示周围区域"""
-        if char_id not in self.revealed:
-            self.revealed[char_id] = set()
-        
-        for dy in range(-radius, radius + 1):
-            for dx in range(-radius, radius + 1):
-                nx, ny = pos[0] + dx, pos[1] + dy
-                if 0 <= nx < 24 and 0 <= ny < 24:
-                    self.revealed[char_id].add((nx, ny))
+        self.revealed[char_id] = self.revealed.get(char_id, 0) | reveal_mask(pos[0], pos[1], radius)
+    
+    def is_revealed(self, char_id: int, pos: Tuple[int, int]) -> bool:
+        """格子是否已被该玩家揭示"""
+        if not (0 <= pos[0] < MAP_SIZE and 0 <= pos[1] < MAP_SIZE):
+            return False
+        return bool(self.revealed.get(char_id, 0) & fog_bit(pos))
+    
+    # 事件总线按迷雾过滤接收者
+    can_see = is_revealed
     
     def move_to(self, char_id: int, target: Tuple[int, int]) -> dict:
         """移动到目标位置"""
@@ -182,15 +316,19 @@ class MapInstance:
         current = self.players[char_id]
         
         # 检查目标是否已揭示
-        if target not in self.revealed.get(char_id, set()):
+        if not self.is_revealed(char_id, target):
             return {"success": False, "error": "未探索区域"}
         
         # 检查是否是墙
         if self.maze[target[1]][target[0]] == 1:
             return {"success": False, "error": "无法通过"}
         
+        # 不在同一连通区域直接拒绝，免去一次完整寻路
+        if not self.nav.connected(current, target):
+            return {"success": False, "error": "无法到达"}
+        
         # 寻路
-        path = Pathfinder.find_path(self.maze, current, target)
+        path = Pathfinder.find_path(self.maze, current, target, self.nav)
         if not path:
             return {"success": False, "error": "无法到达"}
         
@@ -201,28 +339,25 @@ class MapInstance:
                 self.reveal_around(char_id, pos, radius=1)
                 return {"success": False, "error": "有怪物阻挡", "monster_pos": pos, "monster": self.monsters[pos]}
         
-        # 移动
+        # 移动（原位置或新位置可见的玩家都需要更新）
         self.players[char_id] = target
         self.reveal_around(char_id, target)
+        map_events.publish(self, PLAYER_MOVE, {"char_id": char_id, "position": target},
+                           current, target, exclude=(char_id,))
         
         # 检查是否到达出口（适用于非主城地图）- 只在特定位置
-        at_exit = (target[0] == 21 and target[1] == 21) and not self.config.get("is_safe")
-        at_entrance = (target[0] == 2 and target[1] == 2) and not self.config.get("is_safe")
+        at_exit = target == EXIT_POS and not self.config.get("is_safe")
+        at_entrance = target == ENTRANCE_POS and not self.config.get("is_safe")
         
         return {"success": True, "path": path, "at_exit": at_exit, "at_entrance": at_entrance}
     
-    def get_state(self, char_id: int) -> dict:
-        """获取玩家视角的地图状态"""
-        revealed = self.revealed.get(char_id, set())
-        visible_monsters = {f"{pos[0]},{pos[1]}": m for pos, m in self.monsters.items() if pos in revealed}
-        visible_players = {cid: pos for cid, pos in self.players.items() if pos in revealed and cid != char_id}
-        
-        # 获取可见的入口 - 修复返回格式
+    def _visible_entrances(self, char_id: int) -> dict:
+        """获取玩家可见的入口"""
         visible_entrances = {}
         if self.config.get("entrances"):
             for entrance in self.config["entrances"]:
                 pos = tuple(entrance["position"])
-                if pos in revealed:
+                if self.is_revealed(char_id, pos):
                     # 使用entrance的id作为key，完整entrance对象作为value
                     visible_entrances[entrance["id"]] = {
                         "id": entrance["id"],
@@ -230,6 +365,34 @@ class MapInstance:
                         "position": entrance["position"],
                         "description": entrance.get("description", "")
                     }
+        return visible_entrances
+    
+    def _exit_distance(self, char_id: int) -> Optional[int]:
+        """到出口的剩余步数提示（查距离场，不可达为None）"""
+        position = self.players.get(char_id)
+        if not position or self.config.get("is_safe"):
+            return None
+        steps = self.nav.distance(EXIT_POS, position)
+        return steps if steps >= 0 else None
+    
+    def _snapshot_view(self, char_id: int) -> dict:
+        """记录玩家当前视角，作为下一次增量的基准"""
+        revealed = self.revealed.get(char_id, 0)
+        view = self.views.get(char_id)
+        return {
+            "seq": view["seq"] + 1 if view else 1,
+            "revealed": revealed,
+            "monsters": {pos: m for pos, m in self.monsters.items() if revealed & fog_bit(pos)},
+            "players": {cid: pos for cid, pos in self.players.items() if revealed & fog_bit(pos) and cid != char_id},
+            "entrances": set(self._visible_entrances(char_id)),
+            "position": self.players.get(char_id),
+            "exit_distance": self._exit_distance(char_id),
+        }
+    
+    def get_state(self, char_id: int) -> dict:
+        """获取玩家视角的完整地图状态（同时重置增量基准）"""
+        view = self._snapshot_view(char_id)
+        self.views[char_id] = view
         
         # 添加NPC信息（主城特有）
         npcs = []
@@ -245,77 +408,201 @@ class MapInstance:
         
         return {
             "map_id": self.map_id,
+            "instance_id": self.instance_id,
             "map_name": self.config.get("name", self.map_id),
+            "seq": view["seq"],
             "maze": self.maze,
-            "revealed": list(revealed),
-            "position": self.players.get(char_id),
-            "monsters": visible_monsters,
-            "players": visible_players,
-            "entrances": visible_entrances,
+            "revealed": encode_fog(view["revealed"]),
+            "position": view["position"],
+            "monsters": {f"{pos[0]},{pos[1]}": m for pos, m in view["monsters"].items()},
+            "players": view["players"],
+            "entrances": self._visible_entrances(char_id),
             "exits": self.config.get("exits", {}),
-            "npcs": npcs
+            "npcs": npcs,
+            "exit_distance": view["exit_distance"]
         }
     
-    def remove_monster(self, pos: Tuple[int, int]) -> Optional[dict]:
-        """移除怪物"""
-        return self.monsters.pop(pos, None)
+    def get_delta(self, char_id: int) -> Optional[dict]:
+        """获取相对上次发送视角的增量，没有基准时返回None（应发送完整状态）
+        
+        base_seq 与客户端持有的 seq 不一致时，客户端应请求 get_map_state 重新同步。
+        """
+        old = self.views.get(char_id)
+        if old is None:
+            return None
+        new = self._snapshot_view(char_id)
+        self.views[char_id] = new
+        
+        delta = {"map_id": self.map_id, "seq": new["seq"], "base_seq": old["seq"]}
+        
+        added_fog = new["revealed"] & ~old["revealed"]
+        if added_fog:
+            delta["reveal"] = encode_fog(added_fog)
+        
+        old_monsters, new_monsters = old["monsters"], new["monsters"]
+        added = {f"{pos[0]},{pos[1]}": m for pos, m in new_monsters.items() if old_monsters.get(pos) is not m}
+        removed = [f"{pos[0]},{pos[1]}" for pos in old_monsters if pos not in new_monsters]
+        if added:
+            delta["monsters_add"] = added
+        if removed:
+            delta["monsters_remove"] = removed
+        
+        old_players, new_players = old["players"], new["players"]
+        moved = {cid: pos for cid, pos in new_players.items() if old_players.get(cid) != pos}
+        gone = [cid for cid in old_players if cid not in new_players]
+        if moved:
+            delta["players_move"] = moved
+        if gone:
+            delta["players_remove"] = gone
+        
+        if new["entrances"] != old["entrances"]:
+            entrances = self._visible_entrances(char_id)
+            delta["entrances_add"] = {eid: e for eid, e in entrances.items() if eid not in old["entrances"]}
+        
+        if new["position"] != old["position"]:
+            delta["position"] = new["position"]
+        if new["exit_distance"] != old["exit_distance"]:
+            delta["exit_distance"] = new["exit_distance"]
+        return delta
+    
+    def remove_monster(self, pos: Tuple[int, int], killer_id: Optional[int] = None) -> Optional[dict]:
+        """移除怪物（击杀者之外能看到该格的玩家收到通知）"""
+        monster = self.monsters.pop(pos, None)
+        if monster is not None:
+            self.spawn_cells.release(pos)
+            if monster.get("id") != -1:
+                self.regular_count -= 1
+            map_events.publish(self, MONSTER_KILLED, {"position": f"{pos[0]},{pos[1]}", "killer_id": killer_id},
+                               pos, exclude=(killer_id,))
+        return monster
+    
+    def publish_spawns(self, spawned: Dict[Tuple[int, int], dict]):
+        """推送新刷出的怪物，每个玩家只收到自己迷雾内的部分"""
+        if not map_events.sinks:
+            return
+        for char_id in list(self.subscribers):
+            visible = {f"{pos[0]},{pos[1]}": m for pos, m in spawned.items()
+                       if not map_events.fog_filter or self.can_see(char_id, pos)}
+            if visible:
+                map_events.emit([char_id], {"type": "map_event", "data": {
+                    "event": MONSTER_SPAWN, "map_id": self.map_id, "monsters": visible}})
     
     def respawn_check(self):
-        """检查并补充怪物 - 简化版"""
-        monster_count = self.config.get("monster_count", 60)
-        current = len([m for m in self.monsters.values() if not m.get("is_boss")])
-        need_spawn = monster_count - current
-        
-        if need_spawn > 0:
-            monster_types = self.config.get("monsters", [])
-            if not monster_types:
-                return
-            
-            # 排除入口、出口和已有怪物的位置
-            exclude_pos = set(self.monsters.keys())
-            for pos in [(2, 1), (21, 22)] + list(self.entrances.values()):
-                for dy in range(-2, 3):
-                    for dx in range(-2, 3):
-                        exclude_pos.add((pos[0] + dx, pos[1] + dy))
-            
-            # 收集可用位置
-            empty_cells = []
-            for y in range(1, 23):
-                for x in range(1, 23):
-                    if self.maze[y][x] == 0 and (x, y) not in exclude_pos:
-                        neighbor_count = sum(1 for dy, dx in [(0, 1), (0, -1), (1, 0), (-1, 0)]
-                                           if 0 <= y + dy < 24 and 0 <= x + dx < 24
-                                           and self.maze[y + dy][x + dx] == 0)
-                        if neighbor_count >= 2:
-                            empty_cells.append((x, y))
-            
-            if not empty_cells:
-                return
-            
-            random.shuffle(empty_cells)
-            
-            # 补充怪物
-            spawn_count = min(need_spawn, len(empty_cells))
-            monster_id_base = max([m.get("id", 0) for m in self.monsters.values()
-                                  if not m.get("is_boss")], default=0) + 1
-            
-            for i in range(spawn_count):
-                pos = empty_cells[i]
-                monster_type = random.choice(monster_types)
-                monster_info = DataLoader.get_monster(monster_type)
-                monster_data = {"type": monster_type, "id": monster_id_base + i}
-                if monster_info and monster_info.get("is_boss"):
-                    monster_data["is_boss"] = True
-                self.monsters[pos] = monster_data
+        """立即补满怪物（只在空闲刷新点中随机选择）"""
+        spawned = {}
+        while (result := self.spawn_monster()) is not None:
+            pos, monster_data = result
+            spawned[pos] = monster_data
+        self.publish_spawns(spawned)
+
+
+class MapInstancePool:
+    """预生成地图实例池
+
+    进入无人的地图时直接取出一张已生成好迷宫、寻路距离场和怪物的实例，
+    被取走的空位由后台任务在请求之外补充（每生成一张让出一次事件循环）。
+    池为空时退回同步生成。主城等安全区只有一个常驻实例，不进入池。
+    """
+
+    def __init__(self, configs: Dict[str, dict], size: int = 2):
+        self.configs = configs
+        self.size = size
+        self.ready: Dict[str, Deque[MapInstance]] = {}
+        self.hits = 0
+        self.misses = 0
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def pooled(self, map_id: str) -> bool:
+        """该地图是否使用预生成池"""
+        config = self.configs.get(map_id)
+        return bool(self.size > 0 and config and not config.get("is_safe") and map_id != "main_city")
+
+    def take(self, map_id: str) -> Optional[MapInstance]:
+        """取出一张新实例，池为空时同步生成"""
+        config = self.configs.get(map_id)
+        if not config:
+            return None
+        ready = self.ready.get(map_id)
+        if ready:
+            instance = ready.popleft()
+            self.hits += 1
+        else:
+            instance = MapInstance(map_id, config)
+            if self.pooled(map_id):
+                self.misses += 1
+        if self._wakeup is not None and self.pooled(map_id):
+            self._wakeup.set()
+        return instance
+
+    def deficit(self) -> Optional[str]:
+        """备用实例最少（且未满）的地图ID，全部已满时返回None"""
+        best, best_count = None, self.size
+        for map_id in self.configs:
+            if not self.pooled(map_id):
+                continue
+            count = len(self.ready.get(map_id, ()))
+            if count < best_count:
+                best, best_count = map_id, count
+        return best
+
+    def fill_one(self) -> bool:
+        """为最缺的地图生成一张备用实例，没有空位时返回False"""
+        map_id = self.deficit()
+        if map_id is None:
+            return False
+        self.ready.setdefault(map_id, deque()).append(MapInstance(map_id, self.configs[map_id]))
+        return True
+
+    def fill(self):
+        """同步补满（脚本和测试使用）"""
+        while self.fill_one():
+            pass
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self.fill_one():
+                await asyncio.sleep(0)
+
+    def start(self):
+        """启动后台补充任务（启动时先补满一轮）"""
+        if self.size <= 0:
+            return
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._wakeup.set()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """停止后台补充任务"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._wakeup = None
 
 
 class MapManager:
-    """地图管理器"""
+    """地图管理器
+
+    每张地图有若干共享分片（每个分片最多 shard_capacity 人），也可以按 (地图ID, 归属) 开私有/队伍副本。
+    player_map 记录玩家所在的实例ID。非安全区的共享分片无人时立即回收（下一个进入的玩家拿到新地图），
+    私有副本和安全区分片无人后保留 MAP_INSTANCE_TTL 秒，供归属者返回或其他人进入（由 map_lifecycle 定时回收）。
+    """
     
     def __init__(self):
-        self.instances: Dict[str, MapInstance] = {}
-        self.player_map: Dict[int, str] = {}  # char_id -> map_id
+        self.instances: Dict[str, MapInstance] = {}  # instance_id -> 实例
+        self.shards: Dict[str, List[str]] = {}  # map_id -> 共享分片的实例ID
+        self.private: Dict[Tuple[str, str], str] = {}  # (map_id, owner) -> 私有/队伍副本的实例ID
+        self.player_map: Dict[int, str] = {}  # char_id -> instance_id
         self.map_configs = self._load_configs()
+        self.pool = MapInstancePool(self.map_configs, settings.MAP_POOL_SIZE)
+        self._next_instance = 0
     
     def _load_configs(self) -> dict:
         """加载地图配置"""
@@ -345,74 +632,168 @@ class MapManager:
             "zombie_cave_3": {"name": "僵尸洞3层", "monster_count": 60, "monsters": ["zombie_elite"], "boss": "corpse_king", "exits": {"zombie_cave_2": [1, 0]}},
         }
     
-    def get_or_create_instance(self, map_id: str) -> Optional[MapInstance]:
-        """获取或创建地图实例"""
-        if map_id not in self.instances:
-            config = self.map_configs.get(map_id)
-            if not config:
-                return None  # 地图配置不存在
-            self.instances[map_id] = MapInstance(map_id, config)
-        return self.instances[map_id]
+    def is_safe(self, map_id: str) -> bool:
+        return map_id == "main_city" or bool(self.map_configs.get(map_id, {}).get("is_safe"))
     
-    def enter_map(self, char_id: int, map_id: str, from_entrance: bool = True) -> dict:
-        """玩家进入地图"""
+    def shard_capacity(self, map_id: str) -> int:
+        """共享分片人数上限，0 表示不限（安全区默认不分片）"""
+        config = self.map_configs.get(map_id, {})
+        return config.get("shard_capacity", 0 if self.is_safe(map_id) else settings.MAP_SHARD_CAPACITY)
+    
+    def instance_owner(self, char_id: int, map_id: str, owner: Optional[str] = None) -> Optional[str]:
+        """进入地图时的副本归属：显式指定的归属（如队伍）优先，instance 为 private 的地图默认每人一个副本"""
+        if owner is not None:
+            return owner
+        if self.map_configs.get(map_id, {}).get("instance") == "private":
+            return f"char:{char_id}"
+        return None
+    
+    def get_instance(self, char_id: int) -> Optional[MapInstance]:
+        """玩家所在的地图实例"""
+        instance_id = self.player_map.get(char_id)
+        return self.instances.get(instance_id) if instance_id else None
+    
+    def create_instance(self, map_id: str, owner: Optional[str] = None) -> Optional[MapInstance]:
+        """从预生成池取出新实例并登记为共享分片或 (map_id, owner) 副本"""
+        instance = self.pool.take(map_id)
+        if not instance:
+            return None  # 地图配置不存在
+        self._next_instance += 1
+        instance.instance_id = f"{map_id}#{self._next_instance}"
+        instance.owner = owner
+        self.instances[instance.instance_id] = instance
+        if owner is None:
+            self.shards.setdefault(map_id, []).append(instance.instance_id)
+        else:
+            self.private[(map_id, owner)] = instance.instance_id
+        return instance
+    
+    def remove_instance(self, instance: MapInstance):
+        """注销实例"""
+        self.instances.pop(instance.instance_id, None)
+        if instance.owner is None:
+            shards = self.shards.get(instance.map_id)
+            if shards and instance.instance_id in shards:
+                shards.remove(instance.instance_id)
+                if not shards:
+                    del self.shards[instance.map_id]
+        elif self.private.get((instance.map_id, instance.owner)) == instance.instance_id:
+            del self.private[(instance.map_id, instance.owner)]
+    
+    def get_or_create_instance(self, map_id: str, owner: Optional[str] = None) -> Optional[MapInstance]:
+        """选择要进入的实例：副本按归属查找；共享分片选有空位且人数最多的一个，都不合适时新开分片"""
+        if owner is not None:
+            instance = self.instances.get(self.private.get((map_id, owner), ""))
+            return instance or self.create_instance(map_id, owner)
+        
+        capacity = self.shard_capacity(map_id)
+        # 非安全区无人的分片不再分配（与进入无人地图重新生成一致）
+        reuse_empty = self.is_safe(map_id)
+        best = None
+        for instance_id in self.shards.get(map_id, ()):
+            instance = self.instances[instance_id]
+            count = len(instance.players)
+            if (capacity and count >= capacity) or (count == 0 and not reuse_empty):
+                continue
+            if best is None or count > len(best.players):
+                best = instance
+        return best or self.create_instance(map_id)
+    
+    def detach(self, char_id: int):
+        """玩家离开当前实例（切换地图、下线），实例无人时按类型回收或开始计时"""
+        instance = self.get_instance(char_id)
+        self.player_map.pop(char_id, None)
+        if not instance:
+            return
+        instance.leave(char_id)
+        if instance.players:
+            return
+        reusable = (self.private.get((instance.map_id, instance.owner)) == instance.instance_id
+                    if instance.owner is not None else self.is_safe(instance.map_id))
+        if reusable:
+            instance.idle_since = time.monotonic()
+        else:
+            self.remove_instance(instance)
+    
+    def _join(self, char_id: int, instance: MapInstance, from_entrance: bool) -> dict:
+        pos = instance.enter(char_id, from_entrance)
+        instance.idle_since = None
+        self.player_map[char_id] = instance.instance_id
+        return {"map_id": instance.map_id, "instance_id": instance.instance_id, "position": pos,
+                "state": instance.get_state(char_id)}
+    
+    def enter_map(self, char_id: int, map_id: str, from_entrance: bool = True, owner: Optional[str] = None) -> dict:
+        """玩家进入地图（owner 指定时进入该归属的私有/队伍副本）"""
         # 检查地图配置是否存在
         if map_id not in self.map_configs:
             return {"success": False, "error": f"地图 {map_id} 不存在"}
         
         # 离开当前地图
-        if current_map := self.player_map.get(char_id):
-            if current_map in self.instances:
-                self.instances[current_map].leave(char_id)
-        
-        # 对于非主城地图，如果没有其他玩家，则重新生成
-        if map_id != "main_city":
-            if map_id in self.instances:
-                instance = self.instances[map_id]
-                if len(instance.players) == 0:
-                    del self.instances[map_id]
+        self.detach(char_id)
         
         # 进入新地图
-        instance = self.get_or_create_instance(map_id)
+        instance = self.get_or_create_instance(map_id, self.instance_owner(char_id, map_id, owner))
         if not instance:
             return {"success": False, "error": f"无法创建地图 {map_id}"}
-        
-        pos = instance.enter(char_id, from_entrance)
-        self.player_map[char_id] = map_id
-        
-        return {"map_id": map_id, "position": pos, "state": instance.get_state(char_id)}
+        return self._join(char_id, instance, from_entrance)
+    
+    def evict_idle(self, ttl: Optional[float] = None, now: Optional[float] = None) -> int:
+        """回收无人超过 ttl 秒的实例，返回回收数量"""
+        ttl = settings.MAP_INSTANCE_TTL if ttl is None else ttl
+        now = time.monotonic() if now is None else now
+        expired = [instance for instance in self.instances.values()
+                   if not instance.players and instance.idle_since is not None and now - instance.idle_since >= ttl]
+        for instance in expired:
+            self.remove_instance(instance)
+        return len(expired)
     
     def move(self, char_id: int, target: Tuple[int, int]) -> dict:
         """玩家移动"""
-        map_id = self.player_map.get(char_id)
-        if not map_id or map_id not in self.instances:
+        instance = self.get_instance(char_id)
+        if not instance:
             return {"success": False, "error": "不在任何地图中"}
         
-        return self.instances[map_id].move_to(char_id, target)
+        return instance.move_to(char_id, target)
     
     def get_state(self, char_id: int) -> Optional[dict]:
         """获取玩家当前地图状态"""
-        map_id = self.player_map.get(char_id)
-        if not map_id or map_id not in self.instances:
+        instance = self.get_instance(char_id)
+        if not instance:
             return None
-        return self.instances[map_id].get_state(char_id)
+        return instance.get_state(char_id)
+    
+    def publish(self, char_id: int, event: str, data: dict, exclude: Tuple[int, ...] = ()):
+        """在玩家所在地图、以其位置发布事件"""
+        instance = self.get_instance(char_id)
+        if instance and char_id in instance.players:
+            map_events.publish(instance, event, data, instance.players[char_id], exclude=exclude)
+    
+    def get_update(self, char_id: int) -> dict:
+        """获取地图更新消息：有基准时发送增量(map_delta)，否则发送完整状态(map_state)"""
+        instance = self.get_instance(char_id)
+        if not instance:
+            return {"type": "map_state", "data": None}
+        delta = instance.get_delta(char_id)
+        if delta is None:
+            return {"type": "map_state", "data": instance.get_state(char_id)}
+        return {"type": "map_delta", "data": delta}
     
     def reset_map(self, char_id: int) -> dict:
-        """重置当前地图（重新生成迷宫和怪物）"""
-        map_id = self.player_map.get(char_id)
-        if not map_id:
+        """重置当前地图（重新生成迷宫和怪物）：玩家换到新实例，同实例的其他玩家不受影响"""
+        instance = self.get_instance(char_id)
+        if not instance:
             return {"success": False, "error": "不在任何地图中"}
         
         # 主城不能重置
-        if map_id == "main_city":
+        if instance.map_id == "main_city":
             return {"success": False, "error": "主城无法重置"}
         
-        # 删除旧实例并重新创建
-        if map_id in self.instances:
-            del self.instances[map_id]
-        
-        # 重新进入地图
-        return self.enter_map(char_id, map_id, True)
+        # 副本解除归属后由新实例接替，旧实例在无人时回收
+        map_id, owner = instance.map_id, instance.owner
+        if owner is not None and self.private.get((map_id, owner)) == instance.instance_id:
+            del self.private[(map_id, owner)]
+        self.detach(char_id)
+        return self._join(char_id, self.create_instance(map_id, owner), True)
     
     def return_to_city(self, char_id: int) -> dict:
         """回城"""
@@ -420,13 +801,9 @@ class MapManager:
     
     def use_entrance(self, char_id: int, entrance_id: str) -> dict:
         """使用入口传送"""
-        map_id = self.player_map.get(char_id)
-        if not map_id:
-            return {"success": False, "error": "不在任何地图中"}
-        
-        instance = self.instances.get(map_id)
+        instance = self.get_instance(char_id)
         if not instance:
-            return {"success": False, "error": "地图不存在"}
+            return {"success": False, "error": "不在任何地图中"}
         
         pos = instance.players.get(char_id)
         entrance_pos = instance.entrances.get(entrance_id)
@@ -438,16 +815,12 @@ class MapManager:
     
     def use_exit(self, char_id: int, exit_type: str) -> dict:
         """使用出口/入口"""
-        map_id = self.player_map.get(char_id)
-        if not map_id:
-            return {"success": False, "error": "不在任何地图中"}
-        
-        instance = self.instances.get(map_id)
+        instance = self.get_instance(char_id)
         if not instance:
-            return {"success": False, "error": "地图不存在"}
+            return {"success": False, "error": "不在任何地图中"}
         
         pos = instance.players.get(char_id)
-        config = self.map_configs.get(map_id, {})
+        config = self.map_configs.get(instance.map_id, {})
         exits = config.get("exits", {})
         
         # 检查是否在入口位置(2,2)或出口位置(21,21)
@@ -1,12 +1,16 @@
+import heapq
 import random
-from typing import List, Tuple, Set
+from array import array
+from typing import Dict, List, Optional, Tuple, Set
 
 class MazeGenerator:
     """24x24迷宫生成器 - 优化版，生成更开放的地图"""
     
-    def __init__(self, width: int = 24, height: int = 24):
+    def __init__(self, width: int = 24, height: int = 24, rng=random):
         self.width = width
         self.height = height
+        # 随机数生成器（random.Random实例），相同种子生成相同迷宫
+        self.rng = rng
     
     def generate(self) -> List[List[int]]:
         """生成迷宫，0=通道，1=墙壁"""
@@ -25,7 +29,7 @@ class MazeGenerator:
         # 墙壁密度约30%
         for y in range(2, self.height - 2):
             for x in range(2, self.width - 2):
-                if random.random() < 0.3:
+                if self.rng.random() < 0.3:
                     maze[y][x] = 1
         
         # 确保入口和出口区域清空
@@ -65,9 +69,9 @@ class MazeGenerator:
             current_y += 1
             
             # 随机左右移动
-            if current_x < target_x and random.random() < 0.3:
+            if current_x < target_x and self.rng.random() < 0.3:
                 current_x += 1
-            elif current_x > target_x and random.random() < 0.3:
+            elif current_x > target_x and self.rng.random() < 0.3:
                 current_x -= 1
             
             current_x = max(1, min(self.width - 2, current_x))
@@ -83,54 +87,212 @@ class MazeGenerator:
                 current_x -= 1
 
 
-class Pathfinder:
-    """A*寻路算法"""
-    
-    @staticmethod
-    def find_path(maze: List[List[int]], start: Tuple[int, int], end: Tuple[int, int]) -> List[Tuple[int, int]]:
-        """寻找从start到end的路径"""
-        if maze[start[1]][start[0]] == 1 or maze[end[1]][end[0]] == 1:
+class NavGrid:
+    """寻路网格 - 扁平bytearray存储，节点为整数ID，寻路缓冲区复用
+
+    网格四周额外填充一圈墙，邻居展开时无需边界判断。
+    """
+
+    __slots__ = ("width", "height", "stride", "cells", "_g", "_parent", "_seen", "_closed", "_gen",
+                 "_labels", "_fields")
+
+    def __init__(self, width: int, height: int):
+        self.width = width
+        self.height = height
+        self.stride = width + 2
+        size = self.stride * (height + 2)
+        # 1=墙（含填充边界），0=通道
+        self.cells = bytearray(b"\x01") * size
+        self._g = array("i", bytes(4 * size))
+        self._parent = array("i", bytes(4 * size))
+        # 代数戳：节点的 g/parent 仅在戳等于当前代数时有效，免去每次寻路清空
+        self._seen = array("I", bytes(4 * size))
+        self._closed = array("I", bytes(4 * size))
+        self._gen = 0
+        # 连通分量标签（0=墙，>=1为分量编号），迷宫变化后惰性重算
+        self._labels: Optional[array] = None
+        # BFS距离场缓存 {源节点ID: 距离数组}，-1表示不可达
+        self._fields: Dict[int, array] = {}
+
+    @classmethod
+    def from_maze(cls, maze: List[List[int]]) -> "NavGrid":
+        """从二维迷宫构建网格"""
+        height = len(maze)
+        width = len(maze[0]) if height else 0
+        grid = cls(width, height)
+        stride = grid.stride
+        cells = grid.cells
+        for y, row in enumerate(maze):
+            base = (y + 1) * stride + 1
+            cells[base:base + width] = bytes(1 if v == 1 else 0 for v in row)
+        grid._label_components()
+        return grid
+
+    def node(self, x: int, y: int) -> int:
+        """坐标转节点ID"""
+        return (y + 1) * self.stride + x + 1
+
+    def pos(self, node: int) -> Tuple[int, int]:
+        """节点ID转坐标"""
+        y, x = divmod(node, self.stride)
+        return (x - 1, y - 1)
+
+    def in_bounds(self, x: int, y: int) -> bool:
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def is_walkable(self, x: int, y: int) -> bool:
+        return self.in_bounds(x, y) and self.cells[self.node(x, y)] == 0
+
+    def set_blocked(self, x: int, y: int, blocked: bool):
+        """更新单个格子（迷宫被修改时调用），连通分量和距离场随之失效"""
+        self.cells[self.node(x, y)] = 1 if blocked else 0
+        self._labels = None
+        self._fields.clear()
+
+    def _label_components(self) -> array:
+        """洪水填充标记连通分量"""
+        stride = self.stride
+        cells = self.cells
+        labels = array("i", bytes(4 * len(cells)))
+        offsets = (stride, -stride, 1, -1)
+        label = 0
+        for start in range(len(cells)):
+            if cells[start] or labels[start]:
+                continue
+            label += 1
+            labels[start] = label
+            stack = [start]
+            while stack:
+                current = stack.pop()
+                for offset in offsets:
+                    neighbor = current + offset
+                    if not cells[neighbor] and not labels[neighbor]:
+                        labels[neighbor] = label
+                        stack.append(neighbor)
+        self._labels = labels
+        return labels
+
+    def component(self, x: int, y: int) -> int:
+        """获取格子所属连通分量编号，墙或越界返回0"""
+        if not self.in_bounds(x, y):
+            return 0
+        labels = self._labels
+        if labels is None:
+            labels = self._label_components()
+        return labels[self.node(x, y)]
+
+    def connected(self, a: Tuple[int, int], b: Tuple[int, int]) -> bool:
+        """O(1)判断两点是否连通"""
+        label = self.component(*a)
+        return label != 0 and label == self.component(*b)
+
+    def distance_field(self, source: Tuple[int, int]) -> array:
+        """获取从source出发的BFS距离场（按源点缓存）"""
+        src = self.node(*source)
+        field = self._fields.get(src)
+        if field is not None:
+            return field
+
+        stride = self.stride
+        cells = self.cells
+        field = array("i", [-1]) * len(cells)
+        if self.is_walkable(*source):
+            field[src] = 0
+            offsets = (stride, -stride, 1, -1)
+            frontier = [src]
+            dist = 0
+            while frontier:
+                dist += 1
+                next_frontier = []
+                for current in frontier:
+                    for offset in offsets:
+                        neighbor = current + offset
+                        if not cells[neighbor] and field[neighbor] < 0:
+                            field[neighbor] = dist
+                            next_frontier.append(neighbor)
+                frontier = next_frontier
+        self._fields[src] = field
+        return field
+
+    def distance(self, source: Tuple[int, int], target: Tuple[int, int]) -> int:
+        """两点间最短步数（查表），不可达返回-1"""
+        if not self.in_bounds(*target):
+            return -1
+        return self.distance_field(source)[self.node(*target)]
+
+    def _next_gen(self) -> int:
+        self._gen += 1
+        if self._gen >= 0xFFFFFFFF:
+            # 代数溢出时重置戳数组
+            size = len(self.cells)
+            self._seen = array("I", bytes(4 * size))
+            self._closed = array("I", bytes(4 * size))
+            self._gen = 1
+        return self._gen
+
+    def find_path(self, start: Tuple[int, int], end: Tuple[int, int]) -> List[Tuple[int, int]]:
+        """堆优化A*，返回包含起点和终点的路径，不可达返回空列表"""
+        if not self.is_walkable(*start) or not self.is_walkable(*end):
             return []
-        
-        open_set = {start}
-        came_from = {}
-        g_score = {start: 0}
-        f_score = {start: Pathfinder._heuristic(start, end)}
-        
-        while open_set:
-            current = min(open_set, key=lambda p: f_score.get(p, float('inf')))
-            
-            if current == end:
-                return Pathfinder._reconstruct_path(came_from, current)
-            
-            open_set.remove(current)
-            
-            for dx, dy in [(0, 1), (0, -1), (1, 0), (-1, 0)]:
-                neighbor = (current[0] + dx, current[1] + dy)
-                
-                if not (0 <= neighbor[0] < len(maze[0]) and 0 <= neighbor[1] < len(maze)):
+
+        stride = self.stride
+        cells = self.cells
+        g = self._g
+        parent = self._parent
+        seen = self._seen
+        closed = self._closed
+        gen = self._next_gen()
+
+        src = self.node(*start)
+        dst = self.node(*end)
+        ex, ey = end[0] + 1, end[1] + 1
+        offsets = (stride, -stride, 1, -1)
+
+        g[src] = 0
+        parent[src] = -1
+        seen[src] = gen
+        # 堆元素编码为单个整数：f值 | 反向g值（同f时优先展开更深的节点）| 节点ID
+        open_heap = [(abs(start[0] - end[0]) + abs(start[1] - end[1])) << 52 | 0xFFFFF << 32 | src]
+        heappush = heapq.heappush
+        heappop = heapq.heappop
+
+        while open_heap:
+            current = heappop(open_heap) & 0xFFFFFFFF
+            if current == dst:
+                path = []
+                while current != -1:
+                    y, x = divmod(current, stride)
+                    path.append((x - 1, y - 1))
+                    current = parent[current]
+                path.reverse()
+                return path
+            if closed[current] == gen:
+                continue
+            closed[current] = gen
+
+            tentative_g = g[current] + 1
+            for offset in offsets:
+                neighbor = current + offset
+                if cells[neighbor] or closed[neighbor] == gen:
                     continue
-                if maze[neighbor[1]][neighbor[0]] == 1:
+                if seen[neighbor] == gen and tentative_g >= g[neighbor]:
                     continue
-                
-                tentative_g = g_score[current] + 1
-                
-                if tentative_g < g_score.get(neighbor, float('inf')):
-                    came_from[neighbor] = current
-                    g_score[neighbor] = tentative_g
-                    f_score[neighbor] = tentative_g + Pathfinder._heuristic(neighbor, end)
-                    open_set.add(neighbor)
-        
+                seen[neighbor] = gen
+                g[neighbor] = tentative_g
+                parent[neighbor] = current
+                ny, nx = divmod(neighbor, stride)
+                heappush(open_heap, (tentative_g + abs(nx - ex) + abs(ny - ey)) << 52 | (0xFFFFF - tentative_g) << 32 | neighbor)
+
         return []
-    
-    @staticmethod
-    def _heuristic(a: Tuple[int, int], b: Tuple[int, int]) -> int:
-        return abs(a[0] - b[0]) + abs(a[1] - b[1])
-    
+
+
+class Pathfinder:
+    """A*寻路算法"""
+
     @staticmethod
-    def _reconstruct_path(came_from: dict, current: Tuple[int, int]) -> List[Tuple[int, int]]:
-        path = [current]
-        while current in came_from:
-            current = came_from[current]
-            path.append(current)
-        return path[::-1]
\ No newline at end of file
+    def find_path(maze: List[List[int]], start: Tuple[int, int], end: Tuple[int, int],
+                  grid: Optional[NavGrid] = None) -> List[Tuple[int, int]]:
+        """寻找从start到end的路径（传入预构建的grid可省去建网格开销）"""
+        if grid is None:
+            grid = NavGrid.from_maze(maze)
+        return grid.find_path(start, end)
@@ -3,6 +3,8 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from backend.models import Character, InventoryItem, StorageType
 from backend.game.combat import CombatEngine
 from backend.game.data_loader import DataLoader
+from backend.game.inventory import slot_index, inventory_key
+from backend.game.state_cache import character_states
 import random
 
 class PVPSystem:
@@ -23,16 +25,18 @@ class PVPSystem:
         if not attacker or not defender:
             return {"success": False, "error": "玩家不存在"}
         
-        # 检查是否在安全区
-        if attacker.map_id == "main_city":
+        # 检查是否在安全区（地图以状态缓存为准）
+        if character_states.value(attacker, "map_id") == "main_city":
             return {"success": False, "error": "安全区内禁止PK"}
         
         # 获取战斗属性
         attacker_stats = await cls._get_stats(attacker, db)
         defender_stats = await cls._get_stats(defender, db)
         
-        # 战斗
-        result = CombatEngine.pvp_combat(attacker_stats, defender_stats)
+        # 战斗和死亡掉落使用同一个种子，记录在结果中用于复现
+        seed = random.getrandbits(32)
+        rng = random.Random(seed)
+        result = CombatEngine.pvp_combat(attacker_stats, defender_stats, rng=rng)
         
         # 处理结果
         winner_id = result["winner_id"]
@@ -46,7 +50,7 @@ class PVPSystem:
             attacker.pk_value += 50
         
         # 掉落物品
-        drops = await cls._handle_death_drops(loser, db)
+        drops = await cls._handle_death_drops(loser, db, rng)
         
         await db.commit()
         
@@ -54,9 +58,12 @@ class PVPSystem:
             "success": True,
             "winner_id": winner_id,
             "loser_id": loser_id,
+            "winner_name": winner.name,
+            "loser_name": loser.name,
             "logs": result["logs"],
             "drops": drops,
-            "pk_value": attacker.pk_value
+            "pk_value": attacker.pk_value,
+            "seed": seed
         }
     
     @classmethod
@@ -66,7 +73,7 @@ class PVPSystem:
         return await GameEngine._get_combat_stats(char, db)
     
     @classmethod
-    async def _handle_death_drops(cls, loser: Character, db: AsyncSession) -> List[dict]:
+    async def _handle_death_drops(cls, loser: Character, db: AsyncSession, rng=random) -> List[dict]:
         """处理死亡掉落"""
         drops = []
         
@@ -84,13 +91,14 @@ class PVPSystem:
         items = result.scalars().all()
         
         for item in items:
-            if random.random() < drop_rate:
+            if rng.random() < drop_rate:
                 drops.append({
                     "item_id": item.item_id,
                     "quality": item.quality,
                     "quantity": item.quantity
                 })
                 await db.delete(item)
+                slot_index.release(inventory_key(loser.id), item.slot, db)
         
         return drops
     
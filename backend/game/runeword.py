@@ -5,12 +5,13 @@ from typing import Dict, List, Optional, Tuple, Any
 from backend.game.data_loader import DataLoader
 
 
-def roll_sockets_for_white_equipment(slot: str) -> int:
+def roll_sockets_for_white_equipment(slot: str, rng=random) -> int:
     """
     为白色装备随机生成孔数
 
     Args:
         slot: 装备槽位 (weapon, armor, helmet, boots, belt)
+        rng: 随机数生成器（random.Random实例，默认全局random）
 
     Returns:
         孔数量 (0 - max_sockets[slot])
@@ -31,7 +32,7 @@ def roll_sockets_for_white_equipment(slot: str) -> int:
 
     # 按权重随机选择孔数 (索引0=1孔, 索引1=2孔, ...)
     total_weight = sum(weights)
-    roll = random.random() * total_weight
+    roll = rng.random() * total_weight
     cumulative = 0
 
     for i, weight in enumerate(weights):
@@ -306,13 +307,14 @@ def get_available_runewords_for_slot(slot: str, sockets: int) -> List[dict]:
     return result
 
 
-def roll_rune_drop(monster_level: int, is_boss: bool = False) -> Optional[str]:
+def roll_rune_drop(monster_level: int, is_boss: bool = False, rng=random) -> Optional[str]:
     """
     掉落符文
 
     Args:
         monster_level: 怪物等级
         is_boss: 是否为Boss
+        rng: 随机数生成器（random.Random实例，默认全局random）
 
     Returns:
         符文ID, 或None表示未掉落
@@ -324,7 +326,7 @@ def roll_rune_drop(monster_level: int, is_boss: bool = False) -> Optional[str]:
     # Boss有更高掉落率
     drop_chance = base_chance * (boss_mult if is_boss else 1)
 
-    if random.random() > drop_chance:
+    if rng.random() > drop_chance:
         return None
 
     # 获取所有符文
@@ -351,7 +353,7 @@ def roll_rune_drop(monster_level: int, is_boss: bool = False) -> Optional[str]:
 
     # 加权随机选择
     total = sum(weights)
-    roll = random.random() * total
+    roll = rng.random() * total
     cumulative = 0
 
     for rune_id, weight in zip(available_runes, weights):
@@ -0,0 +1,253 @@
+"""离线战斗模拟 - 数值平衡用（经验倍率、掉率、品质、套装等）
+
+与线上走同一套代码：角色属性由 build_snapshot 计算，遭遇由 GameEngine.encounter_monsters 生成，
+战斗和掉落直接调用 CombatEngine.pve_combat，因此模拟结果与线上数值一致。
+按角色配置 x 地图批量模拟，统计胜率、击杀耗时、药水消耗以及每小时经验/金币/掉落。
+
+挂机耗时按客户端回放战斗日志的节奏估算（每条日志 LOG_REPLAY_SECONDS 秒）加上寻怪时间。
+不模拟召唤物跨战斗保留、死亡回城和背包满的情况。
+
+用法: python -m backend.game.simulation [--classes warrior,mage,taoist] [--levels 10,20,30]
+                                       [--maps woma_forest,zombie_cave_1] [--fights 300] [--gear shop|none]
+                                       [--quality white] [--engage 3] [--seed 1]
+"""
+import argparse
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from backend.game.combat import CombatEngine
+from backend.game.data_loader import DataLoader
+from backend.game.engine import GameEngine
+from backend.game.map_manager import map_manager
+from backend.game.stats import StatSnapshot, base_stats_at_level, build_snapshot, exp_to_next_level
+from backend.models import Character, CharacterClass, CharacterSkill, Equipment
+
+# 客户端逐条回放战斗日志的间隔（秒），与 game.js showCombat 一致
+LOG_REPLAY_SECONDS = 0.2
+
+# 默认携带的药水 {物品ID: 数量}，每场战斗前补满
+DEFAULT_POTIONS = {"hp_potion_medium": 5, "mp_potion_medium": 5}
+
+# 物品槽位 -> 装备槽位（戒指/手镯左右各一件）
+GEAR_SLOTS = {
+    "weapon": ("weapon",), "helmet": ("helmet",), "body": ("armor",), "belt": ("belt",), "boots": ("boots",),
+    "necklace": ("necklace",), "ring": ("ring_left", "ring_right"), "bracelet": ("bracelet_left", "bracelet_right"),
+}
+
+
+@dataclass
+class Build:
+    """模拟用的角色配置"""
+    char_class: str
+    level: int
+    equipment: Dict[str, str] = field(default_factory=dict)  # 装备槽位 -> 物品ID
+    quality: str = "white"
+    skill_level: int = 3
+    potions: Dict[str, int] = field(default_factory=lambda: dict(DEFAULT_POTIONS))
+
+    @property
+    def label(self) -> str:
+        return f"{self.char_class} Lv{self.level}" + (f" {self.quality}装" if self.equipment else " 无装备")
+
+
+@dataclass
+class SimStats:
+    """单个 (角色配置, 地图) 的模拟统计"""
+    fights: int = 0
+    wins: int = 0
+    rounds: int = 0
+    seconds: float = 0.0
+    exp: int = 0
+    gold: int = 0
+    drops: int = 0
+    equipment_drops: int = 0
+    potions_used: Dict[str, int] = field(default_factory=dict)
+
+    def per_hour(self, value: float) -> float:
+        return value * 3600 / self.seconds if self.seconds else 0.0
+
+    def summary(self, level: int) -> dict:
+        fights = self.fights or 1
+        exp_per_hour = self.per_hour(self.exp)
+        return {
+            "win_rate": self.wins / fights,
+            "avg_rounds": self.rounds / fights,
+            "avg_seconds": self.seconds / fights,
+            "potions_per_fight": sum(self.potions_used.values()) / fights,
+            "exp_per_hour": exp_per_hour,
+            "gold_per_hour": self.per_hour(self.gold),
+            "drops_per_hour": self.per_hour(self.drops),
+            "equipment_per_hour": self.per_hour(self.equipment_drops),
+            "hours_per_level": exp_to_next_level(level) / exp_per_hour if exp_per_hour else None,
+        }
+
+
+class PotionStack:
+    """代替背包中药水的数据库记录（战斗只读取数量）"""
+
+    __slots__ = ("quantity",)
+
+    def __init__(self, quantity: int):
+        self.quantity = quantity
+
+
+def shop_gear(char_class: str, level: int) -> Dict[str, str]:
+    """非掉落专属的装备中，每个槽位选等级要求不超过角色等级的最高档（道士可穿法师装备）"""
+    wearable = {char_class, "mage"} if char_class == "taoist" else {char_class}
+    best: Dict[str, Tuple[int, str]] = {}
+    for record in DataLoader.get_item_catalog().records.values():
+        info = record.data
+        item_slot = info.get("slot")
+        if item_slot not in GEAR_SLOTS or info.get("drop_only") or info.get("level_req", 1) > level:
+            continue
+        classes = info.get("class")
+        if classes:
+            if isinstance(classes, str):
+                classes = [classes]
+            if not wearable.intersection(classes):
+                continue
+        if item_slot not in best or info.get("level_req", 1) > best[item_slot][0]:
+            best[item_slot] = (info.get("level_req", 1), record.item_id)
+    gear = {}
+    for item_slot, (_, item_id) in best.items():
+        for equip_slot in GEAR_SLOTS[item_slot]:
+            gear[equip_slot] = item_id
+    return gear
+
+
+def build_character(build: Build) -> StatSnapshot:
+    """按配置构造临时角色（不写入数据库），用线上相同的方式计算派生属性"""
+    base = base_stats_at_level(build.char_class, build.level)
+    char = Character(
+        id=0, name=f"sim_{build.char_class}", char_class=CharacterClass(build.char_class), level=build.level,
+        hp=base["hp"], max_hp=base["hp"], mp=base["mp"], max_mp=base["mp"], attack=base["attack"],
+        magic=base["magic"], defense=base["defense"], magic_defense=base["magic_defense"], luck=base["luck"]
+    )
+    equipments = [Equipment(slot=slot, item_id=item_id, quality=build.quality, random_attrs=None, sockets=0)
+                  for slot, item_id in build.equipment.items() if DataLoader.get_item(item_id)]
+    skills = [CharacterSkill(skill_id=skill_id, level=build.skill_level)
+              for skill_id, info in DataLoader.get_all_skills(build.char_class).items()
+              if info.get("level_req", 1) <= build.level]
+    return build_snapshot(char, equipments, skills)
+
+
+def spawn_picker(map_id: str, rng: random.Random):
+    """按地图刷怪规则随机选择遭遇的怪物（普通怪等概率，Boss按刷新数量占比）"""
+    config = map_manager.map_configs.get(map_id, {})
+    monster_types = config.get("monsters", [])
+    boss = config.get("boss")
+    boss_rate = 1 / (config.get("monster_count", 60) + 1) if boss else 0
+
+    def pick() -> dict:
+        if boss_rate and rng.random() < boss_rate:
+            return {"type": boss, "id": -1, "is_boss": True}
+        monster_type = rng.choice(monster_types)
+        monster_data = {"type": monster_type, "id": 0}
+        info = DataLoader.get_monster(monster_type)
+        if info and info.get("is_boss"):
+            monster_data["is_boss"] = True
+        return monster_data
+
+    return pick
+
+
+def simulate(build: Build, map_id: str, fights: int, engage_seconds: float = 3.0, seed: int = 1) -> SimStats:
+    """模拟一个角色配置在一张地图上的连续战斗（每场战斗的种子由 seed 派生，结果可复现）"""
+    rng = random.Random(seed)
+    snapshot = build_character(build)
+    player_stats = snapshot.player_stats()
+    player_stats["char_class"] = build.char_class
+    pick = spawn_picker(map_id, rng)
+    potions = [(DataLoader.get_item(item_id), count) for item_id, count in build.potions.items()
+               if DataLoader.get_item(item_id)]
+    stats = SimStats()
+
+    for _ in range(fights):
+        monster_data = pick()
+        monster_info = DataLoader.get_monster(monster_data["type"])
+        if not monster_info:
+            continue
+        # 与线上相同：遭遇和战斗共用一场战斗的随机数生成器
+        fight_seed = rng.getrandbits(32)
+        fight_rng = random.Random(fight_seed)
+        goblin_monster = GameEngine.roll_goblin(map_id, fight_rng)
+        monsters = GameEngine.encounter_monsters(map_id, monster_data, monster_info, build.level, goblin_monster,
+                                                 fight_rng)
+        inventory = [{"info": info, "db_item": PotionStack(count)} for info, count in potions]
+
+        result = CombatEngine.pve_combat(dict(player_stats), monsters, snapshot.combat_skills(), [], DataLoader,
+                                         inventory, None, [], snapshot.combat_equipment(),
+                                         seed=fight_seed, rng=fight_rng)
+
+        stats.fights += 1
+        stats.rounds += result.rounds
+        stats.seconds += len(result.log.events) * LOG_REPLAY_SECONDS + engage_seconds
+        for item in inventory:
+            if item.get("used_count"):
+                name = item["info"].get("name", "药水")
+                stats.potions_used[name] = stats.potions_used.get(name, 0) + item["used_count"]
+        if result.victory:
+            stats.wins += 1
+            stats.exp += result.exp_gained
+            stats.gold += result.gold_gained
+            stats.drops += len(result.drops)
+            stats.equipment_drops += sum(1 for drop in result.drops if drop.get("random_attrs"))
+    return stats
+
+
+def run(builds: Iterable[Build], map_ids: List[str], fights: int, engage_seconds: float = 3.0,
+        seed: int = 1) -> List[Tuple[Build, str, dict]]:
+    """批量模拟，返回 (角色配置, 地图ID, 统计摘要) 列表"""
+    rows = []
+    for build in builds:
+        for map_id in map_ids:
+            stats = simulate(build, map_id, fights, engage_seconds, seed)
+            rows.append((build, map_id, stats.summary(build.level)))
+    return rows
+
+
+def combat_maps() -> List[str]:
+    """maps.json 中有怪物的地图"""
+    return [map_id for map_id, config in map_manager.map_configs.items() if config.get("monsters")]
+
+
+def print_report(rows: List[Tuple[Build, str, dict]]):
+    print(f"{'角色':<22}{'地图':<18}{'胜率':>7}{'回合':>7}{'秒/场':>8}{'药水/场':>9}"
+          f"{'经验/时':>11}{'金币/时':>10}{'掉落/时':>9}{'装备/时':>9}{'升级(时)':>10}")
+    for build, map_id, s in rows:
+        hours = f"{s['hours_per_level']:.2f}" if s["hours_per_level"] else "-"
+        print(f"{build.label:<22}{map_id:<18}{s['win_rate']:>7.1%}{s['avg_rounds']:>7.1f}{s['avg_seconds']:>8.1f}"
+              f"{s['potions_per_fight']:>9.2f}{s['exp_per_hour']:>11.0f}{s['gold_per_hour']:>10.0f}"
+              f"{s['drops_per_hour']:>9.1f}{s['equipment_per_hour']:>9.1f}{hours:>10}")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="离线战斗模拟")
+    parser.add_argument("--classes", default="warrior,mage,taoist")
+    parser.add_argument("--levels", default="10,20,30")
+    parser.add_argument("--maps", default="", help="逗号分隔的地图ID，默认所有有怪物的地图")
+    parser.add_argument("--fights", type=int, default=300, help="每个 (角色配置, 地图) 的战斗次数")
+    parser.add_argument("--gear", choices=["shop", "none"], default="shop")
+    parser.add_argument("--quality", default="white")
+    parser.add_argument("--engage", type=float, default=3.0, help="每场战斗的寻怪耗时（秒）")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    builds = []
+    for char_class in args.classes.split(","):
+        for level in (int(v) for v in args.levels.split(",")):
+            gear = shop_gear(char_class, level) if args.gear == "shop" else {}
+            builds.append(Build(char_class, level, gear, args.quality))
+    map_ids = args.maps.split(",") if args.maps else combat_maps()
+
+    t0 = time.perf_counter()
+    rows = run(builds, map_ids, args.fights, args.engage, args.seed)
+    print_report(rows)
+    total = len(rows) * args.fights
+    print(f"\n共 {total} 场战斗，耗时 {time.perf_counter() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,91 @@
 import asyncio
-from backend.game.map_manager import map_manager
+import heapq
+import time
+from typing import Dict, List, Optional, Tuple
+
+from backend.config import settings
+from backend.game.map_manager import MapInstance, map_manager
+from backend.metrics import metrics
+
 
 class MonsterSpawner:
-    """怪物刷新器（已禁用定时刷新）"""
-    
-    def __init__(self, interval: int = 60):
+    """怪物刷新器
+
+    怪物被击杀时按 (到期时间, 序号, 实例ID) 放入最小堆，每个tick只弹出已到期的条目，
+    在该实例的空闲刷新点补一只怪物并推送给同地图玩家。实例已被回收的条目直接丢弃。
+    每个tick的开销只与到期数量有关，与地图数量和格子数无关。
+    单个条目刷怪或推送失败时记录警告并跳过，不影响刷新循环。
+    """
+
+    def __init__(self, interval: float = 1.0, delay: float = 60.0):
         self.interval = interval
+        self.delay = delay  # 默认复活时间（秒），地图可用 respawn_seconds 覆盖，0 表示不复活
         self.running = False
-    
-    async def start(self):
-        """启动刷新循环（已禁用）"""
+        self.queue: List[Tuple[float, int, str]] = []
+        self._seq = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def schedule(self, instance: MapInstance, now: Optional[float] = None):
+        """怪物被击杀：登记该实例一次补充刷怪"""
+        delay = instance.config.get("respawn_seconds", self.delay)
+        if delay <= 0 or not instance.config.get("monsters"):
+            return
+        now = time.monotonic() if now is None else now
+        self._seq += 1
+        heapq.heappush(self.queue, (now + delay, self._seq, instance.instance_id))
+
+    def tick(self, now: Optional[float] = None) -> int:
+        """处理所有已到期的复活，返回刷出的怪物数量"""
+        now = time.monotonic() if now is None else now
+        spawned: Dict[str, Dict[Tuple[int, int], dict]] = {}
+        while self.queue and self.queue[0][0] <= now:
+            _, _, instance_id = heapq.heappop(self.queue)
+            instance = map_manager.instances.get(instance_id)
+            if instance is None:
+                continue
+            try:
+                result = instance.spawn_monster()
+            except Exception as e:
+                metrics.incr("spawner.errors")
+                print(f"[WARNING] 地图实例 {instance_id} 刷怪失败: {e}")
+                continue
+            if result is not None:
+                pos, monster_data = result
+                spawned.setdefault(instance_id, {})[pos] = monster_data
+        for instance_id, monsters in spawned.items():
+            try:
+                map_manager.instances[instance_id].publish_spawns(monsters)
+            except Exception as e:
+                metrics.incr("spawner.errors")
+                print(f"[WARNING] 地图实例 {instance_id} 推送刷怪失败: {e}")
+        return sum(len(monsters) for monsters in spawned.values())
+
+    async def _run(self):
+        while self.running:
+            await asyncio.sleep(self.interval)
+            self.tick()
+
+    def start(self):
+        """启动刷新循环"""
         self.running = True
-        # 不再执行定时刷新
-        pass
-    
-    def stop(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
         """停止刷新"""
         self.running = False
-    
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
     def respawn_all(self):
-        """刷新所有地图的怪物"""
-        for map_id, instance in map_manager.instances.items():
+        """立即补满所有地图的怪物"""
+        for instance in list(map_manager.instances.values()):
             instance.respawn_check()
 
 
-spawner = MonsterSpawner()
\ No newline at end of file
+spawner = MonsterSpawner(delay=settings.MONSTER_RESPAWN_SECONDS)
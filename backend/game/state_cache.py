@@ -0,0 +1,129 @@
+"""角色状态写回缓存 - 高频变化的角色字段（位置等）以内存为准，批量写回数据库"""
+import asyncio
+import time
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import update
+
+from backend.config import settings
+from backend.database import async_session
+from backend.metrics import metrics
+from backend.models import Character
+
+# 由缓存托管的角色字段，其余字段仍随各业务事务提交
+CACHED_FIELDS = ("map_id", "pos_x", "pos_y")
+
+
+class CharacterStateCache:
+    """角色状态缓存
+
+    在线角色的托管字段以缓存为准，修改只标记脏字段；
+    按固定间隔、切换地图、断开连接和停服时批量写回。
+    """
+
+    def __init__(self, interval: float = 5.0):
+        self.interval = interval
+        # {char_id: {字段: 值}}
+        self.states: Dict[int, dict] = {}
+        # 待写回的脏字段 {char_id: {字段: 值}}
+        self.dirty: Dict[int, dict] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    def load(self, char: Character) -> dict:
+        """角色上线时从数据库对象初始化缓存（已有缓存时保留缓存值）"""
+        state = self.states.get(char.id)
+        if state is None:
+            state = {field: getattr(char, field) for field in CACHED_FIELDS}
+            self.states[char.id] = state
+        return state
+
+    def get(self, char_id: int) -> Optional[dict]:
+        return self.states.get(char_id)
+
+    def update(self, char_id: int, **fields):
+        """修改托管字段并标记为脏"""
+        state = self.states.setdefault(char_id, {})
+        pending = self.dirty.setdefault(char_id, {})
+        for field, value in fields.items():
+            if field not in CACHED_FIELDS:
+                raise KeyError(f"字段 {field} 不由状态缓存托管")
+            state[field] = value
+            pending[field] = value
+        metrics.gauge("state_cache.dirty", len(self.dirty))
+
+    def set_position(self, char_id: int, pos, map_id: Optional[str] = None):
+        """更新角色位置（可同时更新地图）"""
+        if map_id is None:
+            self.update(char_id, pos_x=pos[0], pos_y=pos[1])
+        else:
+            self.update(char_id, map_id=map_id, pos_x=pos[0], pos_y=pos[1])
+
+    def value(self, char: Character, field: str):
+        """读取托管字段，优先取缓存值"""
+        state = self.states.get(char.id)
+        if state and field in state:
+            return state[field]
+        return getattr(char, field)
+
+    async def flush(self, char_ids: Optional[Iterable[int]] = None) -> int:
+        """批量写回脏字段，char_ids为空时写回全部，返回写回的角色数"""
+        async with self._lock:
+            if char_ids is None:
+                batch, self.dirty = self.dirty, {}
+            else:
+                batch = {cid: self.dirty.pop(cid) for cid in char_ids if cid in self.dirty}
+            metrics.gauge("state_cache.dirty", len(self.dirty))
+            if not batch:
+                return 0
+
+            start = time.perf_counter()
+            rows = [{"id": cid, **fields} for cid, fields in batch.items()]
+            try:
+                async with async_session() as session:
+                    # 按主键批量UPDATE，同字段组合的行合并为一次executemany
+                    await session.execute(update(Character), rows)
+                    await session.commit()
+            except Exception as e:
+                # 写回失败时放回队列，较新的修改优先
+                for cid, fields in batch.items():
+                    self.dirty[cid] = {**fields, **self.dirty.get(cid, {})}
+                metrics.incr("state_cache.flush_errors")
+                metrics.gauge("state_cache.dirty", len(self.dirty))
+                print(f"[WARNING] 角色状态写回失败: {e}")
+                return 0
+
+            metrics.observe("state_cache.flush", time.perf_counter() - start)
+            metrics.incr("state_cache.flushed_rows", len(rows))
+            metrics.gauge("state_cache.dirty", len(self.dirty))
+            return len(rows)
+
+    async def evict(self, char_id: int):
+        """角色下线：写回并移除缓存"""
+        await self.flush([char_id])
+        self.states.pop(char_id, None)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    def start(self):
+        """启动定时写回任务"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """停止定时任务并写回全部"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+
+# 全局实例
+character_states = CharacterStateCache(settings.STATE_FLUSH_INTERVAL)
@@ -0,0 +1,228 @@
+"""角色派生属性快照 - 装备/技能/等级不变时复用，战斗开始无需查询数据库"""
+from typing import Dict, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.game.data_loader import DataLoader
+from backend.game.effects import EffectCalculator, calculate_set_bonuses, get_item_with_attributes
+from backend.game.runeword import apply_runeword_to_equipment_info
+from backend.metrics import metrics
+from backend.models import Character, CharacterSkill, Equipment
+
+# 装备属性累加字段 {物品属性: 战斗属性}
+EQUIPMENT_STAT_KEYS = (
+    ("attack_min", "attack_min"), ("attack_max", "attack_max"),
+    ("magic_min", "magic_min"), ("magic_max", "magic_max"),
+    ("defense_min", "defense_min"), ("defense_max", "defense_max"),
+    ("magic_defense_min", "magic_defense_min"), ("magic_defense_max", "magic_defense_max"),
+    ("hp_bonus", "max_hp"), ("mp_bonus", "max_mp"),
+)
+
+# 装备槽位展示顺序
+EQUIPMENT_SLOTS = ("weapon", "helmet", "armor", "belt", "boots", "necklace",
+                   "ring_left", "ring_right", "bracelet_left", "bracelet_right")
+
+# 被动技能阶梯加成：1级5%，2级12%，3级20%
+PASSIVE_PERCENT = (0.05, 0.12, 0.20)
+
+# 创建角色时的基础属性
+CLASS_BASE_STATS = {
+    "warrior": {"hp": 150, "mp": 30, "attack": 15, "magic": 0, "defense": 10, "magic_defense": 2},
+    "mage": {"hp": 80, "mp": 100, "attack": 5, "magic": 20, "defense": 3, "magic_defense": 8},
+    "taoist": {"hp": 100, "mp": 80, "attack": 8, "magic": 12, "defense": 6, "magic_defense": 5},
+}
+
+# 每次升级获得的属性（职业不在表中时按道士）
+LEVEL_UP_GAINS = {
+    "warrior": {"hp": 25, "mp": 5, "attack": 4, "magic": 0, "defense": 3, "magic_defense": 1},
+    "mage": {"hp": 10, "mp": 20, "attack": 1, "magic": 5, "defense": 1, "magic_defense": 2},
+    "taoist": {"hp": 15, "mp": 15, "attack": 2, "magic": 3, "defense": 2, "magic_defense": 1},
+}
+
+
+def exp_to_next_level(level: int) -> int:
+    """升级所需经验（更陡峭的指数增长）"""
+    return int(level * 150 * (1.15 ** (level - 1)))
+
+
+def level_up_gains(char_class: str) -> dict:
+    return LEVEL_UP_GAINS.get(char_class, LEVEL_UP_GAINS["taoist"])
+
+
+def base_stats_at_level(char_class: str, level: int) -> dict:
+    """从1级升到指定等级后的基础属性（含每10级+1幸运）"""
+    stats = dict(CLASS_BASE_STATS[char_class], luck=0)
+    gains = level_up_gains(char_class)
+    for key, gain in gains.items():
+        stats[key] += gain * (level - 1)
+    stats["luck"] += level // 10
+    return stats
+
+
+class StatSnapshot:
+    """角色派生属性快照
+
+    combat_stats: 基础属性+装备(含符文之语)+被动技能百分比后的战斗属性
+    skills: 战斗使用的技能数据（技能配置+等级）
+    equipment_list: 战斗特效计算使用的装备信息
+    equipment_infos: 按槽位的装备信息（含符文之语，用于展示/套装）
+    effects / set_result: 装备特效汇总与套装加成
+    """
+
+    __slots__ = ("char_id", "combat_stats", "skills", "equipment_list", "equipment_infos",
+                 "effects", "set_result")
+
+    def __init__(self, char_id: int, combat_stats: dict, skills: List[dict], equipment_list: List[dict],
+                 equipment_infos: Dict[str, dict], effects: dict, set_result: dict):
+        self.char_id = char_id
+        self.combat_stats = combat_stats
+        self.skills = skills
+        self.equipment_list = equipment_list
+        self.equipment_infos = equipment_infos
+        self.effects = effects
+        self.set_result = set_result
+
+    def player_stats(self) -> dict:
+        """战斗属性副本（调用方可自由修改）"""
+        return dict(self.combat_stats)
+
+    def combat_skills(self) -> List[dict]:
+        return [dict(skill) for skill in self.skills]
+
+    def combat_equipment(self) -> List[dict]:
+        return [{"info": equip["info"]} for equip in self.equipment_list]
+
+
+def build_snapshot(char: Character, equipments: List[Equipment], skills: List[CharacterSkill]) -> StatSnapshot:
+    """根据角色、装备和技能计算快照（纯计算，不访问数据库）"""
+    stats = {
+        "id": char.id,
+        "name": char.name,
+        "level": char.level,
+        "max_hp": char.max_hp,
+        "max_mp": char.max_mp,
+        "attack_min": char.attack,
+        "attack_max": char.attack,
+        "magic_min": 0,
+        "magic_max": 0,
+        "defense_min": char.defense,
+        "defense_max": char.defense,
+        "magic_defense_min": 0,
+        "magic_defense_max": 0,
+        "luck": char.luck
+    }
+
+    equipment_list = []
+    equipment_infos = {}
+    for equip in equipments:
+        base_info = DataLoader.get_item(equip.item_id)
+        # 战斗特效使用带随机属性的装备信息
+        item_with_attrs = get_item_with_attributes(base_info, equip.quality, equip.random_attrs)
+        if item_with_attrs:
+            equipment_list.append({"info": item_with_attrs})
+
+        # 应用符文/符文之语效果
+        equip_data = {
+            "sockets": getattr(equip, 'sockets', 0) or 0,
+            "socketed_runes": getattr(equip, 'socketed_runes', None) or [],
+            "runeword_id": getattr(equip, 'runeword_id', None),
+            "slot": equip.slot
+        }
+        if equip_data["sockets"] > 0:
+            item_with_attrs = apply_runeword_to_equipment_info(item_with_attrs, equip_data)
+        # 同槽位存在多条记录时以第一条为准（与 get_equipment 一致）
+        equipment_infos.setdefault(equip.slot, item_with_attrs)
+
+        # 使用随机后的属性值
+        for item_key, stat_key in EQUIPMENT_STAT_KEYS:
+            stats[stat_key] += item_with_attrs.get(item_key, 0)
+
+    # 加上被动技能属性（按基础属性百分比增加）
+    skill_list = []
+    char_class = char.char_class.value
+    for skill in skills:
+        skill_info = DataLoader.get_skill(skill.skill_id, char_class)
+        if not skill_info:
+            continue
+        skill_list.append({**skill_info, "level": skill.level, "skill_id": skill.skill_id})
+        if skill_info.get("type") != "passive":
+            continue
+        effect = skill_info.get("effect", {})
+        percent_bonus = PASSIVE_PERCENT[min(skill.level, 3) - 1] if skill.level > 0 else 0
+
+        if effect.get("attack_bonus"):
+            bonus = int(char.attack * percent_bonus)
+            stats["attack_min"] += bonus
+            stats["attack_max"] += bonus
+        if effect.get("defense_bonus"):
+            bonus = int(char.defense * percent_bonus)
+            stats["defense_min"] += bonus
+            stats["defense_max"] += bonus
+        if effect.get("magic_defense_bonus"):
+            bonus = int(char.magic_defense * percent_bonus)
+            stats["magic_defense_min"] += bonus
+            stats["magic_defense_max"] += bonus
+        if effect.get("hp_bonus"):
+            stats["max_hp"] += int(char.max_hp * percent_bonus)
+        if effect.get("mp_bonus"):
+            stats["max_mp"] += int(char.max_mp * percent_bonus)
+
+    # 兼容旧代码：取平均值
+    stats["attack"] = (stats["attack_min"] + stats["attack_max"]) // 2
+    stats["defense"] = (stats["defense_min"] + stats["defense_max"]) // 2
+
+    # 装备特效与套装加成（展示用，按槽位顺序与 get_equipment 一致）
+    effect_list = [{"info": equipment_infos[slot]} for slot in EQUIPMENT_SLOTS if equipment_infos.get(slot)]
+    effects = EffectCalculator.get_equipment_effects(effect_list)
+    set_result = calculate_set_bonuses(effect_list, DataLoader.get_sets(), include_full_config=True)
+
+    return StatSnapshot(char.id, stats, skill_list, equipment_list, equipment_infos, effects, set_result)
+
+
+class StatCache:
+    """派生属性快照缓存
+
+    穿戴装备、镶嵌符文、学习技能、升级和技能等级变化时调用 invalidate。
+    版本号防止构建期间发生的失效被旧快照覆盖。
+    """
+
+    def __init__(self):
+        self.snapshots: Dict[int, StatSnapshot] = {}
+        self.versions: Dict[int, int] = {}
+
+    def invalidate(self, char_id: int):
+        """标记角色快照失效"""
+        self.versions[char_id] = self.versions.get(char_id, 0) + 1
+        self.snapshots.pop(char_id, None)
+
+    def peek(self, char_id: int) -> Optional[StatSnapshot]:
+        return self.snapshots.get(char_id)
+
+    async def get(self, char: Character, db: AsyncSession) -> StatSnapshot:
+        """获取快照，失效时查询装备和技能重新构建"""
+        snapshot = self.snapshots.get(char.id)
+        if snapshot is not None:
+            metrics.incr("stat_cache.hit")
+            return snapshot
+
+        metrics.incr("stat_cache.miss")
+        version = self.versions.get(char.id, 0)
+        equip_result = await db.execute(select(Equipment).where(Equipment.character_id == char.id))
+        equipments = equip_result.scalars().all()
+        skills_result = await db.execute(select(CharacterSkill).where(CharacterSkill.character_id == char.id))
+        skills = skills_result.scalars().all()
+
+        snapshot = build_snapshot(char, equipments, skills)
+        if self.versions.get(char.id, 0) == version:
+            self.snapshots[char.id] = snapshot
+        return snapshot
+
+    def evict(self, char_id: int):
+        """角色下线时移除"""
+        self.snapshots.pop(char_id, None)
+        self.versions.pop(char_id, None)
+
+
+# 全局实例
+stat_cache = StatCache()
@@ -5,30 +5,53 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from contextlib import asynccontextmanager
 import asyncio
+from typing import Optional
 
-from backend.database import get_db, init_db
+from backend.database import get_db, init_db, async_session
 from backend.models import User, Character, CharacterClass, Guild, GuildMember, GuildRank
 from backend.schemas import UserRegister, UserLogin, TokenResponse, CharacterCreate, CharacterResponse
 from backend.auth import hash_password, verify_password, create_token, decode_token
 from backend.websocket.manager import manager
+from backend.websocket.dispatcher import dispatcher, ClientContext
+from backend.websocket.actor import actors
+from backend.websocket.codec import get_codec
+import backend.websocket.handlers  # 导入即注册消息处理函数
 from backend.game.engine import GameEngine
 from backend.game.data_loader import DataLoader
-from backend.game.map_manager import map_manager
+from backend.game.drops import DropTables
+from backend.game.events import map_events
+from backend.game.map_lifecycle import map_lifecycle
 from backend.game.spawner import spawner
-from backend.game.pvp import PVPSystem
+from backend.game.state_cache import character_states
+from backend.game.stats import CLASS_BASE_STATS, stat_cache
+from backend.game.inventory import slot_index, inventory_key, warehouse_key
 from backend.api.recharge import router as recharge_router
+from backend.api.admin import router as admin_router
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     await init_db()
-    # 怪物刷新器已禁用
-    # asyncio.create_task(spawner.start())
+    # 启动时构建物品目录
+    DataLoader.build_item_catalog()
+    # 预编译所有怪物的掉落表
+    DropTables.warm()
+    # 被击杀的怪物按复活时间补充
+    spawner.start()
+    # 角色状态定时写回
+    character_states.start()
+    # 地图事件通过WebSocket推送给同地图玩家
+    map_events.subscribe(manager.multicast)
+    # 后台预生成地图实例、回收空闲实例
+    map_lifecycle.start()
     yield
-    spawner.stop()
+    await spawner.stop()
+    await map_lifecycle.stop()
+    await character_states.stop()
 
 app = FastAPI(title="MUD Legend", lifespan=lifespan)
 app.mount("/static", StaticFiles(directory="frontend"), name="static")
 app.include_router(recharge_router)
+app.include_router(admin_router)
 
 @app.get("/")
 async def index():
@@ -80,12 +103,7 @@ async def create_character(data: CharacterCreate, token: str, db: AsyncSession =
     if existing.scalar_one_or_none():
         raise HTTPException(400, "角色名已存在")
     
-    base_stats = {
-        CharacterClass.WARRIOR: {"hp": 150, "mp": 30, "attack": 15, "magic": 0, "defense": 10, "magic_defense": 2},
-        CharacterClass.MAGE: {"hp": 80, "mp": 100, "attack": 5, "magic": 20, "defense": 3, "magic_defense": 8},
-        CharacterClass.TAOIST: {"hp": 100, "mp": 80, "attack": 8, "magic": 12, "defense": 6, "magic_defense": 5},
-    }
-    stats = base_stats[data.char_class]
+    stats = CLASS_BASE_STATS[data.char_class.value]
     char = Character(
         user_id=user_id, name=name, char_class=data.char_class,
         hp=stats["hp"], max_hp=stats["hp"], mp=stats["mp"], max_mp=stats["mp"],
@@ -118,6 +136,8 @@ async def delete_character(char_id: int, token: str, db: AsyncSession = Depends(
     await db.execute(delete(CharacterSkill).where(CharacterSkill.character_id == char_id))
     await db.delete(char)
     await db.commit()
+    stat_cache.evict(char_id)
+    slot_index.evict(inventory_key(char_id))
     
     return {"success": True}
 
@@ -203,185 +223,52 @@ async def get_guild(guild_id: int, db: AsyncSession = Depends(get_db)):
 
 # ============ WebSocket游戏通信 ============
 @app.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket, token: str, char_id: int, db: AsyncSession = Depends(get_db)):
+async def websocket_endpoint(websocket: WebSocket, token: str, char_id: int, encoding: Optional[str] = None):
     user_id = decode_token(token)
     if not user_id:
         await websocket.close(code=4001)
         return
     
-    char = await db.get(Character, char_id)
-    if not char or char.user_id != user_id:
-        await websocket.close(code=4002)
+    # 下行消息编码（json/compact/msgpack），上行消息始终为JSON文本
+    codec = get_codec(encoding)
+    if codec is None:
+        await websocket.close(code=4003)
         return
     
-    await manager.connect(char_id, websocket)
-    
-    # 进入游戏
-    enter_result = await GameEngine.enter_game(char_id, db)
+    # 鉴权和进入游戏使用短会话，之后每条消息由分发器单独开会话
+    async with async_session() as db:
+        char = await db.get(Character, char_id)
+        if not char or char.user_id != user_id:
+            await websocket.close(code=4002)
+            return
+        
+        await manager.connect(char_id, websocket, codec)
+        
+        # 进入游戏
+        enter_result = await GameEngine.enter_game(char_id, db)
+        await db.commit()
     await manager.send(char_id, {"type": "enter_game", "data": enter_result})
     
+    # 修改状态的消息由角色执行器按顺序执行，接收循环可以继续应答只读消息
+    ctx = ClientContext(char_id, user_id, char.name, websocket, actors.acquire(char_id))
     try:
         while True:
-            data = await websocket.receive_json()
-            msg_type = data.get("type")
-            
-            if msg_type == "move":
-                result = await GameEngine.move(char_id, data["x"], data["y"], db)
-                await manager.send(char_id, {"type": "move_result", "data": result})
-                # 无论移动成功还是失败（遇到怪物），都更新地图状态
-                # 这样可以显示阻挡路径的怪物
-                await manager.send(char_id, {"type": "map_state", "data": map_manager.get_state(char_id)})
-                if result.get("success"):
-                    state = GameEngine._char_to_dict(await db.get(Character, char_id))
-            
-            elif msg_type == "attack":
-                pos = tuple(data["pos"])
-                result = await GameEngine.attack_monster(char_id, pos, db)
-                await manager.send(char_id, {"type": "combat_result", "data": result})
-                if result.get("victory"):
-                    await manager.send(char_id, {"type": "map_state", "data": map_manager.get_state(char_id)})
-            
-            elif msg_type == "use_entrance":
-                result = await GameEngine.use_entrance(char_id, data.get("entrance_id"), db)
-                await manager.send(char_id, {"type": "map_change", "data": result})
-            
-            elif msg_type == "use_exit":
-                result = await GameEngine.use_exit(char_id, data.get("exit_type", "exit"), db)
-                await manager.send(char_id, {"type": "map_change", "data": result})
-            
-            elif msg_type == "return_city":
-                result = await GameEngine.return_to_city(char_id, db)
-                await manager.send(char_id, {"type": "map_change", "data": result})
-            
-            elif msg_type == "get_inventory":
-                items = await GameEngine.get_inventory(char_id, data.get("storage", "inventory"), db)
-                await manager.send(char_id, {"type": "inventory", "data": items})
-            
-            elif msg_type == "equip":
-                result = await GameEngine.equip_item(char_id, data["slot"], db, data.get("target_slot"))
-                await manager.send(char_id, {"type": "equip_result", "data": result})
-            
-            elif msg_type == "recycle":
-                result = await GameEngine.recycle_item(char_id, data["slot"], db)
-                await manager.send(char_id, {"type": "recycle_result", "data": result})
-            
-            elif msg_type == "recycle_all":
-                filter_type = data.get("filter", "all")
-                result = await GameEngine.recycle_all(char_id, db, filter_type)
-                await manager.send(char_id, {"type": "recycle_result", "data": result})
-            
-            elif msg_type == "move_to_warehouse":
-                result = await GameEngine.move_to_warehouse(char_id, data["slot"], db)
-                await manager.send(char_id, {"type": "move_result", "data": result})
-            
-            elif msg_type == "organize_inventory":
-                storage = data.get("storage", "inventory")
-                result = await GameEngine.organize_inventory(char_id, storage, db)
-                await manager.send(char_id, {"type": "organize_result", "data": result})
-                # 整理后自动返回最新背包数据
-                items = await GameEngine.get_inventory(char_id, storage, db)
-                await manager.send(char_id, {"type": "inventory", "data": items})
-            
-            elif msg_type == "move_to_inventory":
-                result = await GameEngine.move_to_inventory(char_id, data["slot"], db)
-                await manager.send(char_id, {"type": "move_result", "data": result})
-            
-            elif msg_type == "learn_skill":
-                result = await GameEngine.learn_skill(char_id, data["skill_id"], db)
-                await manager.send(char_id, {"type": "learn_result", "data": result})
-            
-            elif msg_type == "use_skillbook":
-                result = await GameEngine.use_skillbook(char_id, data["slot"], db)
-                await manager.send(char_id, {"type": "skillbook_result", "data": result})
-            
-            elif msg_type == "use_boss_item":
-                try:
-                    result = await GameEngine.use_boss_item(char_id, data["slot"], db)
-                    await manager.send(char_id, {"type": "combat_result", "data": result})
-                except Exception as e:
-                    import traceback
-                    traceback.print_exc()
-                    await manager.send(char_id, {"type": "combat_result", "data": {"success": False, "error": str(e)}})
-            
-            elif msg_type == "use_skill":
-                result = await GameEngine.use_skill(char_id, data["skill_id"], db)
-                await manager.send(char_id, {"type": "skill_used", "data": result})
-            
-            elif msg_type == "get_equipment":
-                result = await GameEngine.get_equipment(char_id, db)
-                await manager.send(char_id, {"type": "equipment", "data": result})
-            
-            elif msg_type == "attack_player":
-                target_id = data.get("target_id")
-                result = await PVPSystem.attack_player(char_id, target_id, db)
-                await manager.send(char_id, {"type": "pvp_result", "data": result})
-                if result.get("success"):
-                    await manager.send(target_id, {"type": "pvp_attacked", "data": result})
-            
-            elif msg_type == "get_map_state":
-                await manager.send(char_id, {"type": "map_state", "data": map_manager.get_state(char_id)})
-            
-            elif msg_type == "reset_map":
-                map_manager.reset_map(char_id)
-                await manager.send(char_id, {"type": "map_state", "data": map_manager.get_state(char_id)})
-            
-            elif msg_type == "toggle_skill":
-                skill_id = data.get("skill_id")
-                enabled = data.get("enabled", True)
-                if char_id not in GameEngine.disabled_skills:
-                    GameEngine.disabled_skills[char_id] = []
-                if enabled and skill_id in GameEngine.disabled_skills[char_id]:
-                    GameEngine.disabled_skills[char_id].remove(skill_id)
-                elif not enabled and skill_id not in GameEngine.disabled_skills[char_id]:
-                    GameEngine.disabled_skills[char_id].append(skill_id)
-                await manager.send(char_id, {"type": "skill_toggled", "data": {"skill_id": skill_id, "enabled": enabled}})
-            
-            elif msg_type == "get_disabled_skills":
-                disabled = GameEngine.disabled_skills.get(char_id, [])
-                await manager.send(char_id, {"type": "disabled_skills", "data": disabled})
-
-            elif msg_type == "socket_rune":
-                # 镶嵌符文到装备
-                equipment_slot = data.get("equipment_slot")
-                rune_slot = data.get("rune_slot")
-                result = await GameEngine.socket_rune_to_equipment(char_id, equipment_slot, rune_slot, db)
-                await manager.send(char_id, {"type": "socket_rune_result", "data": result})
-                # 同时更新装备和背包
-                if result.get("success"):
-                    equipment = await GameEngine.get_equipment(char_id, db)
-                    await manager.send(char_id, {"type": "equipment", "data": equipment})
-                    inventory = await GameEngine.get_inventory(char_id, "inventory", db)
-                    await manager.send(char_id, {"type": "inventory", "data": inventory})
-
-            elif msg_type == "socket_rune_inventory":
-                # 镶嵌符文到背包中的装备
-                target_slot = data.get("target_slot")
-                rune_slot = data.get("rune_slot")
-                result = await GameEngine.socket_rune_to_inventory_item(char_id, target_slot, rune_slot, db)
-                await manager.send(char_id, {"type": "socket_rune_result", "data": result})
-                # 更新背包
-                if result.get("success"):
-                    inventory = await GameEngine.get_inventory(char_id, "inventory", db)
-                    await manager.send(char_id, {"type": "inventory", "data": inventory})
-
-            elif msg_type == "get_runewords":
-                # 获取所有符文之语配方
-                runewords = DataLoader.get_all_runewords()
-                await manager.send(char_id, {"type": "runewords", "data": runewords})
-
-            elif msg_type == "get_runes":
-                # 获取所有符文数据
-                runes = DataLoader.get_all_runes()
-                await manager.send(char_id, {"type": "runes", "data": runes})
-
-            elif msg_type == "chat":
-                await manager.broadcast({"type": "chat", "char_id": char_id, "name": char.name, "message": data.get("message", "")})
-            
-            elif msg_type == "ping":
-                await manager.send(char_id, {"type": "pong"})
+            raw = await websocket.receive_text()
+            await dispatcher.dispatch(ctx, raw)
     
     except WebSocketDisconnect:
-        manager.disconnect(char_id)
+        pass
+    finally:
+        # 先执行完已收到的操作，再断开连接并写回缓存的角色状态
+        await actors.release(char_id)
+        manager.disconnect(char_id, websocket)
+        # 已被新连接顶替时角色仍在线，保留其地图位置和各项缓存供新连接继续使用
+        if char_id not in manager.connections:
+            map_lifecycle.detach(char_id)
+            await character_states.evict(char_id)
+            stat_cache.evict(char_id)
+            slot_index.evict(inventory_key(char_id))
+            slot_index.evict(warehouse_key(user_id))
 
 if __name__ == "__main__":
     import uvicorn
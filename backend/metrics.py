@@ -0,0 +1,127 @@
+"""运行时指标 - 进程内计数器、仪表和耗时统计，供管理接口查询"""
+import time
+from collections import deque
+from typing import Deque, Dict
+
+
+class Histogram:
+    """数值分布 - 累计次数/总和/最大值，并保留最近样本用于分位数"""
+
+    __slots__ = ("count", "total", "max", "last", "samples")
+
+    def __init__(self, window: int = 1024):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+        self.samples: Deque[float] = deque(maxlen=window)
+
+    def observe(self, value: float):
+        self.count += 1
+        self.total += value
+        self.last = value
+        if value > self.max:
+            self.max = value
+        self.samples.append(value)
+
+    def _summary(self, scale: float, suffix: str) -> dict:
+        ordered = sorted(self.samples)
+
+        def pct(p: float) -> float:
+            if not ordered:
+                return 0.0
+            return ordered[min(len(ordered) - 1, int(len(ordered) * p))] * scale
+
+        return {
+            "count": self.count,
+            f"avg{suffix}": self.total / self.count * scale if self.count else 0.0,
+            f"last{suffix}": self.last * scale,
+            f"max{suffix}": self.max * scale,
+            f"p50{suffix}": pct(0.5),
+            f"p95{suffix}": pct(0.95),
+            f"p99{suffix}": pct(0.99),
+        }
+
+    def snapshot(self) -> dict:
+        return self._summary(1, "")
+
+
+class Timer(Histogram):
+    """耗时统计（秒记录，毫秒导出）"""
+
+    __slots__ = ()
+
+    def snapshot(self) -> dict:
+        """导出为毫秒单位的统计"""
+        return self._summary(1000, "_ms")
+
+
+class Metrics:
+    """指标注册中心"""
+
+    def __init__(self):
+        self.counters: Dict[str, int] = {}
+        self.gauges: Dict[str, float] = {}
+        self.timers: Dict[str, Timer] = {}
+        self.histograms: Dict[str, Histogram] = {}
+
+    def incr(self, name: str, amount: int = 1):
+        """计数器累加"""
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def gauge(self, name: str, value: float):
+        """设置仪表当前值"""
+        self.gauges[name] = value
+
+    def observe(self, name: str, seconds: float):
+        """记录一次耗时"""
+        timer = self.timers.get(name)
+        if timer is None:
+            timer = self.timers[name] = Timer()
+        timer.observe(seconds)
+
+    def sample(self, name: str, value: float):
+        """记录一个数值样本（如消息大小）"""
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        histogram.observe(value)
+
+    def timed(self, name: str) -> "_TimerContext":
+        """耗时统计上下文: with metrics.timed("xxx"): ..."""
+        return _TimerContext(self, name)
+
+    def snapshot(self) -> dict:
+        return {
+            "counters": dict(self.counters),
+            "gauges": dict(self.gauges),
+            "timers": {name: timer.snapshot() for name, timer in self.timers.items()},
+            "histograms": {name: h.snapshot() for name, h in self.histograms.items()},
+        }
+
+    def reset(self):
+        self.counters.clear()
+        self.gauges.clear()
+        self.timers.clear()
+        self.histograms.clear()
+
+
+class _TimerContext:
+    __slots__ = ("metrics", "name", "start")
+
+    def __init__(self, metrics: Metrics, name: str):
+        self.metrics = metrics
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.observe(self.name, time.perf_counter() - self.start)
+        return False
+
+
+# 全局实例
+metrics = Metrics()
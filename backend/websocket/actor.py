@@ -0,0 +1,101 @@
+"""角色执行器 - 每个在线角色一个任务和邮箱，修改状态的消息按到达顺序逐条执行"""
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+from backend.metrics import metrics
+
+# 邮箱容量：客户端堆积过多未处理的操作时拒绝新操作
+MAILBOX_SIZE = 64
+
+Job = Callable[[], Awaitable[None]]
+
+
+class CharacterActor:
+    """单个角色的执行器
+
+    接收循环只负责把消息放入邮箱，慢操作（战斗、批量回收）不会阻塞
+    同一连接上的只读请求；同一角色的多个连接（重连）共享一个执行器，保证顺序。
+    """
+
+    def __init__(self, char_id: int, mailbox_size: int = MAILBOX_SIZE, previous: Optional["CharacterActor"] = None):
+        self.char_id = char_id
+        self.mailbox: asyncio.Queue = asyncio.Queue(maxsize=mailbox_size)
+        self.task: Optional[asyncio.Task] = None
+        self.refs = 0
+        # 上一个执行器仍在执行剩余任务时（断线后立即重连），等它结束再开始
+        self.previous = previous
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    def post(self, job: Job) -> bool:
+        """投递任务，邮箱已满返回False"""
+        try:
+            self.mailbox.put_nowait((job, time.perf_counter()))
+        except asyncio.QueueFull:
+            metrics.incr("actor.mailbox_full")
+            return False
+        return True
+
+    async def _run(self):
+        if self.previous is not None:
+            await asyncio.wait([self.previous.task])
+            self.previous = None
+        while True:
+            item = await self.mailbox.get()
+            if item is None:
+                return
+            job, posted_at = item
+            metrics.observe("actor.mailbox_wait", time.perf_counter() - posted_at)
+            try:
+                await job()
+            except Exception as e:
+                # 分发器已处理业务异常，这里只兜底保证执行器不退出
+                print(f"[WARNING] 角色 {self.char_id} 执行任务失败: {e}")
+
+    async def close(self):
+        """执行完已投递的任务后停止"""
+        if self.task is None:
+            return
+        await self.mailbox.put(None)
+        await self.task
+
+
+class ActorRegistry:
+    """在线角色的执行器表（按连接引用计数）"""
+
+    def __init__(self):
+        self.actors: Dict[int, CharacterActor] = {}
+        # 正在执行剩余任务的执行器
+        self.closing: Dict[int, CharacterActor] = {}
+
+    def acquire(self, char_id: int) -> CharacterActor:
+        actor = self.actors.get(char_id)
+        if actor is None:
+            actor = self.actors[char_id] = CharacterActor(char_id, previous=self.closing.get(char_id))
+            actor.start()
+        actor.refs += 1
+        metrics.gauge("actor.count", len(self.actors))
+        return actor
+
+    async def release(self, char_id: int):
+        """连接断开：最后一个连接断开时执行完剩余任务并移除"""
+        actor = self.actors.get(char_id)
+        if actor is None:
+            return
+        actor.refs -= 1
+        if actor.refs <= 0:
+            self.actors.pop(char_id, None)
+            metrics.gauge("actor.count", len(self.actors))
+            self.closing[char_id] = actor
+            try:
+                await actor.close()
+            finally:
+                if self.closing.get(char_id) is actor:
+                    del self.closing[char_id]
+
+
+# 全局实例
+actors = ActorRegistry()
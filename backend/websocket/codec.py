@@ -0,0 +1,114 @@
+"""WebSocket消息编码 - 连接时通过 /ws?encoding= 协商，默认JSON
+
+json     与 send_json 相同的文本帧，战斗日志为旧版文字
+compact  文本帧JSON，地图迷宫打包为位图（base64），迷雾本就是位图；战斗日志为事件列表，由客户端渲染
+msgpack  二进制帧（需要安装msgpack），迷宫位图直接以bytes传输，战斗日志同compact
+"""
+import base64
+import json
+from typing import Dict, List, Optional, Union
+
+from backend.game.combat_log import CombatLog
+
+try:
+    import msgpack
+except ImportError:  # 可选依赖，未安装时不提供msgpack编码
+    msgpack = None
+
+Payload = Union[str, bytes]
+
+
+def pack_maze(maze: List[List[int]]) -> bytes:
+    """迷宫打包为位图：第 y*width+x 位为1表示墙（小端字节序，与迷雾位图布局一致）"""
+    width = len(maze[0]) if maze else 0
+    mask = 0
+    for y, row in enumerate(maze):
+        base = y * width
+        for x, cell in enumerate(row):
+            if cell == 1:
+                mask |= 1 << (base + x)
+    return mask.to_bytes((width * len(maze) + 7) // 8, "little")
+
+
+def _pack_state(state: Optional[dict], binary: bool) -> Optional[dict]:
+    """地图状态中的迷宫替换为位图（返回副本，不修改原消息）"""
+    if not isinstance(state, dict) or not isinstance(state.get("maze"), list):
+        return state
+    maze = state["maze"]
+    packed = pack_maze(maze)
+    return {
+        **state,
+        "maze": packed if binary else base64.b64encode(packed).decode("ascii"),
+        "maze_width": len(maze[0]) if maze else 0,
+        "maze_height": len(maze),
+    }
+
+
+def compact_message(message: dict, binary: bool = False) -> dict:
+    """紧凑格式：带完整地图状态的消息（map_state / map_change / enter_game）打包迷宫"""
+    msg_type = message.get("type")
+    data = message.get("data")
+    if msg_type == "map_state":
+        return {**message, "data": _pack_state(data, binary)}
+    if msg_type == "map_change" and isinstance(data, dict) and "state" in data:
+        return {**message, "data": {**data, "state": _pack_state(data["state"], binary)}}
+    if msg_type == "enter_game" and isinstance(data, dict) and "map" in data:
+        return {**message, "data": {**data, "map": _pack_state(data["map"], binary)}}
+    return message
+
+
+class JsonCodec:
+    """JSON文本帧（默认）"""
+
+    name = "json"
+    binary = False
+
+    def encode(self, message: dict) -> Payload:
+        return json.dumps(message, separators=(",", ":"), ensure_ascii=False, default=self.default)
+
+    @staticmethod
+    def default(obj):
+        """战斗日志在编码时才生成文字"""
+        if isinstance(obj, CombatLog):
+            return obj.render()
+        raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class CompactCodec(JsonCodec):
+    """JSON文本帧 + 迷宫位图"""
+
+    name = "compact"
+
+    def encode(self, message: dict) -> Payload:
+        return super().encode(compact_message(message))
+
+    @staticmethod
+    def default(obj):
+        """战斗日志发送事件列表"""
+        if isinstance(obj, CombatLog):
+            return obj.to_wire()
+        raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class MsgpackCodec:
+    """msgpack二进制帧 + 迷宫位图（整数键保持为整数，解码时需 strict_map_key=False）"""
+
+    name = "msgpack"
+    binary = True
+
+    def encode(self, message: dict) -> Payload:
+        return msgpack.packb(compact_message(message, binary=True), use_bin_type=True, default=CompactCodec.default)
+
+
+CODECS: Dict[str, JsonCodec] = {"json": JsonCodec(), "compact": CompactCodec()}
+if msgpack is not None:
+    CODECS["msgpack"] = MsgpackCodec()
+
+DEFAULT_CODEC = CODECS["json"]
+
+
+def get_codec(name: Optional[str]):
+    """按名称获取编码器，未指定时为JSON，不支持（或未安装）时返回None"""
+    if not name:
+        return DEFAULT_CODEC
+    return CODECS.get(name)
@@ -0,0 +1,133 @@
+"""WebSocket消息分发 - 消息类型注册到处理函数，按声明的字段校验，每条消息使用独立的数据库会话"""
+import json
+import time
+import traceback
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from fastapi import WebSocket
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.database import async_session
+from backend.metrics import metrics
+from backend.websocket.actor import CharacterActor
+from backend.websocket.manager import manager
+
+
+class ClientContext:
+    """一个WebSocket连接的身份信息（不持有数据库会话）"""
+
+    __slots__ = ("char_id", "user_id", "name", "websocket", "actor")
+
+    def __init__(self, char_id: int, user_id: int, name: str, websocket: WebSocket,
+                 actor: Optional[CharacterActor] = None):
+        self.char_id = char_id
+        self.user_id = user_id
+        self.name = name
+        self.websocket = websocket
+        # 角色执行器，为None时所有消息在接收循环中直接执行
+        self.actor = actor
+
+
+class SchemaError(ValueError):
+    """消息字段不符合声明"""
+
+
+# 字段声明: {字段: 类型} 为必填；{字段: (类型, 默认值)} 为选填
+Schema = Dict[str, Any]
+Handler = Callable[[ClientContext, dict, Optional[AsyncSession]], Awaitable[None]]
+
+
+def validate(schema: Schema, data: dict) -> dict:
+    """按声明校验并补全默认值，返回处理函数使用的参数"""
+    args = {}
+    for field, spec in schema.items():
+        if isinstance(spec, tuple):
+            expected, default = spec
+            value = data.get(field, default)
+            if value is None and default is None:
+                args[field] = None
+                continue
+        else:
+            expected = spec
+            if field not in data:
+                raise SchemaError(f"缺少字段 {field}")
+            value = data[field]
+        # bool 是 int 的子类，数值字段不接受布尔值
+        if not isinstance(value, expected) or (expected is int and isinstance(value, bool)):
+            raise SchemaError(f"字段 {field} 类型错误")
+        args[field] = value
+    return args
+
+
+class Dispatcher:
+    """消息分发表
+
+    用 @dispatcher.handler("move", {"x": int, "y": int}) 注册处理函数，处理函数签名为
+    async def handler(ctx, args, db)。uses_db=False 的处理函数不打开数据库会话（db为None）。
+    修改状态的消息投递到角色执行器按顺序执行；concurrent=True 的只读消息（只读缓存/内存）
+    在接收循环中直接应答，不排在战斗等慢操作后面。
+    每次分发记录 ws.handler.<type> 耗时、ws.payload.<type> 消息大小和 ws.errors.<type> 错误数。
+    """
+
+    def __init__(self):
+        self.handlers: Dict[str, Tuple[Handler, Schema, bool, bool]] = {}
+
+    def handler(self, msg_type: str, schema: Optional[Schema] = None, uses_db: bool = True,
+                concurrent: bool = False):
+        def register(func: Handler) -> Handler:
+            if msg_type in self.handlers:
+                raise ValueError(f"消息类型 {msg_type} 重复注册")
+            self.handlers[msg_type] = (func, schema or {}, uses_db, concurrent)
+            return func
+        return register
+
+    async def dispatch(self, ctx: ClientContext, raw: str):
+        """解析并处理一条消息，处理函数的异常不会断开连接"""
+        try:
+            data = json.loads(raw)
+            msg_type = data.get("type")
+        except (ValueError, AttributeError):
+            metrics.incr("ws.errors.invalid_json")
+            return
+
+        entry = self.handlers.get(msg_type)
+        if entry is None:
+            metrics.incr("ws.errors.unknown_type")
+            return
+        func, schema, uses_db, concurrent = entry
+        metrics.sample(f"ws.payload.{msg_type}", len(raw))
+
+        try:
+            args = validate(schema, data)
+        except SchemaError as e:
+            metrics.incr(f"ws.errors.{msg_type}")
+            await manager.send(ctx.char_id, {"type": "error", "data": {"request": msg_type, "error": str(e)}})
+            return
+
+        if concurrent or ctx.actor is None:
+            await self._execute(ctx, msg_type, func, args, uses_db)
+        elif not ctx.actor.post(lambda: self._execute(ctx, msg_type, func, args, uses_db)):
+            await manager.send(ctx.char_id, {"type": "error", "data": {"request": msg_type, "error": "操作过于频繁，请稍后再试"}})
+
+    async def _execute(self, ctx: ClientContext, msg_type: str, func: Handler, args: dict, uses_db: bool):
+        start = time.perf_counter()
+        try:
+            if uses_db:
+                async with async_session() as db:
+                    await func(ctx, args, db)
+                    # 每条消息一个事务：处理函数未提交的修改（如战斗失败时已扣除的药水）在此提交
+                    if db.in_transaction():
+                        await db.commit()
+            else:
+                await func(ctx, args, None)
+        except Exception as e:
+            metrics.incr(f"ws.errors.{msg_type}")
+            print(f"[WARNING] 处理消息 {msg_type} 失败: {e}")
+            traceback.print_exc()
+            await manager.send(ctx.char_id, {"type": "error", "data": {"request": msg_type, "error": "服务器内部错误"}})
+        finally:
+            metrics.observe(f"ws.handler.{msg_type}", time.perf_counter() - start)
+
+
+# 全局实例
+dispatcher = Dispatcher()
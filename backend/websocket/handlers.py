@@ -0,0 +1,223 @@
+"""WebSocket消息处理函数 - 注册到分发表，新增消息类型只需在此添加一个处理函数"""
+import traceback
+
+from backend.game.data_loader import DataLoader
+from backend.game.engine import GameEngine
+from backend.game.events import PVP
+from backend.game.map_manager import map_manager
+from backend.game.pvp import PVPSystem
+from backend.websocket.dispatcher import dispatcher
+from backend.websocket.manager import manager
+
+
+# ============ 地图与移动 ============
+@dispatcher.handler("move", {"x": int, "y": int})
+async def handle_move(ctx, args, db):
+    result = await GameEngine.move(ctx.char_id, args["x"], args["y"], db)
+    await manager.send(ctx.char_id, {"type": "move_result", "data": result})
+    # 无论移动成功还是失败（遇到怪物），都更新地图状态
+    # 这样可以显示阻挡路径的怪物；完整状态只在进入地图时发送，之后只发增量
+    await manager.send(ctx.char_id, map_manager.get_update(ctx.char_id))
+
+
+@dispatcher.handler("use_entrance", {"entrance_id": (str, None)})
+async def handle_use_entrance(ctx, args, db):
+    result = await GameEngine.use_entrance(ctx.char_id, args["entrance_id"], db)
+    await manager.send(ctx.char_id, {"type": "map_change", "data": result})
+
+
+@dispatcher.handler("use_exit", {"exit_type": (str, "exit")})
+async def handle_use_exit(ctx, args, db):
+    result = await GameEngine.use_exit(ctx.char_id, args["exit_type"], db)
+    await manager.send(ctx.char_id, {"type": "map_change", "data": result})
+
+
+@dispatcher.handler("return_city")
+async def handle_return_city(ctx, args, db):
+    result = await GameEngine.return_to_city(ctx.char_id, db)
+    await manager.send(ctx.char_id, {"type": "map_change", "data": result})
+
+
+@dispatcher.handler("get_map_state", uses_db=False)
+async def handle_get_map_state(ctx, args, db):
+    await manager.send(ctx.char_id, {"type": "map_state", "data": map_manager.get_state(ctx.char_id)})
+
+
+@dispatcher.handler("reset_map", uses_db=False)
+async def handle_reset_map(ctx, args, db):
+    map_manager.reset_map(ctx.char_id)
+    await manager.send(ctx.char_id, {"type": "map_state", "data": map_manager.get_state(ctx.char_id)})
+
+
+# ============ 战斗 ============
+@dispatcher.handler("attack", {"pos": list})
+async def handle_attack(ctx, args, db):
+    result = await GameEngine.attack_monster(ctx.char_id, tuple(args["pos"]), db)
+    await manager.send(ctx.char_id, {"type": "combat_result", "data": result})
+    if result.get("victory"):
+        await manager.send(ctx.char_id, map_manager.get_update(ctx.char_id))
+
+
+@dispatcher.handler("use_boss_item", {"slot": int})
+async def handle_use_boss_item(ctx, args, db):
+    try:
+        result = await GameEngine.use_boss_item(ctx.char_id, args["slot"], db)
+        await manager.send(ctx.char_id, {"type": "combat_result", "data": result})
+    except Exception as e:
+        traceback.print_exc()
+        await manager.send(ctx.char_id, {"type": "combat_result", "data": {"success": False, "error": str(e)}})
+
+
+@dispatcher.handler("attack_player", {"target_id": int})
+async def handle_attack_player(ctx, args, db):
+    char_id, target_id = ctx.char_id, args["target_id"]
+    result = await PVPSystem.attack_player(char_id, target_id, db)
+    await manager.send(char_id, {"type": "pvp_result", "data": result})
+    if result.get("success"):
+        await manager.send(target_id, {"type": "pvp_attacked", "data": result})
+        # 同地图的其他玩家收到PK结果
+        map_manager.publish(char_id, PVP, {
+            "attacker_id": char_id,
+            "defender_id": target_id,
+            "winner_id": result["winner_id"],
+            "loser_id": result["loser_id"],
+            "winner_name": result["winner_name"],
+            "loser_name": result["loser_name"]
+        }, exclude=(char_id, target_id))
+
+
+# ============ 背包与仓库 ============
+@dispatcher.handler("get_inventory", {"storage": (str, "inventory")})
+async def handle_get_inventory(ctx, args, db):
+    items = await GameEngine.get_inventory(ctx.char_id, args["storage"], db)
+    await manager.send(ctx.char_id, {"type": "inventory", "data": items})
+
+
+@dispatcher.handler("equip", {"slot": int, "target_slot": (str, None)})
+async def handle_equip(ctx, args, db):
+    result = await GameEngine.equip_item(ctx.char_id, args["slot"], db, args["target_slot"])
+    await manager.send(ctx.char_id, {"type": "equip_result", "data": result})
+
+
+@dispatcher.handler("get_equipment")
+async def handle_get_equipment(ctx, args, db):
+    result = await GameEngine.get_equipment(ctx.char_id, db)
+    await manager.send(ctx.char_id, {"type": "equipment", "data": result})
+
+
+@dispatcher.handler("recycle", {"slot": int})
+async def handle_recycle(ctx, args, db):
+    result = await GameEngine.recycle_item(ctx.char_id, args["slot"], db)
+    await manager.send(ctx.char_id, {"type": "recycle_result", "data": result})
+
+
+@dispatcher.handler("recycle_all", {"filter": (str, "all")})
+async def handle_recycle_all(ctx, args, db):
+    result = await GameEngine.recycle_all(ctx.char_id, db, args["filter"])
+    await manager.send(ctx.char_id, {"type": "recycle_result", "data": result})
+
+
+@dispatcher.handler("move_to_warehouse", {"slot": int})
+async def handle_move_to_warehouse(ctx, args, db):
+    result = await GameEngine.move_to_warehouse(ctx.char_id, args["slot"], db)
+    await manager.send(ctx.char_id, {"type": "move_result", "data": result})
+
+
+@dispatcher.handler("move_to_inventory", {"slot": int})
+async def handle_move_to_inventory(ctx, args, db):
+    result = await GameEngine.move_to_inventory(ctx.char_id, args["slot"], db)
+    await manager.send(ctx.char_id, {"type": "move_result", "data": result})
+
+
+@dispatcher.handler("organize_inventory", {"storage": (str, "inventory")})
+async def handle_organize_inventory(ctx, args, db):
+    storage = args["storage"]
+    result = await GameEngine.organize_inventory(ctx.char_id, storage, db)
+    await manager.send(ctx.char_id, {"type": "organize_result", "data": result})
+    # 整理后自动返回最新背包数据
+    items = await GameEngine.get_inventory(ctx.char_id, storage, db)
+    await manager.send(ctx.char_id, {"type": "inventory", "data": items})
+
+
+# ============ 技能 ============
+@dispatcher.handler("learn_skill", {"skill_id": str})
+async def handle_learn_skill(ctx, args, db):
+    result = await GameEngine.learn_skill(ctx.char_id, args["skill_id"], db)
+    await manager.send(ctx.char_id, {"type": "learn_result", "data": result})
+
+
+@dispatcher.handler("use_skillbook", {"slot": int})
+async def handle_use_skillbook(ctx, args, db):
+    result = await GameEngine.use_skillbook(ctx.char_id, args["slot"], db)
+    await manager.send(ctx.char_id, {"type": "skillbook_result", "data": result})
+
+
+@dispatcher.handler("use_skill", {"skill_id": str})
+async def handle_use_skill(ctx, args, db):
+    result = await GameEngine.use_skill(ctx.char_id, args["skill_id"], db)
+    await manager.send(ctx.char_id, {"type": "skill_used", "data": result})
+
+
+@dispatcher.handler("toggle_skill", {"skill_id": (str, None), "enabled": (bool, True)}, uses_db=False)
+async def handle_toggle_skill(ctx, args, db):
+    skill_id, enabled = args["skill_id"], args["enabled"]
+    disabled = GameEngine.disabled_skills.setdefault(ctx.char_id, [])
+    if enabled and skill_id in disabled:
+        disabled.remove(skill_id)
+    elif not enabled and skill_id not in disabled:
+        disabled.append(skill_id)
+    await manager.send(ctx.char_id, {"type": "skill_toggled", "data": {"skill_id": skill_id, "enabled": enabled}})
+
+
+@dispatcher.handler("get_disabled_skills", uses_db=False, concurrent=True)
+async def handle_get_disabled_skills(ctx, args, db):
+    disabled = GameEngine.disabled_skills.get(ctx.char_id, [])
+    await manager.send(ctx.char_id, {"type": "disabled_skills", "data": disabled})
+
+
+# ============ 符文 ============
+@dispatcher.handler("socket_rune", {"equipment_slot": (str, None), "rune_slot": (int, None)})
+async def handle_socket_rune(ctx, args, db):
+    # 镶嵌符文到装备
+    result = await GameEngine.socket_rune_to_equipment(ctx.char_id, args["equipment_slot"], args["rune_slot"], db)
+    await manager.send(ctx.char_id, {"type": "socket_rune_result", "data": result})
+    # 同时更新装备和背包
+    if result.get("success"):
+        equipment = await GameEngine.get_equipment(ctx.char_id, db)
+        await manager.send(ctx.char_id, {"type": "equipment", "data": equipment})
+        inventory = await GameEngine.get_inventory(ctx.char_id, "inventory", db)
+        await manager.send(ctx.char_id, {"type": "inventory", "data": inventory})
+
+
+@dispatcher.handler("socket_rune_inventory", {"target_slot": (int, None), "rune_slot": (int, None)})
+async def handle_socket_rune_inventory(ctx, args, db):
+    # 镶嵌符文到背包中的装备
+    result = await GameEngine.socket_rune_to_inventory_item(ctx.char_id, args["target_slot"], args["rune_slot"], db)
+    await manager.send(ctx.char_id, {"type": "socket_rune_result", "data": result})
+    # 更新背包
+    if result.get("success"):
+        inventory = await GameEngine.get_inventory(ctx.char_id, "inventory", db)
+        await manager.send(ctx.char_id, {"type": "inventory", "data": inventory})
+
+
+@dispatcher.handler("get_runewords", uses_db=False, concurrent=True)
+async def handle_get_runewords(ctx, args, db):
+    # 获取所有符文之语配方
+    await manager.send(ctx.char_id, {"type": "runewords", "data": DataLoader.get_all_runewords()})
+
+
+@dispatcher.handler("get_runes", uses_db=False, concurrent=True)
+async def handle_get_runes(ctx, args, db):
+    # 获取所有符文数据
+    await manager.send(ctx.char_id, {"type": "runes", "data": DataLoader.get_all_runes()})
+
+
+# ============ 社交 ============
+@dispatcher.handler("chat", {"message": (str, "")}, uses_db=False, concurrent=True)
+async def handle_chat(ctx, args, db):
+    await manager.broadcast({"type": "chat", "char_id": ctx.char_id, "name": ctx.name, "message": args["message"]})
+
+
+@dispatcher.handler("ping", uses_db=False, concurrent=True)
+async def handle_ping(ctx, args, db):
+    await manager.send(ctx.char_id, {"type": "pong"})
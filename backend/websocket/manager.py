@@ -1,25 +1,137 @@
 from fastapi import WebSocket
-from typing import Dict
-import json
+from typing import Dict, List, Optional
+import asyncio
+import time
+
+from backend.config import settings
+from backend.metrics import metrics
+from backend.websocket.codec import DEFAULT_CODEC, Payload
+
+# 慢连接处理策略
+POLICY_DROP_OLDEST = "drop_oldest"  # 丢弃最旧的待发消息
+POLICY_DISCONNECT = "disconnect"  # 断开连接
+
+
+class Connection:
+    """单个连接：有界发送队列 + 独立的写任务，慢客户端不阻塞其他发送方"""
+
+    __slots__ = ("websocket", "codec", "queue", "writer", "dropped", "closed")
+
+    def __init__(self, websocket: WebSocket, queue_size: int, codec=DEFAULT_CODEC):
+        self.websocket = websocket
+        # 连接时协商的消息编码
+        self.codec = codec
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.writer: Optional[asyncio.Task] = None
+        self.dropped = 0
+        self.closed = False
+
 
 class ConnectionManager:
-    def __init__(self):
-        self.connections: Dict[int, WebSocket] = {}  # user_id -> websocket
-    
-    async def connect(self, user_id: int, websocket: WebSocket):
+    def __init__(self, queue_size: int = 256, policy: str = POLICY_DROP_OLDEST):
+        self.connections: Dict[int, Connection] = {}  # user_id -> connection
+        self.queue_size = queue_size
+        self.policy = policy
+
+    async def connect(self, user_id: int, websocket: WebSocket, codec=DEFAULT_CODEC):
         await websocket.accept()
-        self.connections[user_id] = websocket
-    
-    def disconnect(self, user_id: int):
-        self.connections.pop(user_id, None)
-    
+        # 同一角色重复登录时停掉旧连接的写任务
+        self._close(user_id)
+        conn = Connection(websocket, self.queue_size, codec)
+        conn.writer = asyncio.create_task(self._writer(user_id, conn))
+        self.connections[user_id] = conn
+        metrics.gauge("ws.connections", len(self.connections))
+
+    def disconnect(self, user_id: int, websocket: WebSocket = None):
+        """断开连接；传入websocket时只在仍是该连接时移除（避免误删重连后的新连接）"""
+        conn = self.connections.get(user_id)
+        if conn is None or (websocket is not None and conn.websocket is not websocket):
+            return
+        self._close(user_id)
+        metrics.gauge("ws.connections", len(self.connections))
+
+    def _close(self, user_id: int):
+        conn = self.connections.pop(user_id, None)
+        if conn is None:
+            return
+        conn.closed = True
+        if conn.writer and conn.writer is not asyncio.current_task():
+            conn.writer.cancel()
+
     async def send(self, user_id: int, message: dict):
-        if ws := self.connections.get(user_id):
-            await ws.send_json(message)
-    
+        if conn := self.connections.get(user_id):
+            self._enqueue(user_id, conn, conn.codec.encode(message))
+
     async def broadcast(self, message: dict, exclude: int = None):
-        for uid, ws in self.connections.items():
+        """广播：每种编码只序列化一次，放入各连接的发送队列后立即返回"""
+        encoded: Dict[str, Payload] = {}
+        for uid, conn in list(self.connections.items()):
             if uid != exclude:
-                await ws.send_json(message)
+                self._enqueue(uid, conn, self._encode(conn, message, encoded))
+
+    def multicast(self, user_ids: List[int], message: dict):
+        """推送给一组连接（每种编码只序列化一次，不等待发送）"""
+        encoded: Dict[str, Payload] = {}
+        for uid in user_ids:
+            if conn := self.connections.get(uid):
+                self._enqueue(uid, conn, self._encode(conn, message, encoded))
+
+    @staticmethod
+    def _encode(conn: Connection, message: dict, encoded: Dict[str, Payload]) -> Payload:
+        payload = encoded.get(conn.codec.name)
+        if payload is None:
+            payload = encoded[conn.codec.name] = conn.codec.encode(message)
+        return payload
+
+    def _enqueue(self, user_id: int, conn: Connection, payload: Payload):
+        if conn.closed:
+            return
+        try:
+            conn.queue.put_nowait((payload, time.perf_counter()))
+        except asyncio.QueueFull:
+            metrics.incr("ws.slow_consumer")
+            if self.policy == POLICY_DISCONNECT:
+                print(f"[WARNING] 连接 {user_id} 发送队列已满，断开连接")
+                metrics.incr("ws.slow_disconnect")
+                self._close(user_id)
+                asyncio.create_task(self._close_socket(conn.websocket))
+                metrics.gauge("ws.connections", len(self.connections))
+                return
+            # 丢弃最旧的消息，保证最新状态能送达
+            conn.queue.get_nowait()
+            conn.queue.put_nowait((payload, time.perf_counter()))
+            conn.dropped += 1
+            metrics.incr("ws.dropped")
+
+    async def _writer(self, user_id: int, conn: Connection):
+        """按顺序发送队列中的消息"""
+        try:
+            while True:
+                payload, queued_at = await conn.queue.get()
+                if conn.codec.binary:
+                    await conn.websocket.send_bytes(payload)
+                else:
+                    await conn.websocket.send_text(payload)
+                metrics.observe("ws.send_delay", time.perf_counter() - queued_at)
+        except Exception:
+            # 发送失败说明连接已断开，等待读循环收到断开事件后清理
+            conn.closed = True
+
+    @staticmethod
+    async def _close_socket(websocket: WebSocket):
+        try:
+            await websocket.close(code=1008)
+        except Exception:
+            pass
+
+    def stats(self) -> dict:
+        """各连接的队列深度（供管理接口）"""
+        depths = [conn.queue.qsize() for conn in self.connections.values()]
+        return {
+            "connections": len(depths),
+            "queue_depth_max": max(depths, default=0),
+            "queue_depth_total": sum(depths),
+            "slow_consumers": sum(1 for d in depths if d >= self.queue_size),
+        }
 
-manager = ConnectionManager()
\ No newline at end of file
+manager = ConnectionManager(settings.WS_SEND_QUEUE_SIZE, settings.WS_SLOW_CONSUMER_POLICY)
@@ -0,0 +1,197 @@
+"""PVE战斗性能对比
+
+1. 完整逐回合模拟与碾压战斗快速结算的耗时和结果分布，胜率/回合数/消耗HP/消耗MP/掉落数偏差超出容差时以非0退出
+2. 100回合、6怪物的长战斗：每次攻击汇总装备特效 与 每场战斗预编译 EffectProfile
+
+用法: python bench_combat.py [每个场景的战斗次数，默认2000]
+"""
+import random
+import sys
+import time
+from collections import Counter
+from statistics import mean
+
+from backend.game.combat import CombatEngine
+from backend.game.combat_log import FAST_FORWARD
+from backend.game.data_loader import DataLoader
+from backend.game.effects import EMPTY_PROFILE, EffectCalculator, EffectProfile
+
+# 快速结算与完整模拟的允许偏差：胜率绝对差、均值相对差、两样本KS统计量
+WIN_RATE_TOLERANCE = 0.02
+MEAN_TOLERANCE = 0.05
+KS_TOLERANCE = 0.1
+CHECKED = (("rounds", "回合数"), ("hp_used", "消耗HP"), ("mp_used", "消耗MP"), ("drops", "掉落数"))
+
+
+class PotionStack:
+    """背包中药水的数据库记录（只需要数量）"""
+
+    def __init__(self, quantity: int):
+        self.quantity = quantity
+
+
+def make_player(char_class: str, level: int) -> dict:
+    return {
+        "id": 1, "name": "测试角色", "level": level, "char_class": char_class,
+        "hp": level * 20, "max_hp": level * 20, "mp": level * 6, "max_mp": level * 6,
+        "attack_min": level * 3, "attack_max": level * 4, "magic_min": level * 3, "magic_max": level * 4,
+        "defense_min": level, "defense_max": level * 2, "magic_defense_min": level // 2, "magic_defense_max": level,
+        "luck": 0
+    }
+
+
+def make_skills(char_class: str, skill_ids) -> list:
+    all_skills = DataLoader.get_all_skills(char_class)
+    return [dict(all_skills[sid], skill_id=sid, level=3) for sid in skill_ids if sid in all_skills]
+
+
+def make_inventory() -> list:
+    potions = [r.data for r in DataLoader.get_item_catalog().records.values()
+               if r.data.get("type") == "consumable" and r.data.get("effect", {}).get("heal_mp")]
+    return [{"info": potions[0], "db_item": PotionStack(5)}] if potions else []
+
+
+SCENARIOS = [
+    # (名称, 职业, 等级, 技能, 怪物, 怪物数量)
+    ("满级战士vs鸡", "warrior", 80, ["basic_sword", "attack_sword", "fire_sword"], "chicken", (3, 6)),
+    ("战士vs鸡", "warrior", 40, ["basic_sword", "attack_sword", "fire_sword"], "chicken", (1, 6)),
+    ("法师vs鹿", "mage", 40, ["fireball", "lightning"], "deer", (1, 4)),
+    ("道士vs狼", "taoist", 45, ["spirit_sword", "poison", "healing"], "wolf", (1, 3)),
+]
+
+
+def run(scenario, fights: int, fast: bool):
+    _, char_class, level, skill_ids, monster_id, (lo, hi) = scenario
+    rng = random.Random(7)
+    skills = make_skills(char_class, skill_ids)
+    stats = {"victory": 0, "fast": 0, "rounds": [], "hp_used": [], "mp_used": [], "exp": [], "gold": [],
+             "drops": [], "skills": Counter(), "potions": 0}
+    elapsed = 0.0
+    for i in range(fights):
+        monster = DataLoader.get_monster(monster_id)
+        monsters = [dict(monster, monster_id=monster_id, quality=rng.choice(["white", "green", "blue"]))
+                    for _ in range(rng.randint(lo, hi))]
+        inventory = make_inventory()
+        t0 = time.perf_counter()
+        result = CombatEngine.pve_combat(make_player(char_class, level), monsters, skills, [], DataLoader,
+                                         inventory, allow_fast_forward=fast, seed=i)
+        elapsed += time.perf_counter() - t0
+        stats["victory"] += result.victory
+        stats["fast"] += any(event[3] == FAST_FORWARD for event in result.log.events)
+        stats["rounds"].append(result.rounds)
+        stats["hp_used"].append(result.hp_used)
+        stats["mp_used"].append(result.mp_used)
+        stats["exp"].append(result.exp_gained)
+        stats["gold"].append(result.gold_gained)
+        stats["drops"].append(len(result.drops))
+        stats["skills"].update(result.skills_used)
+        stats["potions"] += sum(item.get("used_count", 0) for item in inventory)
+    return elapsed, stats
+
+
+def best_of(scenario, fights: int, fast: bool, repeat: int = 3):
+    """重复运行取最短耗时（结果由种子决定，每次相同），减少机器抖动的影响"""
+    runs = [run(scenario, fights, fast) for _ in range(repeat)]
+    return min(elapsed for elapsed, _ in runs), runs[0][1]
+
+
+def ks_statistic(a: list, b: list) -> float:
+    """两样本 Kolmogorov-Smirnov 统计量：经验分布函数的最大差距"""
+    a, b = sorted(a), sorted(b)
+    i = j = 0
+    gap = 0.0
+    for value in sorted(set(a) | set(b)):
+        while i < len(a) and a[i] <= value:
+            i += 1
+        while j < len(b) and b[j] <= value:
+            j += 1
+        gap = max(gap, abs(i / len(a) - j / len(b)))
+    return gap
+
+
+def divergence(full: dict, fast: dict, fights: int) -> list:
+    """快速结算结果分布偏离完整模拟超出容差的指标说明，空列表表示一致"""
+    failures = []
+    diff = abs(full["victory"] - fast["victory"]) / fights
+    if diff > WIN_RATE_TOLERANCE:
+        failures.append(f"胜率相差 {diff:.3f} > {WIN_RATE_TOLERANCE}")
+    for key, label in CHECKED:
+        base = mean(full[key])
+        rel = abs(mean(fast[key]) - base) / base if base else abs(mean(fast[key]))
+        if rel > MEAN_TOLERANCE:
+            failures.append(f"{label}均值相差 {rel * 100:.1f}% > {MEAN_TOLERANCE * 100:g}%")
+        ks = ks_statistic(full[key], fast[key])
+        if ks > KS_TOLERANCE:
+            failures.append(f"{label}分布KS统计量 {ks:.3f} > {KS_TOLERANCE}")
+    return failures
+
+
+def report(name: str, fights: int) -> list:
+    scenario = next(s for s in SCENARIOS if s[0] == name)
+    full_time, full = best_of(scenario, fights, False)
+    fast_time, fast = best_of(scenario, fights, True)
+    print(f"\n--- {name} ({fights}场) ---")
+    print(f"完整模拟 {full_time * 1e6 / fights:8.1f}us/场   快速结算 {fast_time * 1e6 / fights:8.1f}us/场   "
+          f"加速 {full_time / fast_time:.2f}x   快速结算占比 {fast['fast'] / fights * 100:.1f}%")
+    print(f"{'指标':<10}{'完整模拟':>12}{'快速结算':>12}")
+    print(f"{'胜率':<10}{full['victory'] / fights:>12.3f}{fast['victory'] / fights:>12.3f}")
+    for key, label in (("rounds", "回合数"), ("hp_used", "消耗HP"), ("mp_used", "消耗MP"),
+                       ("exp", "经验"), ("gold", "金币"), ("drops", "掉落数")):
+        print(f"{label:<10}{mean(full[key]):>12.2f}{mean(fast[key]):>12.2f}")
+    print(f"{'MP药水':<10}{full['potions'] / fights:>12.3f}{fast['potions'] / fights:>12.3f}")
+    for skill_id in sorted(set(full["skills"]) | set(fast["skills"])):
+        print(f"{skill_id:<10}{full['skills'][skill_id] / fights:>12.3f}{fast['skills'][skill_id] / fights:>12.3f}")
+    failures = divergence(full, fast, fights)
+    for failure in failures:
+        print(f"[FAIL] {name}: {failure}")
+    return failures
+
+
+def effect_equipment() -> list:
+    """带特效的装备（尽量覆盖暴击、压碎、吸血、击回等分支）"""
+    items = [r.data for r in DataLoader.get_item_catalog().records.values() if r.data.get("effects")]
+    items.sort(key=lambda info: -len(info["effects"]))
+    return [{"info": info} for info in items[:8]]
+
+
+def long_fight(rounds: int = 20):
+    """6个怪物打满100回合：怪物HP极高、伤害极低，战斗只能以回合上限结束"""
+    player = dict(make_player("warrior", 30), max_hp=10 ** 7, hp=10 ** 7, defense_min=10 ** 4, defense_max=10 ** 4)
+    monster = dict(DataLoader.get_monster("woma_warrior"), monster_id="woma_warrior", quality="white", hp=10 ** 7)
+    monsters = [dict(monster) for _ in range(6)]
+    equipment = effect_equipment()
+    target = CombatEngine.init_monsters(monsters)[0]
+    profile = EffectProfile.from_equipment(equipment)
+    hits = 20000
+    
+    print(f"\n--- 100回合 x 6怪物 长战斗（装备 {len(equipment)} 件）---")
+    rng = random.Random(1)
+    t0 = time.perf_counter()
+    for _ in range(hits):
+        EffectCalculator.process_attack(player, target, 100, equipment, [], rng=rng)
+    per_hit_old = (time.perf_counter() - t0) / hits * 1e6
+    rng = random.Random(1)
+    t0 = time.perf_counter()
+    for _ in range(hits):
+        EffectCalculator.process_attack(player, target, 100, attacker_profile=profile, defender_profile=EMPTY_PROFILE,
+                                        rng=rng)
+    per_hit_new = (time.perf_counter() - t0) / hits * 1e6
+    print(f"process_attack  每次汇总装备 {per_hit_old:6.2f}us/次   预编译特效 {per_hit_new:6.2f}us/次   "
+          f"加速 {per_hit_old / per_hit_new:.2f}x")
+    
+    t0 = time.perf_counter()
+    for seed in range(rounds):
+        result = CombatEngine.pve_combat(player, monsters, [], [], DataLoader, equipment=equipment,
+                                         allow_fast_forward=False, seed=seed)
+    per_fight = (time.perf_counter() - t0) / rounds * 1e3
+    print(f"完整战斗 {per_fight:.2f}ms/场（{result.rounds}回合，{len(result.log.events)}个事件）")
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    print("=== PVE战斗快速结算对比 ===")
+    failures = [failure for scenario in SCENARIOS for failure in report(scenario[0], count)]
+    long_fight()
+    if failures:
+        print(f"\n快速结算结果分布偏差超出容差：{len(failures)} 项")
+        sys.exit(1)
@@ -0,0 +1,69 @@
+"""地图性能对比
+
+1. 进入无人地图时同步生成实例 与 从预生成池取用
+2. 怪物复活：堆调度每个tick只处理到期条目，开销与地图数量无关
+
+用法: python bench_maps.py [切换次数，默认500]
+"""
+import sys
+import time
+from statistics import mean
+
+from backend.game.map_manager import MapManager, map_manager
+from backend.game.spawner import MonsterSpawner
+
+
+def transitions(manager: MapManager, count: int, refill: bool) -> list:
+    """单个玩家在两张地图之间来回切换，返回每次 enter_map 的耗时（毫秒）"""
+    maps = ["woma_forest", "zombie_cave_1"]
+    costs = []
+    for i in range(count):
+        t0 = time.perf_counter()
+        manager.enter_map(1, maps[i % 2])
+        costs.append((time.perf_counter() - t0) * 1e3)
+        if refill:
+            # 模拟后台任务在两次请求之间补充
+            manager.pool.fill()
+    return costs
+
+
+def report(label: str, costs: list):
+    ordered = sorted(costs)
+    print(f"{label:<10} 平均 {mean(costs):6.3f}ms   p50 {ordered[len(ordered) // 2]:6.3f}ms   "
+          f"p99 {ordered[int(len(ordered) * 0.99)]:6.3f}ms   最大 {ordered[-1]:6.3f}ms")
+
+
+def respawn(instances: int = 50, kills: int = 5):
+    """instances 个地图实例各击杀 kills 只怪物后，对比空闲tick与到期tick的耗时"""
+    spawner = MonsterSpawner(delay=60)
+    maps = [map_id for map_id, config in map_manager.map_configs.items() if config.get("monsters")]
+    for i in range(instances):
+        instance = map_manager.create_instance(maps[i % len(maps)])
+        for pos in list(instance.monsters)[:kills]:
+            instance.remove_monster(pos)
+            spawner.schedule(instance, now=0)
+    cells = sum(len(instance.spawn_cells.cells) for instance in map_manager.instances.values())
+    print(f"\n=== 怪物复活（{instances}个实例，共 {cells} 个刷新点，{len(spawner.queue)} 个待复活）===")
+    t0 = time.perf_counter()
+    for _ in range(1000):
+        spawner.tick(now=30)
+    idle = (time.perf_counter() - t0) / 1000 * 1e6
+    t0 = time.perf_counter()
+    spawned = spawner.tick(now=60)
+    due = (time.perf_counter() - t0) * 1e3
+    print(f"无到期tick {idle:.2f}us   到期tick {due:.3f}ms（刷出 {spawned} 只，{due * 1e3 / max(spawned, 1):.1f}us/只）")
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    print(f"=== enter_map 耗时（{count}次切换）===")
+    manager = MapManager()
+    manager.pool.size = 0
+    report("同步生成", transitions(manager, count, False))
+
+    manager = MapManager()
+    manager.pool.size = 2
+    manager.pool.fill()
+    report("预生成池", transitions(manager, count, True))
+    print(f"池命中 {manager.pool.hits}  未命中 {manager.pool.misses}")
+    respawn()
@@ -0,0 +1,108 @@
+"""寻路性能对比 - 旧版 min() 选点 A* 与堆优化 NavGrid A*
+
+用法: python bench_pathfinding.py
+"""
+import random
+import time
+from typing import List, Tuple
+
+from backend.game.maze import MazeGenerator, NavGrid
+
+
+def legacy_find_path(maze: List[List[int]], start: Tuple[int, int], end: Tuple[int, int]) -> List[Tuple[int, int]]:
+    """旧版 Pathfinder.find_path（原样保留用于对比）"""
+    if maze[start[1]][start[0]] == 1 or maze[end[1]][end[0]] == 1:
+        return []
+
+    def heuristic(a, b):
+        return abs(a[0] - b[0]) + abs(a[1] - b[1])
+
+    open_set = {start}
+    came_from = {}
+    g_score = {start: 0}
+    f_score = {start: heuristic(start, end)}
+
+    while open_set:
+        current = min(open_set, key=lambda p: f_score.get(p, float('inf')))
+
+        if current == end:
+            path = [current]
+            while current in came_from:
+                current = came_from[current]
+                path.append(current)
+            return path[::-1]
+
+        open_set.remove(current)
+
+        for dx, dy in [(0, 1), (0, -1), (1, 0), (-1, 0)]:
+            neighbor = (current[0] + dx, current[1] + dy)
+            if not (0 <= neighbor[0] < len(maze[0]) and 0 <= neighbor[1] < len(maze)):
+                continue
+            if maze[neighbor[1]][neighbor[0]] == 1:
+                continue
+            tentative_g = g_score[current] + 1
+            if tentative_g < g_score.get(neighbor, float('inf')):
+                came_from[neighbor] = current
+                g_score[neighbor] = tentative_g
+                f_score[neighbor] = tentative_g + heuristic(neighbor, end)
+                open_set.add(neighbor)
+
+    return []
+
+
+def random_pairs(maze: List[List[int]], count: int, rng: random.Random) -> List[Tuple[Tuple[int, int], Tuple[int, int]]]:
+    """随机选取可通行的起点/终点对"""
+    cells = [(x, y) for y, row in enumerate(maze) for x, v in enumerate(row) if v == 0]
+    return [(rng.choice(cells), rng.choice(cells)) for _ in range(count)]
+
+
+def bench(size: int, queries: int, legacy_queries: int, seed: int = 42):
+    random.seed(seed)
+    maze = MazeGenerator(size, size).generate()
+    rng = random.Random(seed)
+    pairs = random_pairs(maze, queries, rng)
+
+    t0 = time.perf_counter()
+    grid = NavGrid.from_maze(maze)
+    build_ms = (time.perf_counter() - t0) * 1000
+
+    new_paths = []
+    new_times = []
+    for s, e in pairs:
+        t0 = time.perf_counter()
+        new_paths.append(grid.find_path(s, e))
+        new_times.append(time.perf_counter() - t0)
+
+    legacy_pairs = pairs[:legacy_queries]
+    t0 = time.perf_counter()
+    old_paths = [legacy_find_path(maze, s, e) for s, e in legacy_pairs]
+    old_us = (time.perf_counter() - t0) / len(legacy_pairs) * 1e6
+    new_us = sum(new_times[:legacy_queries]) / len(legacy_pairs) * 1e6
+
+    # 两种实现都应返回最短路径（路径本身可能因平手选择而不同）
+    for old, new in zip(old_paths, new_paths):
+        assert len(old) == len(new), (len(old), len(new))
+
+    # 可达查询与不可达查询（需遍历整个连通区域）分开统计
+    reach = [t for t, p in zip(new_times, new_paths) if p]
+    miss = [t for t, p in zip(new_times, new_paths) if not p]
+    reach_us = sum(reach) / len(reach) * 1e6 if reach else 0
+    miss_us = sum(miss) / len(miss) * 1e6 if miss else 0
+
+    # 连通分量查表：不可达目标无需寻路即可拒绝
+    t0 = time.perf_counter()
+    for s, e in pairs:
+        grid.connected(s, e)
+    check_us = (time.perf_counter() - t0) / len(pairs) * 1e6
+
+    print(f"{size:>4}x{size:<4} 建网格 {build_ms:6.2f}ms  旧版 {old_us:9.1f}us/次  新版 {new_us:7.1f}us/次  "
+          f"加速 {old_us / new_us:5.1f}x  | 新版可达 {reach_us:7.1f}us ({len(reach)}次)  "
+          f"不可达 {miss_us:8.1f}us ({len(miss)}次)  连通查表 {check_us:.2f}us")
+
+
+if __name__ == "__main__":
+    print("=== 寻路性能对比 ===")
+    bench(24, 2000, 2000)
+    bench(48, 1000, 300)
+    bench(96, 500, 50)
+    bench(192, 200, 10)
@@ -0,0 +1,89 @@
+"""WebSocket消息编码对比 - json / compact / msgpack 的消息大小和编码耗时
+
+用法: python bench_wire.py（未安装msgpack时只对比json和compact）
+"""
+import random
+import time
+
+from backend.game.combat import CombatEngine
+from backend.game.data_loader import DataLoader
+from backend.game.map_manager import MapInstance, map_manager
+from backend.websocket.codec import CODECS
+
+
+def map_state_message() -> dict:
+    """进入地图后的完整地图状态"""
+    config = map_manager.map_configs["woma_forest"]
+    instance = MapInstance("woma_forest", config)
+    instance.enter(1)
+    return {"type": "map_state", "data": instance.get_state(1)}
+
+
+def combat_result_message() -> dict:
+    """一场多怪物战斗的结果（日志是主要内容）"""
+    player = {
+        "id": 1, "name": "测试战士", "level": 30, "char_class": "warrior",
+        "hp": 800, "max_hp": 800, "mp": 200, "max_mp": 200,
+        "attack_min": 60, "attack_max": 90, "magic_min": 0, "magic_max": 0,
+        "defense_min": 20, "defense_max": 30, "magic_defense_min": 10, "magic_defense_max": 15, "luck": 2
+    }
+    monsters = []
+    for quality in ("white", "green", "blue"):
+        monsters.append(dict(DataLoader.get_monster("woma_warrior"), monster_id="woma_warrior", quality=quality))
+    result = CombatEngine.pve_combat(player, monsters, [], [], DataLoader, seed=42)
+    return {"type": "combat_result", "data": {
+        "success": True,
+        "victory": result.victory,
+        "logs": result.log,
+        "exp_gained": result.exp_gained,
+        "gold_gained": result.gold_gained,
+        "drops": result.drops,
+        "level_up": False,
+        "character": {"id": 1, "name": "测试战士", "level": 30, "exp": 12345, "gold": 67890,
+                      "hp": player["hp"], "max_hp": 800, "mp": 200, "max_mp": 200}
+    }}
+
+
+def inventory_message(count: int = 200) -> dict:
+    """装满的背包"""
+    records = list(DataLoader.get_item_catalog().records.values())
+    rng = random.Random(42)
+    items = []
+    for slot in range(count):
+        record = rng.choice(records)
+        items.append({
+            "slot": slot,
+            "item_id": record.item_id,
+            "quality": rng.choice(["white", "green", "blue", "purple", "orange"]),
+            "quantity": 1,
+            "random_attrs": None,
+            "sockets": 0,
+            "socketed_runes": [],
+            "runeword_id": None,
+            "socket_display": "",
+            "info": record.data
+        })
+    return {"type": "inventory", "data": {"storage_type": "inventory", "items": items}}
+
+
+def bench(name: str, message: dict, rounds: int):
+    baseline = None
+    for codec in CODECS.values():
+        payload = codec.encode(message)
+        size = len(payload.encode("utf-8")) if isinstance(payload, str) else len(payload)
+        baseline = baseline or size
+        t0 = time.perf_counter()
+        for _ in range(rounds):
+            codec.encode(message)
+        us = (time.perf_counter() - t0) / rounds * 1e6
+        print(f"{name:<14} {codec.name:<8} {size:>8} 字节 ({size / baseline * 100:5.1f}%)  编码 {us:8.1f}us/次")
+
+
+if __name__ == "__main__":
+    random.seed(42)
+    print("=== WebSocket消息编码对比 ===")
+    if "msgpack" not in CODECS:
+        print("[WARNING] 未安装msgpack，跳过msgpack编码")
+    bench("map_state", map_state_message(), 2000)
+    bench("combat_result", combat_result_message(), 2000)
+    bench("inventory", inventory_message(), 200)
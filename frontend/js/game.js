@@ -82,7 +82,7 @@ function updateCharInfo() {
 // WebSocket连接
 function connectWebSocket(charId) {
     const protocol = location.protocol === 'https:' ? 'wss:' : 'ws:';
-    ws = new WebSocket(`${protocol}//${location.host}/ws?token=${token}&char_id=${charId}`);
+    ws = new WebSocket(`${protocol}//${location.host}/ws?token=${token}&char_id=${charId}&encoding=compact`);
     
     ws.onmessage = e => {
         const msg = JSON.parse(e.data);
@@ -95,19 +95,30 @@ function handleMessage(msg) {
     switch(msg.type) {
         case 'enter_game':
             currentChar = msg.data.character;
-            mapState = msg.data.map;
+            mapState = loadMapState(msg.data.map);
             updateCharInfo();
             updateCharStats();
             renderMap();
             addBattleLog('欢迎来到传奇世界！');
             break;
         case 'map_state':
-            mapState = msg.data;
+            mapState = loadMapState(msg.data);
             renderMap();
             break;
+        case 'map_delta':
+            if (applyMapDelta(msg.data)) {
+                renderMap();
+            } else {
+                // 序号不连续或地图不一致，请求完整状态重新同步
+                ws.send(JSON.stringify({ type: 'get_map_state' }));
+            }
+            break;
+        case 'map_event':
+            if (applyMapEvent(msg.data)) renderMap();
+            break;
         case 'map_change':
             if (msg.data.state) {
-                mapState = msg.data.state;
+                mapState = loadMapState(msg.data.state);
                 renderMap();
                 output(`进入地图: ${mapState.map_id || msg.data.map_id}`);
             } else if (msg.data.error) {
@@ -164,6 +175,9 @@ function handleMessage(msg) {
         case 'runes':
             runesData = msg.data;
             break;
+        case 'error':
+            output(`[错误] ${msg.data.error}`);
+            break;
         case 'socket_rune_result':
             if (msg.data.success) {
                 output(`[符文] ${msg.data.message}`);
@@ -177,6 +191,98 @@ function handleMessage(msg) {
     }
 }
 
+// 迷雾位图：服务端以base64发送，第 y*24+x 位表示格子是否已揭示
+function decodeFog(b64) {
+    const bin = atob(b64 || '');
+    const bits = new Uint8Array(bin.length);
+    for (let i = 0; i < bin.length; i++) bits[i] = bin.charCodeAt(i);
+    return bits;
+}
+
+// 紧凑编码下迷宫为位图（布局同迷雾，1为墙），还原为二维数组
+function decodeMaze(b64, width, height) {
+    const bits = decodeFog(b64);
+    const maze = [];
+    for (let y = 0; y < height; y++) {
+        const row = new Array(width);
+        for (let x = 0; x < width; x++) {
+            const i = y * width + x;
+            row[x] = (bits[i >> 3] >> (i & 7)) & 1;
+        }
+        maze.push(row);
+    }
+    return maze;
+}
+
+function loadMapState(state) {
+    if (!state) return state;
+    if (typeof state.maze === 'string') state.maze = decodeMaze(state.maze, state.maze_width, state.maze_height);
+    state.fog = decodeFog(state.revealed);
+    return state;
+}
+
+// 应用地图增量，基准序号不匹配时返回false
+function applyMapDelta(delta) {
+    if (!mapState || !delta || delta.map_id !== mapState.map_id || delta.base_seq !== mapState.seq) {
+        return false;
+    }
+    if (delta.reveal) {
+        const added = decodeFog(delta.reveal);
+        for (let i = 0; i < added.length; i++) mapState.fog[i] |= added[i];
+    }
+    mapState.monsters = mapState.monsters || {};
+    for (const key of delta.monsters_remove || []) delete mapState.monsters[key];
+    Object.assign(mapState.monsters, delta.monsters_add || {});
+    mapState.players = mapState.players || {};
+    for (const cid of delta.players_remove || []) delete mapState.players[cid];
+    Object.assign(mapState.players, delta.players_move || {});
+    mapState.entrances = Object.assign(mapState.entrances || {}, delta.entrances_add || {});
+    if ('position' in delta) mapState.position = delta.position;
+    if ('exit_distance' in delta) mapState.exit_distance = delta.exit_distance;
+    mapState.seq = delta.seq;
+    return true;
+}
+
+// 应用同地图其他玩家/怪物的事件推送，地图状态有变化时返回true
+function applyMapEvent(ev) {
+    if (!mapState || !ev || ev.map_id !== mapState.map_id) return false;
+    mapState.monsters = mapState.monsters || {};
+    mapState.players = mapState.players || {};
+    switch (ev.event) {
+        case 'player_enter':
+        case 'player_move':
+            mapState.players[ev.char_id] = ev.position;
+            return true;
+        case 'player_leave':
+            delete mapState.players[ev.char_id];
+            return true;
+        case 'monster_killed':
+            delete mapState.monsters[ev.position];
+            return true;
+        case 'monster_spawn':
+            Object.assign(mapState.monsters, ev.monsters || {});
+            return true;
+        case 'pvp':
+            addBattleLog(`[PK] ${ev.winner_name} 击败了 ${ev.loser_name}`);
+            return false;
+    }
+    return false;
+}
+
+function isRevealed(x, y) {
+    if (x < 0 || x >= 24 || y < 0 || y >= 24) return false;
+    const i = y * 24 + x;
+    return (mapState.fog[i >> 3] >> (i & 7)) & 1;
+}
+
+function countRevealed() {
+    let count = 0;
+    for (let b of mapState.fog) {
+        while (b) { b &= b - 1; count++; }
+    }
+    return count;
+}
+
 // 地图渲染
 const CELL_SIZE = 20;
 const canvas = $('map-canvas');
@@ -201,14 +307,12 @@ function renderMap() {
     offscreenCtx.fillStyle = '#000';
     offscreenCtx.fillRect(0, 0, 480, 480);
     
-    const revealed = new Set(mapState.revealed.map(p => `${p[0]},${p[1]}`));
-    
     for (let y = 0; y < 24; y++) {
         for (let x = 0; x < 24; x++) {
             const px = x * CELL_SIZE;
             const py = y * CELL_SIZE;
             
-            if (!revealed.has(`${x},${y}`)) {
+            if (!isRevealed(x, y)) {
                 offscreenCtx.fillStyle = '#222';
                 offscreenCtx.fillRect(px, py, CELL_SIZE - 1, CELL_SIZE - 1);
                 continue;
@@ -232,7 +336,7 @@ function renderMap() {
     if (mapState.entrances) {
         for (const [id, entrance] of Object.entries(mapState.entrances)) {
             const [x, y] = entrance.position;
-            if (revealed.has(`${x},${y}`)) {
+            if (isRevealed(x, y)) {
                 offscreenCtx.fillStyle = '#ff0';
                 offscreenCtx.fillRect(x * CELL_SIZE + 5, y * CELL_SIZE + 5, 10, 10);
             }
@@ -243,7 +347,7 @@ function renderMap() {
     if (mapState.npcs) {
         for (const npc of mapState.npcs) {
             const [x, y] = npc.position;
-            if (revealed.has(`${x},${y}`)) {
+            if (isRevealed(x, y)) {
                 offscreenCtx.fillStyle = '#00f';
                 offscreenCtx.beginPath();
                 offscreenCtx.arc(x * CELL_SIZE + 10, y * CELL_SIZE + 10, 6, 0, Math.PI * 2);
@@ -322,7 +426,7 @@ function updateMapInfo() {
     const el = $('map-info');
     if (!el) return;
     const monsterCount = Object.keys(mapState.monsters || {}).length;
-    const explorePercent = Math.floor((mapState.revealed.length / (24 * 24)) * 100);
+    const explorePercent = Math.floor((countRevealed() / (24 * 24)) * 100);
     el.innerHTML = `
         <div>当前地图: ${mapState.map_name || mapState.map_id}</div>
         <div>怪物数量: ${monsterCount}</div>
@@ -369,8 +473,7 @@ canvas.onclick = e => {
     const y = Math.floor((e.clientY - rect.top) * scaleY / CELL_SIZE);
     
     // 检查是否在迷雾中（未揭示的区域）
-    const revealed = new Set(mapState.revealed.map(p => `${p[0]},${p[1]}`));
-    if (!revealed.has(`${x},${y}`)) {
+    if (!isRevealed(x, y)) {
         output('[系统] 该区域尚未探索，无法前往');
         return;
     }
@@ -400,7 +503,7 @@ canvas.onclick = e => {
     }
     
     // 检查是否点击NPC（只在已揭示区域）- 玩家需要在NPC附近才能对话
-    if (mapState.npcs && revealed.has(`${x},${y}`)) {
+    if (mapState.npcs && isRevealed(x, y)) {
         for (const npc of mapState.npcs) {
             if (npc.position[0] === x && npc.position[1] === y) {
                 // 检查玩家是否在NPC附近（相邻）
@@ -503,6 +606,73 @@ function formatSetBonus(bonus) {
     return parts.join(' ');
 }
 
+// 战斗事件渲染：紧凑编码下服务端发送事件列表 [回合, 行动方, 目标, 事件码, 数值, 附加数据]，
+// 与 backend/game/combat_log.py 的 render() 生成相同格式的日志
+const COMBAT_PLAYER = -1, COMBAT_SUMMON = -2;
+const EFFECT_TAG_FORMATS = {
+    miss: () => '攻击未命中!', dodge: () => '攻击被闪避!',
+    crit: v => `暴击x${v.toFixed(1)}`, crush: v => `压碎x${v.toFixed(1)}`,
+    extra_phys: v => `附伤+${v}`, extra_magic: v => `魔伤+${v}`, block: () => '攻击被格挡!',
+    lifesteal: v => `吸血+${v}HP`, hp_on_hit: v => `击回+${v}HP`, mp_on_hit: v => `击回+${v}MP`,
+    reflect: v => `反弹${v}`, stun: () => '眩晕', poison: (d, r) => `毒伤${d}x${r}回合`, double: () => '双击',
+    guard: () => '格挡', reduction: v => `减伤${v}%`, shield: v => `魔法盾减伤${v}%`
+};
+
+function renderCombatLog(combatLog) {
+    const [playerName, maxHp, maxMp] = combatLog.player;
+    const monsters = combatLog.monsters;
+    const names = {[COMBAT_PLAYER]: '你'};
+    monsters.forEach(([name], idx) => { names[idx] = name; });
+    const tags = list => list ? ` [${list.map(([k, ...v]) => EFFECT_TAG_FORMATS[k](...v)).join('/')}]` : '';
+    const hpList = hps => monsters.map(([name, quality, mHp], idx) => `#${idx}${name}[${quality}]:${Math.max(0, hps[idx])}/${mHp}`).join('|');
+    const flat = ['hp_on_hit', 'mp_on_hit', 'extra_phys', 'extra_magic', 'poison_damage', 'poison_rounds'];
+
+    return combatLog.events.map(([round, actor, target, code, amount, extra]) => {
+        switch (code) {
+            case 1: return '⚔️ 装备特效: ' + extra.map(([k, v]) =>
+                flat.includes(k) ? `${EFFECT_NAMES[k] || k}+${Math.trunc(v)}` : `${EFFECT_NAMES[k] || k}:${Math.trunc(v * 100)}%`).join(', ');
+            case 2: return `⚔️ 战斗开始: ${playerName} vs ` + monsters.map(([name, quality]) => `${name}[${quality}]`).join(', ');
+            case 3: return `COMBAT_INIT|${amount}/${maxHp}|${extra[0]}/${maxMp}|${hpList(extra[1])}`;
+            case 4: names[COMBAT_SUMMON] = extra; return `🐾 ${extra} 参战 (HP:${amount})`;
+            case 5: return `--- 第${round}回合 ---`;
+            case 6: return target === COMBAT_PLAYER ? `🧪 中毒! 受到 ${amount} 点毒伤` : `🧪 ${names[target]} 中毒! 受到 ${amount} 点毒伤`;
+            case 7: return `💀 ${names[target]} 被毒死!`;
+            case 8: return `🔥 ${names[target]} 灼烧! 受到 ${amount} 点火焰伤害`;
+            case 9: return `💀 ${names[target]} 被烧死!`;
+            case 10: return `✨ 圣言术发动! ${names[target]} 被神圣之力瞬间消灭!`;
+            case 11: return actor === COMBAT_PLAYER ? '😵 你被眩晕，无法行动!' : `😵 ${names[actor]} 被眩晕，无法行动!`;
+            case 12: return `🧪 自动使用 ${extra} 恢复 ${amount} HP`;
+            case 13: return `🧪 自动使用 ${extra} 恢复 ${amount} MP`;
+            case 14: names[COMBAT_SUMMON] = extra[0]; return `召唤: ${extra[0]} (HP:${amount} ATK:${extra[1]})`;
+            case 15: return `使用技能: ${extra[0]} Lv.${extra[1]} (消耗${amount}MP)`;
+            case 16: return `🧪 对${names[target]}施加毒素! 每回合${amount}点毒伤，持续${extra}回合`;
+            case 17: return `🔥 对${target === null ? '所有目标' : names[target]}施加灼烧! 每回合${amount}点火焰伤害，持续${extra}回合`;
+            case 18: return `恢复 ${amount} 点生命值`;
+            case 19: return `👻 进入隐身状态，持续${amount}回合`;
+            case 20: return `🛡️ 魔法盾激活! 持续${amount}回合，减伤${extra}%`;
+            case 21: return `${names[actor]}对${names[target]}造成 ${amount} 点伤害${tags(extra)}`;
+            case 22: return `你对${names[target]}造成 ${amount} 点技能伤害${tags(extra)}`;
+            case 23: return `💀 ${names[target]} 被击败!`;
+            case 24: return '⚡ 触发双次攻击!';
+            case 25: return '攻击未命中!';
+            case 26: return `对${names[target]}的攻击未命中!`;
+            case 27: return `🌀 ${names[target]}闪避了攻击!`;
+            case 28: return `💥 溅射对${names[target]}造成 ${amount} 点伤害`;
+            case 29: return `💀 ${names[COMBAT_SUMMON]} 死亡!`;
+            case 30: return `👻 ${names[actor]}无法发现隐身的你!`;
+            case 31: return '👻 隐身状态结束';
+            case 32: return '🛡️ 魔法盾效果结束';
+            case 33: return `COMBAT_STATUS|${amount}/${maxHp}|${extra[0]}/${maxMp}|${hpList(extra[1])}` +
+                (extra[2] ? `|SUMMON:${extra[2][0]}:${extra[2][1]}/${extra[2][2]}` : '');
+            case 34: return `🎉 胜利! 获得 ${amount} 经验, ${extra} 金币`;
+            case 35: return `💎 获得物品: ${extra}`;
+            case 36: return '💀 战斗失败...';
+            case 37: return `⚡ 碾压战斗: ${amount}回合结束 (消耗 ${extra[0]} HP / ${extra[1]} MP)`;
+            default: return '';
+        }
+    });
+}
+
 // 战斗显示
 function showCombat(data) {
     // 处理错误情况
@@ -510,6 +680,7 @@ function showCombat(data) {
         output(`[战斗错误] ${data.error}`);
         return;
     }
+    if (data.logs && !Array.isArray(data.logs)) data.logs = renderCombatLog(data.logs);
     if (!data.logs || data.logs.length === 0) {
         output('[战斗错误] 无战斗数据');
         return;